@@ -1,32 +1,71 @@
-import face_recognition
-from flask import Flask, request, jsonify, send_file
+import os
+
+if __name__ == '__main__':
+    # Pool workers are spawned, and spawn re-imports the main script in every
+    # worker: run as server.py, whose module body is empty outside __main__
+    import runpy
+    runpy.run_module('server', run_name='__main__', alter_sys=True)
+    raise SystemExit
+
+# Several server processes share sessions and Socket.IO messages through Redis.
+# Its client must yield to the gevent hub while waiting instead of blocking it,
+# and Flask-SocketIO refuses a message queue under gevent otherwise.
+MESSAGE_QUEUE_URL = os.environ.get('VERIFID_MESSAGE_QUEUE_URL')
+SESSION_STORE_URL = os.environ.get('VERIFID_SESSION_STORE_URL')
+if MESSAGE_QUEUE_URL or (SESSION_STORE_URL and not SESSION_STORE_URL.startswith('memory://')):
+    from gevent import monkey
+    monkey.patch_socket()
+
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
-import os
 import time
 import uuid
 import json
-import cv2
 import numpy as np
+import hashlib
+import io
 import tempfile
-from werkzeug.utils import secure_filename
+import itertools
+import zipfile
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # Assuming ocr_utils.py is in the same directory or Python path
-from ocr_utils import extract_text_from_id, save_face_from_id_card
+from ocr_utils import (
+    prepare_id_upload,
+    process_id_card_upload,
+    process_id_card_bytes,
+    rejected_upload_result,
+    id_card_cache_entry,
+    id_card_result_from_cache,
+    persisted_cache_entry,
+    restore_id_card_faces
+)
+from id_batch import ArchiveTooLargeError, iter_card_images, is_card_image, to_ndjson, validate_user_data
 
 # Updated import statement to remove face_blur and validate_face_consistency
 from liveness_service import (
     get_reference_face_encoding,
-    process_liveness_frame,
-    verify_face_match,
     generate_random_liveness_commands,
-    base64_to_image
+    locate_face_in_frame,
+    analyze_liveness_frame
 )
-
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from encoding_store import get_encoding_store
+from face_assets import FACE_INFO_DIR, get_face_asset_store, import_legacy_faces
+from face_matching import EncodingRingBuffer, ENCODING_SAMPLE_INTERVAL
+from frame_mailbox import FrameMailbox
+from session_store import create_session_store
+from rate_control import rate_settings, start_rate_control, update_rate_control
+from face_index import DuplicateFaceIndex
+from result_cache import ResultCache, content_hash
+from metrics import span, render_prometheus, LIVENESS_FRAMES, LIVENESS_FRAMES_DROPPED, ID_UPLOADS
+from worker_pool import pool, PoolBusyError, wait_for
+from log_config import configure_logging, sampled, SOCKETIO_LOGGING
+
+
+# Queued, sampled, redacting log output; see log_config
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -42,62 +81,129 @@ socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     async_mode='gevent',
-    logger=True,
-    engineio_logger=True,
+    logger=SOCKETIO_LOGGING,
+    engineio_logger=SOCKETIO_LOGGING,
     ping_timeout=60,
     ping_interval=25,
     max_http_buffer_size=50 * 1024 * 1024,  # Increase buffer size for large frames
     always_connect=True,  # Always allow connections
-    transports=['websocket', 'polling']  # Allow both WebSocket and polling
+    transports=['websocket', 'polling'],  # Allow both WebSocket and polling
+    # Lets any server process emit to clients connected to another one
+    message_queue=MESSAGE_QUEUE_URL,
+    channel='verifid-socketio'
 )
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Store active verification sessions
-verification_sessions = {}
+# Store active verification sessions. In-process by default; point
+# VERIFID_SESSION_STORE_URL at a Redis-protocol server to share them between workers.
+session_store = create_session_store(SESSION_STORE_URL)
+# Latest unprocessed liveness frame per session
+frame_mailbox = FrameMailbox()
+# 1:N search over every enrolled face, built lazily from the encoding store
+duplicate_index = DuplicateFaceIndex()
+index_build_executor = ThreadPoolExecutor(max_workers=1)
+# Encoding store reads; the first one in a process parses the whole index journal, so they stay off the hub
+store_executor = ThreadPoolExecutor(max_workers=2)
+# /verify/id results by upload content hash, so resubmitting the same photo skips OCR and face work
+id_result_cache = ResultCache()
+DUPLICATE_INDEX_REFRESH_INTERVAL = 60  # Seconds before enrolments made by other processes are picked up
+PORT = int(os.environ.get('VERIFID_PORT', 5001))
+# Uploads larger than this are handed to the worker as a private temp file instead of through the pool's pipe
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('VERIFID_UPLOAD_SPOOL_THRESHOLD', 4 * 1024 * 1024))
+# Threads for the /verify/id quality gate; OpenCV releases the GIL while it decodes and measures
+upload_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('VERIFID_UPLOAD_THREADS', 2)))
 
 def cleanup_old_sessions():
-    """Clean up sessions older than 10 minutes"""
-    current_time = time.time()
-    sessions_to_remove = []
-
-    for session_id, session in verification_sessions.items():
-        session_age = current_time - session.get('created_at', 0)
-        disconnected_age = current_time - session.get('disconnected_at', current_time)
-        completed_age = current_time - session.get('completed_at', current_time)
-
-        # Remove sessions that are:
-        # - Older than 10 minutes
-        # - Disconnected for more than 5 minutes
-        # - Completed/failed for more than 30 seconds (allow time for frontend cleanup)
-        should_remove = (
-            session_age > 600 or
-            (session.get('disconnected') and disconnected_age > 300) or
-            (session.get('status') in ['completed', 'failed'] and completed_age > 30)
-        )
-
-        if should_remove:
-            sessions_to_remove.append(session_id)
-
-    for session_id in sessions_to_remove:
-        logger.info(f"Cleaning up old session: {session_id}")
-        del verification_sessions[session_id]
+    """
+    Clean up expired sessions. Sessions expire when they are:
+    - Older than 10 minutes
+    - Disconnected for more than 5 minutes
+    - Completed/failed for more than 30 seconds (allow time for frontend cleanup)
+    Only sessions that actually expired are touched.
+    """
+    for session_id in session_store.cleanup():
+        logger.info("Cleaning up old session: %s", session_id)
+        frame_mailbox.discard(session_id)
 
 # Liveness constants
 LIVENESS_COMMAND_SEQUENCE = ['right', 'center', 'left']  # Standard sequence after initial centering
 LIVENESS_COMMAND_TIMEOUT = 7  # Seconds per command
-FACE_MOVEMENT_THRESHOLD = 40  # Pixel threshold for movement detection
 FRAME_SKIP_RATE = 2  # Process every Nth frame to optimize
+# Follow the face with a template tracker between periodic full detections
+LIVENESS_TRACKING_ENABLED = os.environ.get('VERIFID_LIVENESS_TRACKING', '1') == '1'
+FRAME_MAX_AGE = 1.5  # Seconds after which a frame's result no longer reflects the user's head position
+
+# Batch verification may use up to this many pool slots at once, leaving the rest for live traffic
+BATCH_MAX_IN_FLIGHT = max(1, pool.max_pending - pool.max_workers // 2)
+
+# eager: start and warm up every pool worker (dlib models, Tesseract) and the
+# duplicate-face index at startup; /ready answers 503 until that is done.
+# lazy: workers start and warm up on first use and /ready is ready immediately.
+WARMUP_MODE = os.environ.get('VERIFID_WARMUP', 'eager')
+startup_state = {'status': 'starting', 'warmup': WARMUP_MODE}
+POOL_RECOVERY_INTERVAL = 10  # Seconds between checks for a broken worker pool
+
+def warm_up():
+    """Startup phase, run in the background once the server is listening."""
+    started = time.time()
+    startup_state.pop('error', None)
+    try:
+        # One-time migration of the faces older versions kept in face_info/, before /ready
+        wait_for(index_build_executor.submit(import_legacy_faces))
+        if WARMUP_MODE == 'eager':
+            startup_state['status'] = 'warming_up'
+            startup_state['workers'] = pool.start()
+            # Also loads the encoding index, off the hub
+            wait_for(index_build_executor.submit(
+                lambda: duplicate_index.build_from_store(get_encoding_store(FACE_INFO_DIR))))
+    except Exception as e:
+        logger.exception("Warmup failed")
+        startup_state.update(status='failed', error=str(e))
+        return
+    startup_state.update(status='ready', warmup_seconds=round(time.time() - started, 2))
+    logger.info("Ready after %.1fs of %s warmup", time.time() - started, WARMUP_MODE)
+
+def watch_pool():
+    """
+    Restart the worker pool after a worker crash or a failed worker warmup
+    broke it, without waiting for a request to do so. /ready answers 503
+    while it is broken.
+    """
+    while True:
+        socketio.sleep(POOL_RECOVERY_INTERVAL)
+        if pool.broken_error is None or startup_state['status'] in ('starting', 'warming_up'):
+            continue
+        logger.info("Restarting the worker pool after: %s", pool.broken_error)
+        if startup_state['status'] == 'failed':
+            warm_up()
+            continue
+        try:
+            pool.start()
+        except Exception:
+            logger.exception("Worker pool restart failed")
 
 @app.route('/ping', methods=['GET'])
 def ping():
     return jsonify({'status': 'ok', 'message': 'pong'})
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness, unlike /ping: 200 only once the startup warmup has finished and while the worker pool works."""
+    if pool.broken_error is not None:
+        return jsonify(dict(startup_state, pool_error=pool.broken_error)), 503
+    return jsonify(startup_state), 200 if startup_state['status'] == 'ready' else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage timings and frame/upload counters in the Prometheus text format."""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # Single connect handler
 @socketio.on('connect')
 def handle_connect_socket(): # Renamed to avoid conflict if there were others
-    logger.debug(f"Client connected: {request.sid}")
+    logger.debug("Client connected: %s", request.sid)
     # Emit a general connection status, specific status can be sent by other events
     emit('connection_response', {'status': 'connected', 'sid': request.sid})
 
@@ -110,15 +216,111 @@ def handle_ping():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    logger.debug(f"Client disconnected: {request.sid}")
+    logger.debug("Client disconnected: %s", request.sid)
     # Find and mark any sessions associated with this socket as disconnected
     # Don't delete sessions immediately - keep them for potential reconnection
-    for session_id, session in verification_sessions.items():
-        if session.get('socket_sid') == request.sid:
-            logger.info(f"Marking session {session_id} as disconnected (keeping for potential reconnection)")
-            session['disconnected'] = True
-            session['disconnected_at'] = time.time()
-
+    def mark_disconnected(session, events):
+        if session.get('socket_sid') != request.sid:
+            return False  # Already rebound by a reconnect
+        session['disconnected'] = True
+        session['disconnected_at'] = time.time()
+
+    for session_id, _ in session_store.find_by_sid(request.sid):
+        logger.info("Marking session %s as disconnected (keeping for potential reconnection)", session_id)
+        update_session(session_id, mark_disconnected)
+
+
+def update_session(verification_id, apply):
+    """
+    Apply apply(session, events) to the stored session atomically, then emit
+    the (event, payload) pairs it queued in events. apply may run again on a
+    fresher session if another handler or server process wrote it meanwhile,
+    so it only touches the session and events. Returns the stored session,
+    or None if it no longer exists.
+    """
+    events = []
+
+    def attempt(session):
+        del events[:]
+        return apply(session, events)
+
+    session = session_store.update(verification_id, attempt)
+    for event, payload in events:
+        emit(event, payload)
+    return session
+
+
+def read_enrolled_encoding(user_id):
+    """(encoding store, user_id's encoding or None, number of enrolled users), on a store_executor thread."""
+    store = get_encoding_store(FACE_INFO_DIR)
+    return store, store.get(user_id), len(store)
+
+def check_duplicate_identity(user_id):
+    """
+    Search all enrolled faces for other accounts matching user_id's newly
+    enrolled face, and add it to the search index.
+    """
+    store, encoding, gallery_size = wait_for(store_executor.submit(read_enrolled_encoding, user_id))
+    if encoding is None:
+        return {'checked': False, 'is_duplicate': False, 'matches': []}
+
+    # Index builds can take seconds on large galleries; run them on a thread and wait cooperatively
+    if duplicate_index.built_at is None:
+        wait_for(index_build_executor.submit(duplicate_index.build_from_store, store))
+    else:
+        duplicate_index.add(str(user_id), encoding)
+        stale = (gallery_size != len(duplicate_index)
+                 and time.time() - duplicate_index.built_at > DUPLICATE_INDEX_REFRESH_INTERVAL)
+        if stale or duplicate_index.needs_rebuild(gallery_size):
+            wait_for(index_build_executor.submit(duplicate_index.build_from_store, store))
+
+    matches = duplicate_index.find_duplicates(encoding, exclude_user_id=str(user_id))
+    if matches:
+        logger.warning("Face of user %s matches %s other enrolled account(s): %s", user_id, len(matches), matches)
+    return {
+        'checked': True,
+        'is_duplicate': bool(matches),
+        'matches': [{'user_id': other_id, 'distance': round(distance, 4)} for other_id, distance in matches]
+    }
+
+def read_upload(file):
+    """
+    Return an uploaded file for decoding and its content hash. The
+    upload is its bytes, or for uploads above UPLOAD_SPOOL_THRESHOLD the path
+    of a uniquely named temp copy that prepare_id_upload maps into memory.
+    The caller removes the temp copy.
+    """
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size <= UPLOAD_SPOOL_THRESHOLD:
+        data = stream.read()
+        return data, content_hash(data)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(prefix='verifid_upload_', delete=False) as spool:
+        # Hash while copying so the spooled file is never read back here
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+            spool.write(chunk)
+    return spool.name, digest.hexdigest()
+
+def restore_cached_faces(upload, digest, entry, user_id):
+    """
+    Redo the face work of a disk-tier cache entry (persisted_cache_entry) on
+    its upload in the worker pool, skipping the OCR. Returns the restored
+    entry, or None to process the upload from scratch.
+    """
+    img, card_corners, quality = wait_for(upload_executor.submit(prepare_id_upload, upload))
+    if img is None or not quality['ok']:
+        return None
+    try:
+        entry = pool.run(restore_id_card_faces, img, card_corners, entry, user_id)
+    except PoolBusyError:
+        return None
+    # Already on disk without its faces; the restored entry stays in memory
+    id_result_cache.put(digest, entry, persist=False)
+    return entry
 
 @app.route('/verify/id', methods=['POST'])
 def verify_id_card():
@@ -130,43 +332,79 @@ def verify_id_card():
         file = request.files['file']
         user_data_str = request.form.get('userData') # Changed to user_data_str
         
-        logger.debug(f"Received file: {file.filename}")
-        logger.debug(f"User data string: {user_data_str}")
+        logger.debug("Received file %s with %s chars of userData", file.filename, len(user_data_str or ''))
         
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
             
-        temp_filepath = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
+        # Decoded from memory; only large uploads touch the disk
+        upload, digest = read_upload(file)
+        if not upload:
+            return jsonify({'error': 'Empty file'}), 400
         
         try:
-            file.save(temp_filepath)
-            logger.debug(f"Temporary file saved to: {temp_filepath}")
-            
-            img = cv2.imread(temp_filepath)
-            if img is None:
-                logger.error("Could not read image from temp file.")
-                return jsonify({'error': 'Could not read image'}), 400
-            
-            ocr_result = extract_text_from_id(img, user_data_str) # Pass user_data_str
-            
             user_id = None
             if user_data_str:
                 try:
-                    # user_data_dict is parsed inside extract_text_from_id and also here
-                    # Ensure consistency or parse once. For now, keeping similar to original.
                     user_data_dict = json.loads(user_data_str) if isinstance(user_data_str, str) else user_data_str
                     user_id = user_data_dict.get('id')
                 except json.JSONDecodeError:
                     logger.warning("Failed to parse userData JSON in /verify/id")
                 except Exception as e:
-                    logger.error(f"Error extracting user_id from userData: {e}")
-
-            if user_id:
-                success, face_path_or_error = save_face_from_id_card(img, user_id)
+                    logger.error("Error extracting user_id from userData: %s", e)
+
+            # A resubmitted photo only needs the user_data comparison (and the face save) redone;
+            # the face save writes and fsyncs the asset and encoding stores, so it runs on a thread
+            cached = id_result_cache.get(digest)
+            result = None
+            if cached is not None and cached.get('faces_stripped'):
+                cached = restore_cached_faces(upload, digest, cached, user_id)
+            if cached is not None:
+                result = wait_for(upload_executor.submit(id_card_result_from_cache, cached, user_data_str, user_id))
+            if result is not None:
+                ocr_result, face_save_result = result
+                ID_UPLOADS.labels('cached').inc()
+                logger.info("Served ID verification for upload %s from the result cache", digest[:12])
+            else:
+                # The quality gate takes milliseconds on a server thread, so a photo it
+                # turns away never waits for a worker pool slot
+                img, card_corners, quality = wait_for(upload_executor.submit(prepare_id_upload, upload))
+                if img is None:
+                    ocr_result = None
+                elif not quality['ok']:
+                    ocr_result, face_save_result = rejected_upload_result(quality), None
+                    cache_entry = id_card_cache_entry(ocr_result, None, False)
+                else:
+                    # OCR and face extraction run in the worker pool, off the event loop
+                    try:
+                        ocr_result, face_save_result, cache_entry = pool.run(
+                            process_id_card_upload, img, card_corners, user_data_str, user_id, digest)
+                    except PoolBusyError:
+                        ID_UPLOADS.labels('busy').inc()
+                        logger.warning("Worker pool busy, rejecting ID verification request")
+                        return jsonify({'error': 'Server is busy, please try again shortly'}), 503
+                if ocr_result is not None:
+                    ID_UPLOADS.labels('processed').inc()
+                    id_result_cache.put(digest, cache_entry, disk_value=persisted_cache_entry(cache_entry))
+
+            if ocr_result is None:
+                ID_UPLOADS.labels('unreadable').inc()
+                logger.error("Could not decode uploaded image.")
+                return jsonify({'error': 'Could not read image'}), 400
+            if 'quality' in ocr_result:
+                # Turned away by the quality gate before any OCR or face work
+                quality = ocr_result['quality']
+                ID_UPLOADS.labels('rejected').inc()
+                return jsonify({'error': quality['message'], 'reason': quality['reason'], 'quality': quality}), 422
+
+            duplicate_check = {'checked': False, 'is_duplicate': False, 'matches': []}
+            if face_save_result is not None:
+                success, face_path_or_error = face_save_result
                 if success:
-                    logger.info(f"Successfully saved face image for user {user_id} at {face_path_or_error}")
+                    logger.info("Successfully saved face image for user %s at %s", user_id, face_path_or_error)
+                    duplicate_check = check_duplicate_identity(user_id)
                 else:
-                    logger.warning(f"Failed to save face image for user {user_id}: {face_path_or_error}")
+                    logger.warning("Failed to save face image for user %s: %s", user_id, face_path_or_error)
             
             verification_result = {
                 'success': ocr_result.get('success', False),
@@ -174,23 +412,79 @@ def verify_id_card():
                 'verification_id': ocr_result.get('verification_id', str(uuid.uuid4())),
                 'extracted_data': ocr_result.get('extracted_data', {}),
                 'user_match': ocr_result.get('user_match', {'overall_match': False, 'match_percentage': 0, 'matches': []}),
-                'face_image': ocr_result.get('face_image')
+                'face_image': ocr_result.get('face_image'),
+                'duplicate_check': duplicate_check
             }
             
-            logger.debug(f"Final verification result: {json.dumps(verification_result, indent=2)}")
+            logger.debug("ID verification %s: success=%s, user data match %s%%",
+                         verification_result['verification_id'], verification_result['success'],
+                         verification_result['user_match'].get('match_percentage'))
             return jsonify(verification_result)
             
         except Exception as e:
-            logger.error(f"Error processing image: {str(e)}", exc_info=True)
+            logger.error("Error processing image: %s", e, exc_info=True)
             return jsonify({'error': str(e)}), 500
         finally:
-            if os.path.exists(temp_filepath):
-                os.remove(temp_filepath)
+            if isinstance(upload, str):
+                os.remove(upload)
     
     except Exception as e:
-        logger.error(f"Error in verify_id_card: {str(e)}", exc_info=True)
+        logger.error("Error in verify_id_card: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/verify/id/batch', methods=['POST'])
+def verify_id_card_batch():
+    """
+    Verify a batch of ID cards uploaded as a zip archive ('archive') or as
+    several 'files'. Results stream back as NDJSON, one line per card, in
+    completion order. 'userData' may map file names to userData objects.
+    """
+    try:
+        user_data_by_file = json.loads(request.form.get('userData') or '{}')
+        validate_user_data(user_data_by_file)
+    except json.JSONDecodeError:
+        return jsonify({'error': 'userData must be a JSON object keyed by file name'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Flask closes the uploaded files when this view returns, before the response is streamed, so the
+    # upload (at most MAX_CONTENT_LENGTH) is read here; archive members are still decompressed one at a
+    # time as pool slots free up
+    if 'archive' in request.files:
+        cards = iter_card_images(io.BytesIO(request.files['archive'].read()))
+    else:
+        cards = iter([(f.filename, f.read()) for f in request.files.getlist('files') if is_card_image(f.filename)])
+    try:
+        first_card = next(cards, None)
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'archive is not a valid zip file'}), 400
+    except ArchiveTooLargeError as e:
+        return jsonify({'error': str(e)}), 400
+    if first_card is None:
+        return jsonify({'error': 'No card images found'}), 400
+
+    def generate():
+        tasks = ((name, data, user_data_by_file.get(name)) for name, data in itertools.chain([first_card], cards))
+        count = 0
+        try:
+            for (name, _, _), future in pool.imap_unordered(process_id_card_bytes, tasks,
+                                                           max_in_flight=BATCH_MAX_IN_FLIGHT):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    logger.error("Batch card %s failed: %s", name, e)
+                    record = {'file': name, 'success': False, 'message': f"Processing failed: {e}"}
+                count += 1
+                yield to_ndjson(record)
+        except ArchiveTooLargeError as e:
+            # Found while streaming: the cards before it have been answered already
+            logger.warning("Batch ID verification stopped after %s cards: %s", count, e)
+            yield to_ndjson({'file': None, 'success': False, 'message': f"Batch stopped: {e}"})
+            return
+        logger.info("Batch ID verification of %s cards finished", count)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/verify/face/initialize', methods=['POST'])
 def initialize_face_verification():
     """Initialize a face verification session"""
@@ -202,11 +496,8 @@ def initialize_face_verification():
             return jsonify({'error': 'Missing user_id'}), 400
         
         # Check if reference face exists
-        face_info_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'face_info')
-        face_path = os.path.join(face_info_dir, f"{user_id}.jpg")
-        
-        if not os.path.exists(face_path):
-            logger.warning(f"Reference face not found for user {user_id} at {face_path}")
+        if user_id not in get_face_asset_store():
+            logger.warning("Reference face not found for user %s", user_id)
             return jsonify({
                 'error': 'Reference face not found',
                 'message': 'Please complete ID verification first to register your face.'
@@ -215,7 +506,7 @@ def initialize_face_verification():
         # Create a new verification session with random commands
         verification_id = str(uuid.uuid4())
         random_commands = generate_random_liveness_commands(3)  # Generate 3 random commands
-        verification_sessions[verification_id] = {
+        session_store.save(verification_id, {
             'user_id': user_id,
             'status': 'initialized',
             'liveness_commands': random_commands,  # Use random commands for security
@@ -226,9 +517,9 @@ def initialize_face_verification():
             'created_at': time.time(),
             'failed_attempts': 0,  # Track failed attempts
             'max_attempts': 5  # Maximum allowed attempts
-        }
+        })
         
-        logger.info(f"Face verification session initialized for user {user_id}: {verification_id}")
+        logger.info("Face verification session initialized for user %s: %s", user_id, verification_id)
         
         return jsonify({
             'verification_id': verification_id,
@@ -236,7 +527,7 @@ def initialize_face_verification():
             'message': 'Face verification session initialized'
         })
     except Exception as e:
-        logger.error(f"Error initializing face verification: {str(e)}", exc_info=True)
+        logger.error("Error initializing face verification: %s", e, exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 # Socket.IO events for Liveness
@@ -252,97 +543,226 @@ def handle_start_liveness_check(data):
 
     cleanup_old_sessions()
 
-    if verification_id not in verification_sessions:
-        logger.error(f"Invalid verification_id in start_liveness_check: {verification_id}")
+    session = session_store.get(verification_id)
+    if session is None:
+        logger.error("Invalid verification_id in start_liveness_check: %s", verification_id)
         emit('liveness_error', {'message': 'Invalid verification session. Please restart verification.'})
         return
 
-    logger.debug(f"Attempting to start liveness check for verification_id: {verification_id}")
+    logger.debug("Attempting to start liveness check for verification_id: %s", verification_id)
 
     try:
-        session = verification_sessions[verification_id]
         user_id = session.get('user_id')
 
         if not user_id:
-            logger.error(f"No user_id found in session {verification_id}")
+            logger.error("No user_id found in session %s", verification_id)
             emit('liveness_error', {'message': 'Invalid session data'})
             return
 
-        # Define face_info directory relative to the current file
-        face_info_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'face_info')
-        logger.debug(f"Looking for reference face in: {os.path.abspath(face_info_dir)}")
+        if session.get('status') in ('centering', 'in_progress') and session.get('reference_encoding') is not None:
+            resume_liveness_check(verification_id, data)
+            return
 
-        # Try to load the reference face encoding
-        reference_encoding = get_reference_face_encoding(user_id, face_info_dir)
+        # Precomputed encodings are served from the store; only users enrolled
+        # before it existed need the dlib encoder, which runs in the worker pool
+        reference_encoding = wait_for(store_executor.submit(lambda: get_encoding_store(FACE_INFO_DIR).get(user_id)))
+        if reference_encoding is None:
+            reference_encoding = pool.run(get_reference_face_encoding, user_id)
         if reference_encoding is None:
-            logger.error(f"Failed to load reference face encoding for user {user_id}")
+            logger.error("Failed to load reference face encoding for user %s", user_id)
             emit('liveness_error', {'message': 'Could not process reference face. Please try again.'})
             return
 
-        logger.info(f"Successfully loaded reference face encoding for user {user_id}")
-
-        # Store reference encoding in session
-        session['reference_encoding'] = reference_encoding
-        session['status'] = 'centering'
-        session['socket_sid'] = request.sid
-        session['disconnected'] = False
-        if 'disconnected_at' in session:
-            del session['disconnected_at']
-
-        if 'liveness_commands' not in session:
-            session['liveness_commands'] = generate_random_liveness_commands(3)
-
-        logger.info(f"Liveness check initialized for {verification_id}. Instructing user to center face.")
-        emit('liveness_instruction', {'instruction': 'Please position your face in the center of the screen.'})
+        logger.info("Successfully loaded reference face encoding for user %s", user_id)
+
+        def begin(session, events):
+            # Store reference encoding in session
+            session['reference_encoding'] = reference_encoding
+            session['status'] = 'centering'
+            session['socket_sid'] = request.sid
+            session['disconnected'] = False
+            if 'disconnected_at' in session:
+                del session['disconnected_at']
+
+            if 'liveness_commands' not in session:
+                session['liveness_commands'] = generate_random_liveness_commands(3)
+
+            # Clients that follow liveness_rate send only frames the server will process
+            session['adaptive_rate'] = bool(data.get('adaptive_rate'))
+            # Encodings of good frames collected during the sequence for the final match
+            session['encoding_buffer'] = EncodingRingBuffer()
+            session.pop('encoding_sampled_at', None)
+            session.pop('face_count', None)
+            events.append(('liveness_rate', start_rate_control(session, pool.pending, pool.max_pending)))
+            events.append(('liveness_instruction', {'instruction': 'Please position your face in the center of the screen.'}))
+
+        # The session expired while the reference encoding was computed
+        if update_session(verification_id, begin) is None:
+            emit('liveness_error', {'message': 'Invalid verification session. Please restart verification.'})
+            return
+        logger.info("Liveness check initialized for %s. Instructing user to center face.", verification_id)
 
     except Exception as e:
-        logger.error(f"Error in start_liveness_check: {str(e)}", exc_info=True)
+        logger.error("Error in start_liveness_check: %s", e, exc_info=True)
         emit('liveness_error', {'message': f"Failed to initialize verification: {str(e)}"})
 
+def resume_liveness_check(verification_id, data):
+    """
+    Continue a liveness sequence after the client reconnected, possibly to
+    another server process after the one it was on stopped. A start for a
+    session that is not marked disconnected only repeats the current
+    instruction; its command clock and tracking carry on.
+    """
+    def resume(session, events):
+        if session.get('disconnected'):
+            if session.get('tracker_state') is not None:
+                session['tracker_state'] = {}  # Re-detect: the face has moved since the last frame
+            # Time spent disconnected does not count against the current command
+            if 'command_start_time' in session and session.get('disconnected_at') is not None:
+                session['command_start_time'] += max(0.0, time.time() - session['disconnected_at'])
+            session['adaptive_rate'] = bool(data.get('adaptive_rate'))
+            events.append(('liveness_rate', start_rate_control(session, pool.pending, pool.max_pending)))
+        else:
+            events.append(('liveness_rate', rate_settings(session['rate_level'])))
+        session['socket_sid'] = request.sid
+        session['disconnected'] = False
+        session.pop('disconnected_at', None)
+        if session['status'] == 'centering':
+            events.append(('liveness_instruction', {'instruction': 'Please position your face in the center of the screen.'}))
+        else:
+            current_command = session['liveness_commands'][session['current_command_index']]
+            events.append(('liveness_instruction', {'instruction': f"Please look {current_command}"}))
+
+    session = update_session(verification_id, resume)
+    if session is not None:
+        logger.info("Resuming liveness check for %s at step %s", verification_id, session.get('current_command_index', 0))
+
+def adjust_frame_rate(session, latency, events):
+    """Feed one frame's processing latency (None if it was rejected) to rate control and queue a notice of changes."""
+    if latency is None:
+        latency = session.get('rate_latency') or 0.0
+    settings = update_rate_control(session, latency, pool.pending, pool.max_pending)
+    if settings:
+        events.append(('liveness_rate', settings))
+
 @socketio.on('liveness_frame')
 def handle_liveness_frame(data):
     verification_id = data.get('verification_id')
-    frame_data_b64 = data.get('frame')
+    # Binary JPEG/WebP attachment from current clients, base64 data URL from older ones
+    frame_data = data.get('frame')
 
-    if not verification_id or verification_id not in verification_sessions:
+    LIVENESS_FRAMES.labels('received').inc()
+
+    if not verification_id:
         return
     
-    session = verification_sessions[verification_id]
+    if not frame_data:
+        return
 
-    if session.get('status') in ['completed', 'failed']:
+    def count_frame(session, events):
+        if session.get('status') in ['completed', 'failed']:
+            return False
+        session['frame_counter'] = session.get('frame_counter', 0) + 1
+
+    with span('session_lookup'):
+        session = update_session(verification_id, count_frame)
+    if session is None or session.get('status') in ['completed', 'failed']:
         return
 
-    if not frame_data_b64:
+    if not session.get('adaptive_rate') and session['frame_counter'] % FRAME_SKIP_RATE != 0:
+        LIVENESS_FRAMES.labels('skipped').inc()
         return
-    
-    session['frame_counter'] = session.get('frame_counter', 0) + 1
-    if session['frame_counter'] % FRAME_SKIP_RATE != 0:
+
+    # Latest frame wins: a newer frame replaces one still waiting, and only the
+    # handler that acquired the session processes frames, one at a time
+    if frame_mailbox.put(verification_id, frame_data):
+        count_dropped_frame('replaced')
+        logger.debug("Replaced a stale unprocessed frame for %s", verification_id, extra=sampled('frame_replaced'))
+    if not frame_mailbox.acquire(verification_id):
         return
-    
+
     try:
-        frame = base64_to_image(frame_data_b64)
-        if frame is None:
-            logger.error(f"Failed to decode image for {verification_id}")
-            return
-            
-        if session['status'] == 'centering':
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame)
-            
-            if face_locations:
-                top, right, bottom, left = face_locations[0]
-                session['reference_center_x'] = (left + right) // 2
-                session['reference_face_size'] = {'width': right - left, 'height': bottom - top}
-                session['status'] = 'in_progress'
-                session['current_command_index'] = 0
-                first_command = session['liveness_commands'][0]
-                session['command_start_time'] = time.time()
-                logger.info(f"Centering successful for {verification_id}. Starting with command: {first_command}")
-                emit('liveness_instruction', {'instruction': f"Please look {first_command}"})
-            else:
-                emit('liveness_feedback', {'message': "No face detected. Please ensure your face is clearly visible."})
-        
-        elif session['status'] == 'in_progress':
+        while True:
+            pending = frame_mailbox.next_frame(verification_id)
+            if pending is None:
+                break
+            # Re-read the session: it may have changed or expired while the last frame was processed
+            with span('session_lookup'):
+                session = session_store.get(verification_id)
+            if session is None or session.get('status') in ['completed', 'failed']:
+                count_dropped_frame('session_ended')
+                frame_mailbox.discard(verification_id)
+                continue
+            frame_data, received_at = pending
+            if is_stale_frame(received_at):
+                count_dropped_frame('stale')
+                continue
+            with span('liveness_frame'):
+                process_session_frame(verification_id, session, frame_data, received_at)
+    except Exception:
+        frame_mailbox.release(verification_id)
+        raise
+
+
+def record_encoding_sample(session, encoding):
+    """Add a sampled face encoding to the session's ring buffer for the final match."""
+    if encoding is not None:
+        session['encoding_buffer'].add(encoding)
+        session['encoding_sampled_at'] = time.time()
+
+
+def note_face_count(session, face_count):
+    """
+    Record the face count of a detection frame (None for tracked frames). When
+    it changes, someone entered or left the frame, so the encodings sampled so
+    far may not all be of the person who finishes the sequence: drop them.
+    """
+    if face_count is None or face_count == session.get('face_count'):
+        return
+    if session.get('face_count') is not None:
+        session['encoding_buffer'].clear()
+        session.pop('encoding_sampled_at', None)
+    session['face_count'] = face_count
+
+
+def count_dropped_frame(reason):
+    LIVENESS_FRAMES.labels('dropped').inc()
+    LIVENESS_FRAMES_DROPPED.labels(reason).inc()
+
+
+def is_stale_frame(received_at):
+    """True if a frame's result is too old to act on."""
+    return time.time() - received_at > FRAME_MAX_AGE
+
+
+def process_session_frame(verification_id, session, frame_data, received_at):
+    """
+    Run one frame through the centering or liveness step of its session.
+
+    The frame is analysed in the worker pool with the session as it was read;
+    the result is then applied to the session as it is now, in one
+    update_session() call, so a disconnect, restart or frame count recorded
+    by another handler meanwhile is kept, and a result for a step the session
+    has since left is dropped.
+    """
+    status = session['status']
+    try:
+        if status == 'centering':
+            started_at = time.time()
+            try:
+                detection = pool.run(locate_face_in_frame, frame_data, LIVENESS_TRACKING_ENABLED, True)
+            except PoolBusyError:
+                drop_busy_frame(verification_id)
+                return
+            LIVENESS_FRAMES.labels('processed').inc()
+            latency = time.time() - started_at
+
+            if not detection['decoded']:
+                logger.error("Failed to decode image for %s", verification_id, extra=sampled('frame_undecodable'))
+            update_session(verification_id, lambda current, events: apply_centering_result(
+                verification_id, current, events, detection, latency, received_at))
+
+        elif status == 'in_progress':
             current_command_index = session.get('current_command_index', 0)
             current_command = session['liveness_commands'][current_command_index]
             reference_center_x = session.get('reference_center_x')
@@ -350,68 +770,140 @@ def handle_liveness_frame(data):
             if reference_center_x is None:
                 emit('liveness_error', {'message': 'Reference position not established'})
                 return
+
+            is_final_command = current_command_index == len(session['liveness_commands']) - 1
+            if is_final_command and 'reference_encoding' not in session:
+                emit('liveness_error', {'message': 'Reference face data not available'})
+                return
+            reference_encoding = session['reference_encoding'] if is_final_command else None
             
-            result = process_liveness_frame(frame, reference_center_x, current_command)
-
-            if not result['face_detected']:
-                error_msg = result.get('error_message', 'Face not detected. Please keep your face in view.')
-                emit('liveness_feedback', {'message': error_msg})
-                session['failed_attempts'] = session.get('failed_attempts', 0) + 1
-                if session['failed_attempts'] >= session.get('max_attempts', 5):
-                    emit('liveness_result', {'success': False, 'message': 'Verification failed: Too many failed attempts.', 'match_status': False})
-                    if verification_id in verification_sessions:
-                        verification_sessions[verification_id]['status'] = 'failed'
-                        verification_sessions[verification_id]['completed_at'] = time.time()
+            started_at = time.time()
+            try:
+                result = pool.run(
+                    analyze_liveness_frame, frame_data, reference_center_x, current_command,
+                    reference_encoding=reference_encoding,
+                    tracker_state=session.get('tracker_state'),
+                    reference_face_width=(session.get('reference_face_size') or {}).get('width'),
+                    reference_frame_width=session.get('reference_frame_width'),
+                    sample_encoding=time.time() - session.get('encoding_sampled_at', 0) >= ENCODING_SAMPLE_INTERVAL,
+                    session_encodings=session['encoding_buffer'].encodings() if is_final_command else None
+                )
+            except PoolBusyError:
+                drop_busy_frame(verification_id)
                 return
+            LIVENESS_FRAMES.labels('processed').inc()
+            latency = time.time() - started_at
 
-            # --- VALIDATE FACE CONSISTENCY and DETECT FACE BLUR BLOCKS ARE REMOVED ---
-            
-            logger.debug(f"Movement detected: {result['movement_detected']}, expected: {current_command}")
-            
-            if result['command_matched']:
-                session['movements_done'].append(current_command)
-                current_command_index += 1
-                session['current_command_index'] = current_command_index
-                
-                if current_command_index >= len(session['liveness_commands']):
-                    logger.info(f"All liveness commands completed for {verification_id}. Verifying face match.")
-                    
-                    if 'reference_encoding' not in session:
-                        emit('liveness_error', {'message': 'Reference face data not available'})
-                        return
-                    
-                    match_result, confidence, match_message = verify_face_match(frame, session['reference_encoding'])
-                    logger.info(f"Face match result for {verification_id}: {match_result}, confidence: {confidence}, message: {match_message}")
-
-                    emit('liveness_result', {
-                        'success': match_result,
-                        'message': 'Verification Successful!' if match_result else f'Verification Failed: {match_message}',
-                        'match_status': match_result,
-                        'confidence': confidence
-                    })
-                    
-                    if verification_id in verification_sessions:
-                        verification_sessions[verification_id]['status'] = 'completed' if match_result else 'failed'
-                        verification_sessions[verification_id]['completed_at'] = time.time()
-                else:
-                    next_command = session['liveness_commands'][current_command_index]
-                    session['command_start_time'] = time.time()
-                    emit('liveness_instruction', {'instruction': f"Please look {next_command}"})
-            else:
-                emit('liveness_feedback', {'message': f"Detected: {result['movement_detected']}. Please look {current_command}."})
-                
-                if 'command_start_time' in session and time.time() - session['command_start_time'] > 10:
-                    session['status'] = 'failed'
-                    emit('liveness_result', {'success': False, 'message': f"Verification Failed: Timeout on '{current_command}' command.", 'match_status': False})
-                    if verification_id in verification_sessions:
-                        verification_sessions[verification_id]['status'] = 'failed'
-                        verification_sessions[verification_id]['completed_at'] = time.time()
+            if result is None:
+                logger.error("Failed to decode image for %s", verification_id, extra=sampled('frame_undecodable'))
+            update_session(verification_id, lambda current, events: apply_liveness_result(
+                verification_id, current, events, result, current_command_index, latency, received_at))
     
     except Exception as e:
-        logger.error(f"Error processing liveness frame: {str(e)}", exc_info=True)
+        logger.error("Error processing liveness frame: %s", e, exc_info=True)
         emit('liveness_error', {'message': f"Error processing frame: {str(e)}"})
 
 
+def drop_busy_frame(verification_id):
+    count_dropped_frame('pool_busy')
+    logger.debug("Worker pool busy, dropping frame for %s", verification_id, extra=sampled('frame_pool_busy'))
+    update_session(verification_id, lambda session, events: adjust_frame_rate(session, None, events))
+
+
+def apply_centering_result(verification_id, session, events, detection, latency, received_at):
+    """Apply a locate_face_in_frame result to the current session, queueing the client notices in events."""
+    adjust_frame_rate(session, latency, events)
+    if not detection['decoded'] or session.get('status') != 'centering' or is_stale_frame(received_at):
+        return
+    note_face_count(session, detection['face_count'])
+
+    if detection['face_location']:
+        top, right, bottom, left = detection['face_location']
+        session['reference_center_x'] = (left + right) // 2
+        session['reference_face_size'] = {'width': right - left, 'height': bottom - top}
+        session['tracker_state'] = detection['tracker_state']
+        session['reference_frame_width'] = detection['frame_width']
+        record_encoding_sample(session, detection.get('face_encoding'))
+        session['status'] = 'in_progress'
+        session['current_command_index'] = 0
+        first_command = session['liveness_commands'][0]
+        session['command_start_time'] = time.time()
+        logger.info("Centering successful for %s. Starting with command: %s", verification_id, first_command)
+        events.append(('liveness_instruction', {'instruction': f"Please look {first_command}"}))
+    elif detection['face_count'] > 1:
+        events.append(('liveness_feedback', {'message': "Multiple faces detected. Please make sure only you are in view."}))
+    else:
+        events.append(('liveness_feedback', {'message': "No face detected. Please ensure your face is clearly visible."}))
+
+
+def apply_liveness_result(verification_id, session, events, result, command_index, latency, received_at):
+    """
+    Apply an analyze_liveness_frame result for command number command_index
+    to the current session, queueing the client notices in events.
+    """
+    adjust_frame_rate(session, latency, events)
+    if result is None:
+        return
+    # Analysed against a step the session has since left (restart, timeout, another frame's result)
+    if session.get('status') != 'in_progress' or session.get('current_command_index', 0) != command_index:
+        return
+    session['tracker_state'] = result.get('tracker_state')
+    if is_stale_frame(received_at):
+        # The head position in this frame is too old to judge the current instruction
+        logger.debug("Discarding stale frame result for %s", verification_id, extra=sampled('frame_stale_result'))
+        return
+    note_face_count(session, result.get('face_count'))
+    record_encoding_sample(session, result.get('face_encoding'))
+    current_command = session['liveness_commands'][command_index]
+
+    if not result['face_detected']:
+        error_msg = result.get('error_message', 'Face not detected. Please keep your face in view.')
+        events.append(('liveness_feedback', {'message': error_msg}))
+        session['failed_attempts'] = session.get('failed_attempts', 0) + 1
+        if session['failed_attempts'] >= session.get('max_attempts', 5):
+            events.append(('liveness_result', {'success': False, 'message': 'Verification failed: Too many failed attempts.', 'match_status': False}))
+            session['status'] = 'failed'
+            session['completed_at'] = time.time()
+        return
+
+    # --- VALIDATE FACE CONSISTENCY and DETECT FACE BLUR BLOCKS ARE REMOVED ---
+    
+    logger.debug("Movement detected: %s, expected: %s", result['movement_detected'], current_command,
+                 extra=sampled('frame_movement'))
+    
+    if result['command_matched']:
+        session['movements_done'].append(current_command)
+        command_index += 1
+        session['current_command_index'] = command_index
+        
+        if command_index >= len(session['liveness_commands']):
+            logger.info("All liveness commands completed for %s. Verifying face match.", verification_id)
+            
+            match_result, confidence, match_message = result['face_match']
+            logger.info("Face match result for %s: %s, confidence: %s, message: %s", verification_id, match_result, confidence, match_message)
+
+            events.append(('liveness_result', {
+                'success': match_result,
+                'message': 'Verification Successful!' if match_result else f'Verification Failed: {match_message}',
+                'match_status': match_result,
+                'confidence': confidence
+            }))
+            
+            session['status'] = 'completed' if match_result else 'failed'
+            session['completed_at'] = time.time()
+        else:
+            next_command = session['liveness_commands'][command_index]
+            session['command_start_time'] = time.time()
+            events.append(('liveness_instruction', {'instruction': f"Please look {next_command}"}))
+    else:
+        events.append(('liveness_feedback', {'message': f"Detected: {result['movement_detected']}. Please look {current_command}."}))
+        
+        if 'command_start_time' in session and time.time() - session['command_start_time'] > 10:
+            events.append(('liveness_result', {'success': False, 'message': f"Verification Failed: Timeout on '{current_command}' command.", 'match_status': False}))
+            session['status'] = 'failed'
+            session['completed_at'] = time.time()
+
+
 @app.route('/api/uploads/<filename>', methods=['GET'])
 def get_uploaded_file(filename):
     return send_file(os.path.join(app.config['UPLOAD_FOLDER'], filename))
@@ -419,8 +911,8 @@ def get_uploaded_file(filename):
 @app.route('/api/verify/face/check/<verification_id>', methods=['GET'])
 def check_verification_id_route(verification_id):
     cleanup_old_sessions()
-    if verification_id in verification_sessions:
-        session_info = verification_sessions[verification_id]
+    session_info = session_store.get(verification_id)
+    if session_info is not None:
         return jsonify({
             'valid': True,
             'session_details': {
@@ -436,13 +928,17 @@ def check_verification_id_route(verification_id):
         return jsonify({'valid': False, 'message': 'Verification ID not found or expired'})
 
 
-if __name__ == '__main__':
+def serve():
+    """Run the server on PORT; started by server.py."""
     logger.info("Starting Flask-SocketIO server with gevent...")
+    # Runs once the server loop starts; /ping answers meanwhile, /ready only afterwards
+    socketio.start_background_task(warm_up)
+    socketio.start_background_task(watch_pool)
     try:
         from geventwebsocket.handler import WebSocketHandler
         from gevent.pywsgi import WSGIServer
         
-        http_server = WSGIServer(('0.0.0.0', 5001), app, handler_class=WebSocketHandler)
+        http_server = WSGIServer(('0.0.0.0', PORT), app, handler_class=WebSocketHandler)
         logger.info("Server starting with WebSocketHandler")
         http_server.serve_forever()
     except ImportError:
@@ -450,7 +946,7 @@ if __name__ == '__main__':
         socketio.run(
             app, 
             host='0.0.0.0', 
-            port=5001, 
+            port=PORT, 
             debug=True,
             use_reloader=False
         )
\ No newline at end of file
@@ -0,0 +1,460 @@
+"""
+End-to-end load benchmark for one backend node.
+
+Simulates concurrent liveness sessions over Socket.IO (initialize ->
+start_liveness_check -> liveness_frame stream) and concurrent /verify/id
+uploads, then reports per-stage client latency percentiles, throughput, the
+server's own per-stage timings (the verifid_stage_seconds difference on
+/metrics over each phase) and the server's CPU use and RSS (including its
+worker pool processes). Runs fully offline on one Linux machine:
+
+    # start a server on a spare port and benchmark it
+    python benchmarks/e2e_bench.py --launch --sessions 20 --duration 30 \\
+        --frames-dir recording/ --reference-face me.jpg --id-uploads 100 --id-image card.jpg
+
+    # benchmark a running server
+    python benchmarks/e2e_bench.py --url http://localhost:5001 --sessions 50
+
+frames-dir holds a recorded webcam session as numbered JPEG files and is
+replayed in a loop by every client; without it, synthetic frames are sent,
+which measure decode and detection cost but never get past centering.
+Liveness sessions need a reference face: --reference-face is saved in the
+server's face asset store for the bench_user_<n> accounts and removed
+afterwards. ID uploads are made unique per request (bytes appended after the
+image data) so the result cache does not answer them, unless --allow-cache.
+
+Needs the python-socketio client extras: pip install "python-socketio[client]"
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from face_assets import get_face_asset_store  # noqa: E402
+from ocr_utils import delete_reference_face  # noqa: E402
+
+RESPONSE_EVENTS = ('liveness_instruction', 'liveness_feedback', 'liveness_result', 'liveness_error')
+STAGE_SAMPLE = re.compile(r'^verifid_stage_seconds_(count|sum)\{stage="([^"]*)"\} (\S+)$')
+
+
+# --- Inputs ---
+
+def load_frames(frames_dir):
+    names = sorted(name for name in os.listdir(frames_dir) if name.lower().endswith(('.jpg', '.jpeg')))
+    frames = []
+    for name in names:
+        with open(os.path.join(frames_dir, name), 'rb') as f:
+            frames.append(f.read())
+    if not frames:
+        sys.exit(f"No JPEG frames in {frames_dir}")
+    return frames
+
+
+def synthetic_frames(count=30, width=640, height=480):
+    """Webcam-sized JPEG frames with a moving face-sized blob over noise."""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+        center = (width // 2 + int(60 * np.sin(i / 5)), height // 2)
+        cv2.ellipse(frame, center, (80, 105), 0, 0, 360, (150, 170, 200), -1)
+        frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes())
+    return frames
+
+
+def synthetic_card():
+    """A card-shaped photo with text, enough to pass the upload quality gate."""
+    photo = np.full((1500, 2000, 3), 35, dtype=np.uint8)
+    cv2.rectangle(photo, (300, 300), (1700, 1183), (215, 215, 210), -1)
+    for i, line in enumerate(['T.C. KIMLIK KARTI', '12345678950', 'YILMAZ', 'AYSE', '12.03.1990  K/F', 'A12B34567']):
+        cv2.putText(photo, line, (800, 450 + i * 110), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (30, 30, 30), 4)
+    return cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+# --- Server process ---
+
+def launch_server(port):
+    env = dict(os.environ, VERIFID_PORT=str(port))
+    process = subprocess.Popen([sys.executable, 'server.py'], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 180
+    # /ready, unlike /ping, only answers 200 once the pool workers are warm
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(url + '/ready', timeout=1).read()
+            return process, url
+        except urllib.error.HTTPError as e:
+            if json.loads(e.read() or b'{}').get('status') == 'failed':
+                process.terminate()
+                sys.exit("Server warmup failed, see its /ready")
+            time.sleep(0.5)
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.5)
+    process.terminate()
+    sys.exit("Server was not ready within 180s")
+
+
+def _process_tree(root_pid):
+    """root_pid and all its descendants, from /proc."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU seconds and RSS of a process tree (server + worker pool) from /proc."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (time, cpu_seconds, rss_bytes)
+        self._stopped = threading.Event()
+        self._ticks = os.sysconf('SC_CLK_TCK')
+        self._page = os.sysconf('SC_PAGE_SIZE')
+
+    def sample(self):
+        cpu = rss = 0
+        for pid in _process_tree(self.pid):
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                with open(f'/proc/{pid}/statm') as f:
+                    rss += int(f.read().split()[1]) * self._page
+            except (OSError, IndexError, ValueError):
+                continue
+            cpu += (int(fields[11]) + int(fields[12])) / self._ticks  # utime + stime
+        return time.time(), cpu, rss
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.samples.append(self.sample())
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.samples.append(self.sample())
+
+
+
+def summarize_samples(samples):
+    """Average CPU use and peak RSS over a list of ProcessSampler samples."""
+    if len(samples) < 2:
+        return {}
+    (t0, cpu0, _), (t1, cpu1, _) = samples[0], samples[-1]
+    return {
+        'cpu_percent': round(100 * (cpu1 - cpu0) / max(t1 - t0, 1e-9), 1),
+        'rss_peak_mb': round(max(rss for _, _, rss in samples) / 2 ** 20, 1),
+    }
+
+
+# --- Measurements ---
+
+class Recorder:
+    """Thread-safe latency samples and counters per stage."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def latency(self, stage, seconds):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds * 1000)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self, elapsed):
+        stages = {}
+        for stage, values in sorted(self.latencies.items()):
+            values = np.asarray(values)
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            stages[stage] = {'count': len(values), 'per_second': round(len(values) / elapsed, 1),
+                             'p50_ms': round(p50, 1), 'p90_ms': round(p90, 1), 'p99_ms': round(p99, 1),
+                             'max_ms': round(values.max(), 1)}
+        return {'stages': stages, 'counters': dict(sorted(self.counters.items()))}
+
+
+def parse_stage_totals(text):
+    """{stage: (count, seconds)} from the verifid_stage_seconds histogram in a /metrics page."""
+    totals = {}
+    for line in text.splitlines():
+        match = STAGE_SAMPLE.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            count, seconds = totals.get(stage, (0, 0.0))
+            totals[stage] = (int(float(value)), seconds) if kind == 'count' else (count, float(value))
+    return totals
+
+
+def scrape_stage_totals(url, timeout=10):
+    """The server's stage totals, or None if /metrics cannot be read."""
+    try:
+        with urllib.request.urlopen(url + '/metrics', timeout=timeout) as response:
+            return parse_stage_totals(response.read().decode('utf-8'))
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None
+
+
+def stage_deltas(before, after):
+    """Per-stage observations, total and mean time between two scrapes; idle stages are left out."""
+    stages = {}
+    for stage, (count, seconds) in sorted(after.items()):
+        count0, seconds0 = before.get(stage, (0, 0.0))
+        count, seconds = count - count0, seconds - seconds0
+        if count > 0:
+            stages[stage] = {'count': count, 'total_ms': round(seconds * 1000, 1),
+                             'mean_ms': round(seconds * 1000 / count, 2)}
+    return stages
+
+
+def post_json(url, payload, timeout=30):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def post_file(url, field, filename, data, form, timeout=120):
+    """multipart/form-data POST with the standard library; returns the status code."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    request = urllib.request.Request(url, data=b''.join(parts),
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+# --- Liveness sessions ---
+
+def run_liveness_client(url, user_id, frames, deadline, recorder, frame_timeout, default_fps):
+    import socketio
+
+    responded = threading.Event()
+    state = {'fps': default_fps, 'done': False}
+    client = socketio.Client(reconnection=False)
+
+    def on_response(event):
+        def handler(data):
+            if event in ('liveness_result', 'liveness_error'):
+                state['done'] = True
+                recorder.count(f"{event}:{'success' if data.get('success') else 'failure'}"
+                               if event == 'liveness_result' else event)
+            responded.set()
+        return handler
+
+    for event in RESPONSE_EVENTS:
+        client.on(event, on_response(event))
+    client.on('liveness_rate', lambda data: state.update(fps=data.get('fps', default_fps)))
+
+    started = time.time()
+    try:
+        verification_id = post_json(f"{url}/api/verify/face/initialize", {'user_id': user_id})['verification_id']
+    except Exception as e:
+        recorder.count(f'initialize_failed:{type(e).__name__}')
+        return
+    recorder.latency('initialize', time.time() - started)
+
+    started = time.time()
+    client.connect(url, transports=['websocket'])
+    recorder.latency('connect', time.time() - started)
+    try:
+        started = time.time()
+        responded.clear()
+        client.emit('start_liveness_check', {'verification_id': verification_id, 'adaptive_rate': True})
+        if not responded.wait(frame_timeout * 5):
+            recorder.count('start_timeout')
+            return
+        recorder.latency('start_liveness_check', time.time() - started)
+
+        i = 0
+        while time.time() < deadline and not state['done']:
+            responded.clear()
+            sent_at = time.time()
+            client.emit('liveness_frame', {'verification_id': verification_id, 'frame': frames[i % len(frames)]})
+            recorder.count('frames_sent')
+            if responded.wait(frame_timeout):
+                recorder.latency('liveness_frame', time.time() - sent_at)
+            else:
+                recorder.count('frames_unanswered')  # Dropped, skipped as stale or pool busy
+            i += 1
+            time.sleep(max(0.0, 1.0 / state['fps'] - (time.time() - sent_at)))
+    finally:
+        client.disconnect()
+
+
+def run_liveness(url, args, frames, recorder):
+    user_ids = [f"bench_user_{i}" for i in range(args.sessions)]
+    added = []
+    if args.reference_face:
+        assets = get_face_asset_store()
+        with open(args.reference_face, 'rb') as f:
+            jpeg = f.read()
+        for user_id in user_ids:
+            if user_id not in assets:
+                assets.save(user_id, jpeg)
+                added.append(user_id)
+    deadline = time.time() + args.duration
+    try:
+        with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            futures = [executor.submit(run_liveness_client, url, user_id, frames, deadline, recorder,
+                                       args.frame_timeout, args.fps) for user_id in user_ids]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    recorder.count(f'client_error:{type(e).__name__}')
+    finally:
+        for user_id in added:
+            delete_reference_face(user_id)  # Also the encoding the server computed from it
+
+
+# --- ID uploads ---
+
+def run_id_uploads(url, args, image, recorder):
+    def upload(i):
+        data = image if args.allow_cache else image + uuid.uuid4().bytes  # Trailing bytes change the content hash
+        started = time.time()
+        status = post_file(f"{url}/verify/id", 'file', 'card.jpg', data, {'userData': json.dumps({})})
+        recorder.latency('verify_id', time.time() - started)
+        recorder.count(f'verify_id:{status}')
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(upload, range(args.id_uploads)))
+
+
+def print_report(title, summary, elapsed):
+    print(f"\n== {title} ({elapsed:.1f}s) ==")
+    print(f"{'stage':22s} {'count':>7s} {'/s':>7s} {'p50 ms':>8s} {'p90 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+    for stage, s in summary['stages'].items():
+        print(f"{stage:22s} {s['count']:7d} {s['per_second']:7.1f} {s['p50_ms']:8.1f} {s['p90_ms']:8.1f} "
+              f"{s['p99_ms']:8.1f} {s['max_ms']:8.1f}")
+    for name, value in summary['counters'].items():
+        print(f"  {name}: {value}")
+    if summary.get('server_stages'):
+        print(f"  {'server stage':20s} {'count':>7s} {'total ms':>10s} {'mean ms':>8s}")
+        for stage, s in summary['server_stages'].items():
+            print(f"  {stage:20s} {s['count']:7d} {s['total_ms']:10.1f} {s['mean_ms']:8.2f}")
+    if summary.get('server'):
+        print(f"  server: {summary['server']['cpu_percent']}% CPU, peak RSS {summary['server']['rss_peak_mb']} MB")
+
+
+def run_phase(title, fn, sampler, url):
+    recorder = Recorder()
+    if sampler:
+        sampler.samples.append(sampler.sample())
+        baseline = len(sampler.samples) - 1
+    stages_before = scrape_stage_totals(url)
+    started = time.time()
+    fn(recorder)
+    elapsed = time.time() - started
+    summary = recorder.summary(elapsed)
+    stages_after = scrape_stage_totals(url)
+    if stages_before is not None and stages_after is not None:
+        summary['server_stages'] = stage_deltas(stages_before, stages_after)
+    if sampler:
+        summary['server'] = summarize_samples(sampler.samples[baseline:] + [sampler.sample()])
+    summary['elapsed_s'] = round(elapsed, 1)
+    print_report(title, summary, elapsed)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--launch', action='store_true', help='start a server for the benchmark')
+    parser.add_argument('--port', type=int, default=5099, help='port for --launch')
+    parser.add_argument('--server-pid', type=int, help='pid to sample CPU/RSS of with --url')
+    parser.add_argument('--sessions', type=int, default=10, help='concurrent liveness sessions (0: skip)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds each liveness session streams')
+    parser.add_argument('--fps', type=float, default=10, help='frame rate until the server sends liveness_rate')
+    parser.add_argument('--frame-timeout', type=float, default=2.0)
+    parser.add_argument('--frames-dir', help='recorded webcam frames (JPEG) to replay')
+    parser.add_argument('--reference-face', help='face image enrolled for the simulated users')
+    parser.add_argument('--id-uploads', type=int, default=0, help='number of /verify/id uploads')
+    parser.add_argument('--id-image', help='ID card photo to upload (default: synthetic card)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent /verify/id uploads')
+    parser.add_argument('--allow-cache', action='store_true', help='upload identical bytes, hitting the result cache')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    server = None
+    if args.launch:
+        server, url = launch_server(args.port)
+        server_pid = server.pid
+    else:
+        url, server_pid = args.url.rstrip('/'), args.server_pid
+
+    sampler = ProcessSampler(server_pid) if server_pid else None
+    if sampler:
+        sampler.start()
+    results = {}
+    try:
+        if args.sessions:
+            frames = load_frames(args.frames_dir) if args.frames_dir else synthetic_frames()
+            results['liveness'] = run_phase(f"liveness: {args.sessions} sessions",
+                                            lambda recorder: run_liveness(url, args, frames, recorder), sampler, url)
+        if args.id_uploads:
+            if args.id_image:
+                with open(args.id_image, 'rb') as f:
+                    image = f.read()
+            else:
+                image = synthetic_card()
+            results['verify_id'] = run_phase(f"/verify/id: {args.id_uploads} uploads x{args.concurrency}",
+                                             lambda recorder: run_id_uploads(url, args, image, recorder), sampler, url)
+    finally:
+        if sampler:
+            sampler.stop()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
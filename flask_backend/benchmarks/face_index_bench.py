@@ -0,0 +1,62 @@
+"""
+Search latency benchmark for the duplicate-identity index.
+
+Builds an index over a synthetic clustered gallery of 128-d encodings and
+reports build time, query latency percentiles and self-recall.
+
+    python benchmarks/face_index_bench.py --size 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_index import BruteForceIndex, IVFIndex  # noqa: E402
+
+
+def synthetic_gallery(size, clusters, seed):
+    """Encodings grouped around random identities-like centres, roughly like real face embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 0.15, (clusters, 128)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, size)] + rng.normal(0, 0.05, (size, 128)).astype(np.float32)
+    return [f"user_{i}" for i in range(size)], vectors.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='number of enrolled encodings')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--backend', choices=['ivf', 'brute'], default='ivf')
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    user_ids, vectors = synthetic_gallery(args.size, max(16, args.size // 500), args.seed)
+    index = IVFIndex(nprobe=args.nprobe) if args.backend == 'ivf' else BruteForceIndex()
+
+    started = time.perf_counter()
+    index.build(user_ids, vectors)
+    print(f"build: {time.perf_counter() - started:.2f}s for {args.size} encodings ({args.backend})")
+
+    rng = np.random.default_rng(args.seed + 1)
+    targets = rng.integers(0, args.size, args.queries)
+    latencies = np.empty(args.queries)
+    hits = 0
+    for i, target in enumerate(targets):
+        query = vectors[target] + rng.normal(0, 0.01, 128).astype(np.float32)
+        started = time.perf_counter()
+        results = index.search(query, 5)
+        latencies[i] = (time.perf_counter() - started) * 1000
+        hits += bool(results) and results[0][0] == user_ids[target]
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"search: p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms over {args.queries} queries")
+    print(f"recall@1: {hits / args.queries:.3f}")
+
+
+if __name__ == '__main__':
+    main()
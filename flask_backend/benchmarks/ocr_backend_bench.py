@@ -0,0 +1,71 @@
+"""
+Per-call latency benchmark for the OCR backends.
+
+Renders synthetic ID card field crops and a full card, then times every
+available backend on them. The blank 32x32 image isolates the fixed per-call
+cost (process start, temp file, traineddata load for pytesseract), which the
+persistent tesserocr engine does not pay.
+
+    python benchmarks/ocr_backend_bench.py --calls 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_backend import TESSEROCR_AVAILABLE, PytesseractBackend, TesserocrBackend  # noqa: E402
+
+
+def text_image(lines, width, line_height=60):
+    """White image with black text lines, roughly like a binarised card crop."""
+    image = np.full((line_height * len(lines) + 20, width), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(image, line, (10, line_height * (i + 1)), cv2.FONT_HERSHEY_SIMPLEX, 1.4, 0, 3, cv2.LINE_AA)
+    return image
+
+
+def time_calls(fn, calls):
+    latencies = np.empty(calls)
+    for i in range(calls):
+        started = time.perf_counter()
+        fn()
+        latencies[i] = (time.perf_counter() - started) * 1000
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=30, help='timed calls per backend and image')
+    args = parser.parse_args()
+
+    backends = [PytesseractBackend()]
+    if TESSEROCR_AVAILABLE:
+        backends.append(TesserocrBackend())
+    else:
+        print("tesserocr is not installed, timing pytesseract only")
+
+    cases = [
+        ('blank 32x32', np.full((32, 32), 255, dtype=np.uint8), 'eng', 7, None),
+        ('TCKN field', text_image(['12345678950'], 420), 'eng', 7, '0123456789'),
+        ('full card', text_image(['T.C. KIMLIK KARTI', 'SOYADI / SURNAME', 'YILMAZ', 'ADI / GIVEN NAME', 'AYSE',
+                                  '12.03.1990   K/F', 'A12B34567   T.C.', '12.03.2030'], 1000), 'tur+eng', 6, None),
+    ]
+
+    for backend in backends:
+        started = time.perf_counter()
+        backend.warmup()
+        print(f"{backend.name}: warmup {(time.perf_counter() - started) * 1000:.0f} ms")
+        for label, image, lang, psm, whitelist in cases:
+            latencies = time_calls(lambda: backend.image_to_string(image, lang=lang, psm=psm, whitelist=whitelist),
+                                   args.calls)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(f"  {label:12s} p50 {p50:7.1f} ms, p95 {p95:7.1f} ms over {args.calls} calls")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Accuracy/cost evaluation of the OCR preprocessing variants.
+
+Runs every labeled card image through the upload front stage and then the
+OCR with each preprocessing pipeline, in both OCR modes, and reports field
+accuracy against milliseconds per image:
+- full: the pipeline preprocesses the whole card (VERIFID_OCR_PREPROCESSING)
+- layout: the pipeline preprocesses each field crop (VERIFID_LAYOUT_PREPROCESSING);
+  cards the layout result is not trusted for fall back to full-card OCR with
+  the default pipeline, as in production, and are counted as fallbacks. The labels file maps image file names to the
+expected extracted_data fields (any subset of id_number, surname, name,
+birth_date, gender, serial_number, nationality, expiry_date):
+
+    {"card_001.jpg": {"id_number": "10000000146", "surname": "YILMAZ", ...}}
+
+    python benchmarks/preprocessing_eval.py cards/ labels.json --min-accuracy 0.9
+
+The recommended variant per mode is the cheapest one meeting --min-accuracy
+(default: within 2 points of that mode's best variant).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from id_layout import extract_fields_from_layout  # noqa: E402
+from image_quality import prepare_id_image  # noqa: E402
+from ocr_utils import extract_fields_full_card  # noqa: E402
+from preprocessing import PIPELINES, run_pipeline, select_pipeline  # noqa: E402
+
+MODES = ('full', 'layout')
+MODE_SETTINGS = {'full': 'VERIFID_OCR_PREPROCESSING', 'layout': 'VERIFID_LAYOUT_PREPROCESSING'}
+
+
+def normalize(value):
+    return ' '.join(str(value).split()).upper()
+
+
+def load_cards(image_dir, labels):
+    cards = []
+    for filename, expected in sorted(labels.items()):
+        with open(os.path.join(image_dir, filename), 'rb') as f:
+            img, corners, quality = prepare_id_image(f.read())
+        if img is None:
+            print(f"skipping {filename}: {quality['reason']}")
+            continue
+        cards.append((filename, img, corners, expected))
+    return cards
+
+
+def read_card(img, corners, mode, pipeline_name):
+    """The fields one OCR mode reads with pipeline_name, and whether layout mode fell back to full-card OCR."""
+    if mode == 'layout':
+        fields = extract_fields_from_layout(img, corners=corners, pipeline=pipeline_name)
+        if fields is not None:
+            return fields, False
+        return extract_fields_full_card(img), True
+    return extract_fields_full_card(img, pipeline_name), False
+
+
+def evaluate(cards, pipeline_name, mode='full'):
+    correct = total = fallbacks = 0
+    preprocess_ms = []
+    total_ms = []
+    for _, img, corners, expected in cards:
+        if mode == 'full':
+            started = time.perf_counter()
+            run_pipeline(img, pipeline_name)
+            preprocess_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        fields, fell_back = read_card(img, corners, mode, pipeline_name)
+        total_ms.append((time.perf_counter() - started) * 1000)
+        fallbacks += fell_back
+
+        for field, value in expected.items():
+            total += 1
+            correct += normalize(fields.get(field, '')) == normalize(value)
+    return {
+        'accuracy': correct / total if total else 0.0,
+        'preprocess_ms': float(np.mean(preprocess_ms)) if preprocess_ms else None,
+        'ms_per_image': float(np.mean(total_ms)),
+        'fallbacks': fallbacks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir', help='directory with the labeled card images')
+    parser.add_argument('labels', help='JSON file mapping image file names to expected fields')
+    parser.add_argument('--variants', nargs='+', choices=sorted(PIPELINES), default=sorted(PIPELINES))
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--min-accuracy', type=float, default=None)
+    parser.add_argument('--json', help='also write the scores to this file')
+    args = parser.parse_args()
+
+    with open(args.labels, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+    cards = load_cards(args.image_dir, labels)
+    if not cards:
+        sys.exit("No readable labeled cards")
+
+    scores = {mode: {} for mode in args.modes}
+    print(f"{'mode':6s} {'variant':22s} {'accuracy':>8s} {'preproc ms':>10s} {'total ms':>9s} {'fallbacks':>9s}")
+    for mode in args.modes:
+        for name in args.variants:
+            scores[mode][name] = evaluate(cards, name, mode)
+            score = scores[mode][name]
+            preprocess = f"{score['preprocess_ms']:10.1f}" if score['preprocess_ms'] is not None else f"{'-':>10s}"
+            print(f"{mode:6s} {name:22s} {score['accuracy']:8.3f} {preprocess} {score['ms_per_image']:9.1f} "
+                  f"{score['fallbacks']:9d}")
+
+    print(f"\n{len(cards)} cards; cheapest variant per mode with accuracy within the target:")
+    recommended = {}
+    for mode, mode_scores in scores.items():
+        min_accuracy = args.min_accuracy
+        if min_accuracy is None:
+            min_accuracy = max(score['accuracy'] for score in mode_scores.values()) - 0.02
+        recommended[mode] = select_pipeline(mode_scores, min_accuracy)
+        print(f"{MODE_SETTINGS[mode]}={recommended[mode]}  (accuracy >= {min_accuracy:.3f})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'cards': len(cards), 'scores': scores, 'recommended': recommended}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# cluster.py
+"""
+Run several VerifID server processes on one machine behind the sticky proxy.
+
+Starts the Redis-protocol stand-in (unless --redis-url points at a real
+Redis), --workers copies of server.py on consecutive ports sharing it as their
+session store and Socket.IO message queue, and sticky_proxy.py on --port in
+front of them. A server process that exits is started again; its liveness
+sessions continue on another server meanwhile, and clients that reconnect
+resume where they were.
+
+    python cluster.py --workers 4 --port 5001
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY = 1.0  # Seconds before a server that exited is started again
+
+
+def server_env(port, redis_url, workers):
+    env = dict(os.environ)
+    env['VERIFID_PORT'] = str(port)
+    env['VERIFID_SESSION_STORE_URL'] = redis_url
+    env['VERIFID_MESSAGE_QUEUE_URL'] = redis_url
+    # Share the machine's cores between the servers' process pools unless told otherwise
+    env.setdefault('VERIFID_POOL_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+    return env
+
+
+def start(args, **kwargs):
+    return subprocess.Popen([sys.executable] + args, cwd=HERE, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='server processes')
+    parser.add_argument('--port', type=int, default=5001, help='port of the sticky proxy')
+    parser.add_argument('--first-server-port', type=int, default=5101)
+    parser.add_argument('--redis-url', help='use this Redis instead of starting resp_server.py')
+    parser.add_argument('--redis-port', type=int, default=6390, help='port for the resp_server.py stand-in')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s cluster: %(message)s')
+
+    processes = []
+    redis_url = args.redis_url
+    if not redis_url:
+        processes.append(start(['resp_server.py', '--port', str(args.redis_port)]))
+        redis_url = f"redis://127.0.0.1:{args.redis_port}/0"
+        time.sleep(0.5)
+
+    ports = [args.first_server_port + i for i in range(args.workers)]
+    servers = {port: start(['server.py'], env=server_env(port, redis_url, args.workers)) for port in ports}
+    processes.append(start(['sticky_proxy.py', '--port', str(args.port)] + [f"127.0.0.1:{port}" for port in ports]))
+    logger.info("%d servers on ports %s behind :%d, sessions and messages in %s",
+                args.workers, ', '.join(map(str, ports)), args.port, redis_url)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        while not stopping:
+            time.sleep(RESTART_DELAY)
+            for port, server in servers.items():
+                if server.poll() is not None:
+                    logger.warning("Server on port %d exited with %s, restarting", port, server.returncode)
+                    servers[port] = start(['server.py'], env=server_env(port, redis_url, args.workers))
+            for process in processes:
+                if process.poll() is not None:
+                    raise SystemExit(f"{process.args[1]} exited with {process.returncode}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        everything = list(servers.values()) + processes
+        for process in everything:
+            if process.poll() is None:
+                process.terminate()
+        for process in everything:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+# encoding_store.py
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+ENCODING_DTYPE = np.float32
+ENCODINGS_FILENAME = 'encodings.f32'
+INDEX_FILENAME = 'encodings_index.log'
+LEGACY_INDEX_FILENAME = 'encodings_index.json'  # Whole-index JSON of older versions, converted on open
+LOCK_FILENAME = 'encodings.lock'
+ENCODINGS_DIRNAME = 'encodings'  # Subdirectory of face_info/ holding the store, apart from the faces
+DEFAULT_LRU_SIZE = 1024
+# The index journal is compacted once it holds more than INDEX_COMPACT_RATIO records per user (and INDEX_COMPACT_MIN)
+INDEX_COMPACT_RATIO = 2
+INDEX_COMPACT_MIN = 1024
+
+
+class EncodingStore:
+    """
+    Persistent store of precomputed 128-d reference face encodings.
+
+    Encodings live in one append-only float32 file that is memory-mapped for
+    reads. The index mapping each user id to its latest row is an append-only
+    journal of {"user", "row"} records (row null: deleted); every process keeps
+    it in memory and only reads what was appended since, so an enrolment costs
+    one appended line and never a rewrite or re-parse of the whole index.
+    An in-process LRU sits in front so repeated lookups never touch the map.
+    """
+
+    def __init__(self, directory, lru_size=DEFAULT_LRU_SIZE):
+        self.directory = directory
+        self.data_path = os.path.join(directory, ENCODINGS_FILENAME)
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self.lock_path = os.path.join(directory, LOCK_FILENAME)
+        self.lru_size = lru_size
+
+        self._lock = threading.RLock()
+        self._lru = OrderedDict()
+        self._index = {}
+        self._journal = Journal(self.index_path)
+        self._matrix = None
+        self._matrix_rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        legacy_index_path = os.path.join(directory, LEGACY_INDEX_FILENAME)
+        if os.path.exists(legacy_index_path) and not os.path.exists(self.index_path):
+            self._convert_legacy_index(legacy_index_path)
+        self._reload_index()
+
+    # --- Public API ---
+
+    def get(self, user_id):
+        """Return the stored encoding for user_id, or None if it is not stored."""
+        user_id = str(user_id)
+        with self._lock:
+            # One stat() call picks up enrolments made by other worker processes
+            self._reload_index()
+            encoding = self._lru.get(user_id)
+            if encoding is not None:
+                self._lru.move_to_end(user_id)
+                return encoding
+
+            row = self._index.get(user_id)
+            if row is None:
+                return None
+
+            matrix = self._get_matrix(row + 1)
+            if matrix is None:
+                return None
+            # face_recognition works in float64; copy the row out of the map
+            encoding = np.array(matrix[row], dtype=np.float64)
+            self._remember(user_id, encoding)
+            return encoding
+
+    def put(self, user_id, encoding):
+        """Store (or overwrite) the encoding for user_id."""
+        user_id = str(user_id)
+        encoding = np.asarray(encoding, dtype=ENCODING_DTYPE).reshape(ENCODING_DIM)
+        with self._lock, self._file_lock():
+            self._reload_index()
+            # Append-only: re-enrolment writes a fresh row and repoints the index,
+            # so readers in other processes never see a half-written encoding.
+            row = self._row_count()
+            with open(self.data_path, 'ab') as f:
+                f.write(encoding.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._append_index([{'user': user_id, 'row': row}])
+            self._remember(user_id, encoding.astype(np.float64))
+
+    def delete(self, user_id):
+        """
+        Forget user_id's encoding. Its row stays in the data file, unreferenced;
+        other processes drop it from their LRU on their next index reload.
+        """
+        user_id = str(user_id)
+        with self._lock, self._file_lock():
+            self._reload_index()
+            self._lru.pop(user_id, None)
+            if user_id in self._index:
+                self._append_index([{'user': user_id, 'row': None}])
+
+    def snapshot(self):
+        """
+        Return (user_ids, encodings) for every stored user.
+
+        encodings is a float32 (n, 128) array holding each user's latest row.
+        """
+        with self._lock:
+            self._reload_index()
+            if not self._index:
+                return [], np.empty((0, ENCODING_DIM), dtype=ENCODING_DTYPE)
+            user_ids = list(self._index.keys())
+            rows = np.fromiter(self._index.values(), dtype=np.int64, count=len(user_ids))
+            matrix = self._get_matrix(int(rows.max()) + 1)
+            if matrix is None:
+                return [], np.empty((0, ENCODING_DIM), dtype=ENCODING_DTYPE)
+            return user_ids, np.asarray(matrix[rows])
+
+    def __contains__(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._reload_index()
+            return user_id in self._index
+
+    def __len__(self):
+        with self._lock:
+            self._reload_index()
+            return len(self._index)
+
+    # --- Internals ---
+
+    def _remember(self, user_id, encoding):
+        self._lru[user_id] = encoding
+        self._lru.move_to_end(user_id)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _row_count(self):
+        try:
+            size = os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+        return size // (ENCODING_DIM * np.dtype(ENCODING_DTYPE).itemsize)
+
+    def _get_matrix(self, min_rows):
+        """Return a read-only memory map with at least min_rows rows."""
+        if self._matrix is None or self._matrix_rows < min_rows:
+            rows = self._row_count()
+            if rows < min_rows:
+                logger.warning("Encoding file %s is shorter than its index", self.data_path)
+                return None
+            self._matrix = np.memmap(self.data_path, dtype=ENCODING_DTYPE, mode='r',
+                                     shape=(rows, ENCODING_DIM))
+            self._matrix_rows = rows
+        return self._matrix
+
+    def _reload_index(self):
+        """Apply the index records appended since the last call, by this or another process."""
+        records, replaced = self._journal.read_new()
+        if replaced:
+            previous, self._index = self._index, {}
+        else:
+            previous = None
+        for record in records:
+            if record['row'] is None:
+                self._index.pop(record['user'], None)
+            else:
+                self._index[record['user']] = record['row']
+        if self._lru and previous is None:
+            for record in records:
+                self._lru.pop(record['user'], None)  # Re-enrolled or deleted by another process
+        if previous is not None:
+            # Compacted by another process: only users whose row changed lose their cached encoding
+            for user_id in [uid for uid in self._lru if previous.get(uid) != self._index.get(uid)]:
+                del self._lru[user_id]
+
+    def _append_index(self, records):
+        """Append records under the file lock and compact the journal once most of it is superseded."""
+        self._journal.append(records)
+        self._reload_index()
+        if self._journal.records > max(INDEX_COMPACT_MIN, INDEX_COMPACT_RATIO * len(self._index)):
+            self._journal.rewrite([{'user': user_id, 'row': row} for user_id, row in self._index.items()])
+
+    def _convert_legacy_index(self, legacy_index_path):
+        with self._file_lock():
+            if os.path.exists(self.index_path):
+                return  # Another process got here first
+            try:
+                with open(legacy_index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error("Could not read encoding index %s: %s", legacy_index_path, e)
+                return
+            self._journal.rewrite([{'user': user_id, 'row': row} for user_id, row in index.items()])
+            self._index = index
+        logger.info("Converted %s to the append-only index (%d users)", legacy_index_path, len(index))
+
+    def _file_lock(self):
+        return InterProcessLock(self.lock_path)
+
+
+class Journal:
+    """
+    Append-only JSON-lines file read incrementally: read_new() returns only
+    the records appended since the last call, from this or any other process.
+    rewrite() replaces the file atomically; writers must hold a common lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offset = 0
+        self._file_id = None  # (st_dev, st_ino) of the file read so far
+        self.records = 0  # Records read from the current file
+
+    @staticmethod
+    def _encode(records):
+        return b''.join(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in records)
+
+    def append(self, records):
+        with open(self.path, 'ab') as f:
+            f.write(self._encode(records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rewrite(self, records):
+        """Replace the file with records, e.g. to compact it. This reader continues after them."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._encode(records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        stat = os.stat(self.path)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        self._offset = stat.st_size
+        self.records = len(records)
+
+    def read_new(self):
+        """
+        Records appended since the last call, and whether the file was
+        replaced meanwhile. If it was, the records are all of the new file's
+        and every record read before no longer applies.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return [], False
+        if (stat.st_dev, stat.st_ino) == self._file_id and stat.st_size == self._offset:
+            return [], False
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            replaced = (stat.st_dev, stat.st_ino) != self._file_id or stat.st_size < self._offset
+            if replaced:
+                self._file_id = (stat.st_dev, stat.st_ino)
+                self._offset = 0
+                self.records = 0
+            f.seek(self._offset)
+            data = f.read(stat.st_size - self._offset)
+        end = data.rfind(b'\n') + 1  # A line still being written is picked up next time
+        self._offset += end
+        lines = [line for line in data[:end].split(b'\n') if line]
+        records = json.loads(b'[' + b','.join(lines) + b']') if lines else []  # One parse, not one per line
+        self.records += len(records)
+        return records, replaced
+
+
+class InterProcessLock:
+    """Exclusive advisory lock so several worker processes can append safely."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def move_store_files(old_directory, directory):
+    """Move a store that older versions kept directly in face_info/ to directory."""
+    if not os.path.exists(os.path.join(old_directory, ENCODINGS_FILENAME)):
+        return
+    os.makedirs(directory, exist_ok=True)
+    with InterProcessLock(os.path.join(directory, LOCK_FILENAME)):
+        # The data file goes last: while it is in old_directory, the move is not done
+        for filename in (INDEX_FILENAME, LEGACY_INDEX_FILENAME, ENCODINGS_FILENAME):
+            try:
+                os.replace(os.path.join(old_directory, filename), os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+    logger.info("Moved the encoding store from %s to %s", old_directory, directory)
+
+
+def get_encoding_store(face_info_dir):
+    """Return the process-wide EncodingStore for face_info_dir, kept in its encodings/ subdirectory."""
+    key = os.path.abspath(face_info_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            directory = os.path.join(key, ENCODINGS_DIRNAME)
+            move_store_files(key, directory)
+            store = EncodingStore(directory)
+            _stores[key] = store
+        return store
@@ -0,0 +1,393 @@
+# face_assets.py
+"""
+Reference face assets: the face crop saved from each user's ID card, with
+its metadata (detection box, quality). Its encoding is kept in the encoding
+store only.
+
+Images and their JSON metadata are content-addressed blobs, stored once
+under their SHA-256. A user id points at its current image and metadata
+through an append-only journal (assets/refs.log), so re-enrolment never
+rewrites anything in place and concurrent writers only append. Every process
+keeps the journal as an in-memory index and reads only what other processes
+appended since, so a lookup costs one stat() and no directory scan.
+
+Two blob backends, chosen with VERIFID_FACE_ASSET_BACKEND:
+- directory: one file per blob in hash-sharded directories
+  (assets/objects/ab/cd/<sha256>.jpg), written atomically
+- pack: all blobs appended to one pack file with an offset journal, a local
+  stand-in for an object store or archive that does not want many small files
+
+The journal is rewritten from the index once most of its records are
+superseded (re-enrolments, deletions); readers notice the new file and read
+it from the start.
+
+Faces saved as face_info/<user_id>.jpg by older versions are imported by a
+one-time migration (import_legacy_faces), which the server runs at startup
+and `python face_assets.py` runs on demand, e.g. once the last server of the
+old version is gone after a rolling deploy. Each imported file is moved to
+face_info/legacy_imported/, so lookups never look at face_info/ itself.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from encoding_store import InterProcessLock, Journal, get_encoding_store
+
+logger = logging.getLogger(__name__)
+
+FACE_INFO_DIR = os.environ.get(
+    'VERIFID_FACE_INFO_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'face_info'))
+FACE_ASSET_BACKEND = os.environ.get('VERIFID_FACE_ASSET_BACKEND', 'directory')
+ASSETS_DIRNAME = 'assets'
+METADATA_CACHE_SIZE = 4096  # Metadata of recently used assets kept in memory
+# refs.log is compacted once it holds more than REFS_COMPACT_RATIO records per user (and REFS_COMPACT_MIN in all)
+REFS_COMPACT_RATIO = 2
+REFS_COMPACT_MIN = 1024
+LEGACY_IMPORTED_DIRNAME = 'legacy_imported'  # Where imported face_info/<user_id>.jpg files are moved
+LEGACY_IMPORT_BATCH = 256  # Legacy files imported per refs.log append
+
+
+class DirectoryBlobs:
+    """Immutable blobs as files under two levels of hash-sharded directories."""
+
+    name = 'directory'
+
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, 'objects')
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:4], key)
+
+    def put(self, key, data):
+        path = self.path(key)
+        if os.path.exists(path):
+            return  # Content-addressed: already stored
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)  # Readers never see a partial blob
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def location(self, key):
+        return self.path(key)
+
+
+class PackBlobs:
+    """
+    Immutable blobs appended to one pack file. A journal of (key, offset,
+    length) records is written after the blob data is on disk, so readers
+    never see a blob that is not complete.
+    """
+
+    name = 'pack'
+
+    def __init__(self, directory):
+        os.makedirs(os.path.join(directory, 'pack'), exist_ok=True)
+        self.pack_path = os.path.join(directory, 'pack', 'faces.pack')
+        self._journal = Journal(os.path.join(directory, 'pack', 'faces.idx'))
+        self._lock_path = os.path.join(directory, 'pack', 'faces.lock')
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        records, replaced = self._journal.read_new()
+        if replaced:
+            self._offsets.clear()
+        for record in records:
+            self._offsets[record['key']] = (record['offset'], record['length'])
+
+    def put(self, key, data):
+        with self._lock, InterProcessLock(self._lock_path):
+            self._refresh()
+            if key in self._offsets:
+                return
+            with open(self.pack_path, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal.append([{'key': key, 'offset': offset, 'length': len(data)}])
+            self._offsets[key] = (offset, len(data))
+
+    def get(self, key):
+        with self._lock:
+            self._refresh()
+            entry = self._offsets.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        with open(self.pack_path, 'rb') as f:
+            return os.pread(f.fileno(), length, offset)
+
+    def location(self, key):
+        return f"{self.pack_path}#{key}"
+
+
+BACKENDS = {'directory': DirectoryBlobs, 'pack': PackBlobs}
+
+
+class FaceAssetStore:
+    """Reference faces by user id over a blob backend, with the user index cached in memory."""
+
+    def __init__(self, face_info_dir, backend=FACE_ASSET_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown face asset backend: {backend} (known: {', '.join(BACKENDS)})")
+        self.face_info_dir = face_info_dir
+        self.directory = os.path.join(face_info_dir, ASSETS_DIRNAME)
+        os.makedirs(self.directory, exist_ok=True)
+        self.blobs = BACKENDS[backend](self.directory)
+        self._refs = Journal(os.path.join(self.directory, 'refs.log'))
+        self._lock_path = os.path.join(self.directory, 'refs.lock')
+        self._index = {}  # user_id -> (image digest, metadata digest)
+        self._metadata = OrderedDict()  # LRU of metadata digest -> metadata; immutable, so never stale
+        self._lock = threading.RLock()
+        with self._lock:
+            self._read_refs()
+
+    # --- Public API ---
+
+    def save(self, user_id, jpeg, box=None, quality=None):
+        """
+        Store jpeg as user_id's reference face and point the user at it. Its
+        encoding goes to the encoding store (see ocr_utils.store_reference_face).
+
+        Returns:
+            dict: the asset's metadata, including "location" of the image
+        """
+        user_id = str(user_id)
+        digest = hashlib.sha256(jpeg).hexdigest()
+        metadata = {
+            'image': digest,
+            'bytes': len(jpeg),
+            'box': [int(value) for value in box] if box is not None else None,
+            'quality': quality,
+            'created_at': time.time(),
+        }
+        meta = self._put_asset(jpeg, metadata)
+        with self._lock:
+            self._append_refs([{'user': user_id, 'image': digest, 'meta': meta}])
+            self._remember(meta, metadata)
+        return dict(metadata, location=self.blobs.location(digest + '.jpg'))
+
+    def get(self, user_id):
+        """user_id's current asset metadata (see save), or None."""
+        with self._lock:
+            ref = self._lookup(user_id)
+            if ref is None:
+                return None
+            digest, meta = ref
+            metadata = self._metadata.get(meta)
+            if metadata is not None:
+                self._metadata.move_to_end(meta)
+        if metadata is None:
+            metadata = self._load_metadata(meta)
+            if metadata is None:
+                logger.error("Face asset %s of user %s has no metadata", meta, user_id)
+                return None
+        return dict(metadata, location=self.blobs.location(digest + '.jpg'))
+
+    def read_image(self, user_id):
+        """JPEG bytes of user_id's reference face, or None."""
+        with self._lock:
+            ref = self._lookup(user_id)
+        return self.blobs.get(ref[0] + '.jpg') if ref is not None else None
+
+    def delete(self, user_id):
+        """
+        Unlink user_id from its face; the content-addressed blobs stay. A flat
+        file of an older version is removed too, imported or not.
+        """
+        with self._lock:
+            for directory in (self.face_info_dir, os.path.join(self.face_info_dir, LEGACY_IMPORTED_DIRNAME)):
+                try:
+                    os.remove(os.path.join(directory, f"{user_id}.jpg"))
+                except FileNotFoundError:
+                    pass
+            if self._lookup(user_id) is not None:
+                self._append_refs([{'user': str(user_id), 'image': None, 'meta': None}])
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return self._lookup(user_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._read_refs()
+            return len(self._index)
+
+    def import_legacy_files(self):
+        """
+        Import the flat face_info/<user_id>.jpg files of older versions and
+        move each to face_info/legacy_imported/. A file older than the user's
+        current face is moved without being imported; one still being written
+        by an old server is left for the next run. The precomputed encoding of
+        a user whose face is replaced is dropped.
+
+        Returns:
+            int: number of faces imported
+        """
+        with os.scandir(self.face_info_dir) as entries:
+            names = sorted(entry.name for entry in entries if entry.is_file() and entry.name.endswith('.jpg'))
+        if not names:
+            return 0
+        os.makedirs(os.path.join(self.face_info_dir, LEGACY_IMPORTED_DIRNAME), exist_ok=True)
+        imported = 0
+        for start in range(0, len(names), LEGACY_IMPORT_BATCH):
+            imported += self._import_legacy_batch(names[start:start + LEGACY_IMPORT_BATCH])
+        logger.info("Imported %d of %d legacy face images from %s", imported, len(names), self.face_info_dir)
+        return imported
+
+    # --- Internals ---
+
+    def _lookup(self, user_id):
+        self._read_refs()
+        return self._index.get(str(user_id))
+
+    def _put_asset(self, jpeg, metadata):
+        """Store the image and metadata blobs and return the metadata's digest."""
+        data = json.dumps(metadata, sort_keys=True).encode('utf-8')
+        meta = hashlib.sha256(data).hexdigest()
+        # Blobs first: a user id is only ever pointed at complete assets
+        self.blobs.put(metadata['image'] + '.jpg', jpeg)
+        self.blobs.put(meta + '.json', data)
+        return meta
+
+    def _load_metadata(self, meta):
+        metadata = self._metadata.get(meta)
+        if metadata is None:
+            data = self.blobs.get(meta + '.json')
+            if data is None:
+                return None
+            metadata = json.loads(data)
+            with self._lock:
+                self._remember(meta, metadata)
+        return metadata
+
+    def _remember(self, meta, metadata):
+        self._metadata[meta] = metadata
+        self._metadata.move_to_end(meta)
+        while len(self._metadata) > METADATA_CACHE_SIZE:
+            self._metadata.popitem(last=False)
+
+    def _read_refs(self):
+        records, replaced = self._refs.read_new()
+        if replaced:
+            self._index.clear()  # Compacted by another process: the new file is the whole index
+        for record in records:
+            if record['image'] is None:
+                self._index.pop(record['user'], None)
+            else:
+                self._index[record['user']] = (record['image'], record['meta'])
+
+    def _append_refs(self, records):
+        with InterProcessLock(self._lock_path):
+            self._refs.append(records)
+            self._read_refs()
+            self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        """Rewrite refs.log from the index once most of its records are superseded. Needs the lock file."""
+        if self._refs.records <= max(REFS_COMPACT_MIN, REFS_COMPACT_RATIO * len(self._index)):
+            return
+        superseded = self._refs.records - len(self._index)
+        self._refs.rewrite([{'user': user_id, 'image': image, 'meta': meta}
+                            for user_id, (image, meta) in self._index.items()])
+        logger.info("Compacted %s, dropping %d superseded records", self._refs.path, superseded)
+
+    def _newer_than_current(self, user_id, mtime):
+        with self._lock:
+            ref = self._index.get(user_id)
+        current = self._load_metadata(ref[1]) if ref is not None else None
+        return current is None or current['created_at'] < mtime
+
+    def _import_legacy_batch(self, names):
+        # Blobs are written without holding a lock: content-addressed, they only count once a record points at them
+        candidates, done = [], []
+        with self._lock:
+            self._read_refs()
+        for name in names:
+            path = os.path.join(self.face_info_dir, name)
+            try:
+                with open(path, 'rb') as f:
+                    mtime = os.fstat(f.fileno()).st_mtime
+                    jpeg = f.read()
+            except FileNotFoundError:
+                continue  # Moved by another process
+            if not jpeg.endswith(b'\xff\xd9'):
+                continue  # Still being written by an old server
+            done.append(name)
+            user_id = name[:-len('.jpg')]
+            if self._newer_than_current(user_id, mtime):
+                metadata = {'image': hashlib.sha256(jpeg).hexdigest(), 'bytes': len(jpeg),
+                            'box': None, 'quality': None, 'created_at': mtime}
+                candidates.append((user_id, mtime, {'user': user_id, 'image': metadata['image'],
+                                                    'meta': self._put_asset(jpeg, metadata)}))
+
+        with self._lock, InterProcessLock(self._lock_path):
+            self._read_refs()  # Re-enrolled or imported by another process meanwhile
+            records = [record for user_id, mtime, record in candidates if self._newer_than_current(user_id, mtime)]
+            if records:
+                self._refs.append(records)
+                self._read_refs()
+                self._compact_if_needed()
+            # Moved only once refs.log points at the imported faces
+            for name in done:
+                try:
+                    os.replace(os.path.join(self.face_info_dir, name),
+                               os.path.join(self.face_info_dir, LEGACY_IMPORTED_DIRNAME, name))
+                except FileNotFoundError:
+                    pass
+        if records:
+            encodings = get_encoding_store(self.face_info_dir)
+            for record in records:
+                encodings.delete(record['user'])
+        return len(records)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_face_asset_store(face_info_dir=FACE_INFO_DIR):
+    """Return the process-wide FaceAssetStore for face_info_dir."""
+    key = os.path.abspath(face_info_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = FaceAssetStore(key)
+            _stores[key] = store
+        return store
+
+
+def import_legacy_faces(face_info_dir=FACE_INFO_DIR):
+    """One-time migration of older versions' face_info/<user_id>.jpg files; see FaceAssetStore.import_legacy_files."""
+    return get_face_asset_store(face_info_dir).import_legacy_files()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    print(f"Imported {import_legacy_faces()} legacy face images")
+
+
+if __name__ == '__main__':
+    main()
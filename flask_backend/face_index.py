@@ -0,0 +1,248 @@
+# face_index.py
+"""
+1:N search over all enrolled face encodings, used to flag ID cards whose
+face already belongs to another account.
+
+Two backends share one interface:
+- BruteForceIndex: one float32 matrix scanned with a single matrix-vector
+  product. Exact, and fastest for small galleries.
+- IVFIndex: an inverted-file index. A k-means coarse quantizer splits the
+  gallery into lists and a query only scans the nprobe lists closest to it, so
+  search cost grows with gallery size / nlist instead of gallery size.
+
+DuplicateFaceIndex picks the backend from the gallery size.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+DUPLICATE_DISTANCE_THRESHOLD = 0.5  # Below face_recognition's 0.6 default to keep false flags rare
+DUPLICATE_SEARCH_K = 5
+BRUTE_FORCE_MAX_SIZE = 20000  # Galleries above this use the IVF index
+IVF_NPROBE = 8
+IVF_TRAIN_SAMPLE = 65536  # Vectors used to train the coarse quantizer
+IVF_TRAIN_ITERATIONS = 10
+IVF_REBUILD_FRACTION = 0.05  # Rebuild once this fraction of the gallery sits in the overflow buffer
+ASSIGN_BATCH_SIZE = 65536
+
+
+def _as_query(encoding):
+    return np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM)
+
+
+def _top_k(distances, k):
+    """Indices of the k smallest distances, sorted ascending."""
+    if len(distances) > k:
+        candidates = np.argpartition(distances, k)[:k]
+    else:
+        candidates = np.arange(len(distances))
+    return candidates[np.argsort(distances[candidates])]
+
+
+def _squared_distances(vectors, norms, query, query_norm):
+    # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, one matrix-vector product for the whole block
+    return np.maximum(norms - 2.0 * (vectors @ query) + query_norm, 0.0)
+
+
+class BruteForceIndex:
+    """Exact search over a growable float32 matrix with precomputed squared norms."""
+
+    def __init__(self, dim=ENCODING_DIM):
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._ids = []
+        self._row_of = {}
+        self._size = 0
+
+    def build(self, user_ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._vectors = vectors.copy()
+        self._norms = np.einsum('ij,ij->i', vectors, vectors)
+        self._ids = list(user_ids)
+        self._row_of = {user_id: row for row, user_id in enumerate(self._ids)}
+        self._size = len(self._ids)
+
+    def add(self, user_id, encoding):
+        vector = _as_query(encoding)
+        row = self._row_of.get(user_id)
+        if row is None:
+            row = self._size
+            if row >= len(self._vectors):
+                # Grow geometrically so repeated enrolments stay amortised O(1)
+                capacity = max(16, 2 * len(self._vectors))
+                self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+                self._norms = np.resize(self._norms, capacity)
+            self._ids.append(user_id)
+            self._row_of[user_id] = row
+            self._size += 1
+        self._vectors[row] = vector
+        self._norms[row] = vector @ vector
+
+    def search(self, encoding, k=DUPLICATE_SEARCH_K):
+        """Return [(user_id, distance)] for the k nearest encodings."""
+        if self._size == 0:
+            return []
+        query = _as_query(encoding)
+        distances = _squared_distances(self._vectors[:self._size], self._norms[:self._size], query, query @ query)
+        return [(self._ids[i], float(np.sqrt(distances[i]))) for i in _top_k(distances, k)]
+
+    def __len__(self):
+        return self._size
+
+
+class IVFIndex:
+    """
+    Inverted-file index with a k-means coarse quantizer.
+
+    Vectors are stored grouped by list in one contiguous matrix (CSR-style
+    offsets), so probing a list is a slice, not a copy. Encodings added after
+    the build go to a small brute-force overflow buffer and replace any older
+    entry of the same user.
+    """
+
+    def __init__(self, nlist=None, nprobe=IVF_NPROBE, train_sample=IVF_TRAIN_SAMPLE,
+                 iterations=IVF_TRAIN_ITERATIONS, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self.iterations = iterations
+        self._rng = np.random.default_rng(seed)
+        self._centroids = None
+        self._centroid_norms = None
+        self._vectors = None
+        self._norms = None
+        self._ids = None
+        self._offsets = None
+        self._row_of = {}
+        self._stale = np.zeros(0, dtype=bool)
+        self._overflow = BruteForceIndex()
+
+    def build(self, user_ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        self._centroids = self._train(vectors, min(nlist, n))
+        self._centroid_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+
+        assignments = self._assign(vectors)
+        order = np.argsort(assignments, kind='stable')
+        self._vectors = vectors[order]
+        self._norms = np.einsum('ij,ij->i', self._vectors, self._vectors)
+        ids = np.asarray(user_ids, dtype=object)
+        self._ids = ids[order]
+        counts = np.bincount(assignments, minlength=len(self._centroids))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._row_of = {user_id: row for row, user_id in enumerate(self._ids)}
+        self._stale = np.zeros(n, dtype=bool)
+        self._overflow = BruteForceIndex()
+
+    def _train(self, vectors, nlist):
+        sample_size = min(len(vectors), max(self.train_sample, nlist))
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[self._rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            norms = np.einsum('ij,ij->i', centroids, centroids)
+            assignments = np.argmin(norms[None, :] - 2.0 * (sample @ centroids.T), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    def _assign(self, vectors):
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+            block = vectors[start:start + ASSIGN_BATCH_SIZE]
+            scores = self._centroid_norms[None, :] - 2.0 * (block @ self._centroids.T)
+            assignments[start:start + ASSIGN_BATCH_SIZE] = np.argmin(scores, axis=1)
+        return assignments
+
+    def add(self, user_id, encoding):
+        row = self._row_of.pop(user_id, None)
+        if row is not None:
+            self._stale[row] = True
+        self._overflow.add(user_id, encoding)
+
+    @property
+    def overflow_size(self):
+        return len(self._overflow)
+
+    def search(self, encoding, k=DUPLICATE_SEARCH_K):
+        query = _as_query(encoding)
+        query_norm = query @ query
+        results = self._overflow.search(query, k)
+        if self._centroids is None:
+            return results
+
+        probe_scores = self._centroid_norms - 2.0 * (self._centroids @ query)
+        probes = _top_k(probe_scores, min(self.nprobe, len(self._centroids)))
+        for list_id in probes:
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            if start == end:
+                continue
+            distances = _squared_distances(self._vectors[start:end], self._norms[start:end], query, query_norm)
+            distances[self._stale[start:end]] = np.inf
+            for i in _top_k(distances, k):
+                if np.isfinite(distances[i]):
+                    results.append((self._ids[start + i], float(np.sqrt(distances[i]))))
+
+        results.sort(key=lambda item: item[1])
+        return results[:k]
+
+    def __len__(self):
+        return len(self._row_of) + len(self._overflow)
+
+
+class DuplicateFaceIndex:
+    """Duplicate-identity search over the enrolled gallery, choosing the backend by size."""
+
+    def __init__(self, brute_force_max=BRUTE_FORCE_MAX_SIZE):
+        self.brute_force_max = brute_force_max
+        self._backend = BruteForceIndex()
+        self._lock = threading.RLock()
+        self.built_at = None
+
+    def build(self, user_ids, vectors):
+        started = time.time()
+        backend = BruteForceIndex() if len(user_ids) <= self.brute_force_max else IVFIndex()
+        backend.build(user_ids, vectors)
+        with self._lock:
+            self._backend = backend
+            self.built_at = time.time()
+        logger.info("Built %s over %d encodings in %.2fs", type(backend).__name__, len(user_ids),
+                    self.built_at - started)
+
+    def build_from_store(self, encoding_store):
+        self.build(*encoding_store.snapshot())
+
+    def add(self, user_id, encoding):
+        with self._lock:
+            self._backend.add(user_id, encoding)
+
+    def needs_rebuild(self, gallery_size):
+        """True if the gallery outgrew the brute-force backend or the IVF overflow buffer."""
+        with self._lock:
+            backend = self._backend
+            if isinstance(backend, BruteForceIndex):
+                return gallery_size > self.brute_force_max
+            return backend.overflow_size > IVF_REBUILD_FRACTION * max(len(backend), 1)
+
+    def find_duplicates(self, encoding, exclude_user_id=None, threshold=DUPLICATE_DISTANCE_THRESHOLD,
+                        k=DUPLICATE_SEARCH_K):
+        """
+        Return [(user_id, distance)] of other enrolled users closer than threshold.
+        """
+        with self._lock:
+            backend = self._backend
+        candidates = backend.search(encoding, k + 1)
+        return [(user_id, distance) for user_id, distance in candidates
+                if distance <= threshold and user_id != exclude_user_id][:k]
+
+    def __len__(self):
+        return len(self._backend)
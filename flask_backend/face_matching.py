@@ -0,0 +1,67 @@
+# face_matching.py
+"""
+Multi-frame face match decisions.
+
+During the liveness sequence the session samples encodings of good frames
+into a fixed-size ring buffer. The final decision is made from robust
+statistics of all their distances to the reference, computed in one
+vectorized pass, so a single blurry or badly lit frame cannot fail the match.
+"""
+import numpy as np
+
+ENCODING_DIM = 128
+ENCODING_BUFFER_SIZE = 8  # Encodings kept per session
+ENCODING_SAMPLE_INTERVAL = 0.5  # Minimum seconds between two sampled frames
+MIN_SAMPLES_WITHOUT_FINAL_FRAME = 3  # Samples needed to decide when the final frame has no usable face
+TRIM_FRACTION = 0.2  # Fraction cut from each end for the trimmed mean
+MATCH_STATISTIC = 'median'  # Statistic compared against the tolerance
+
+
+class EncodingRingBuffer:
+    """Preallocated ring buffer of face encodings; the oldest sample is overwritten when full."""
+
+    def __init__(self, capacity=ENCODING_BUFFER_SIZE, dim=ENCODING_DIM):
+        self._data = np.zeros((capacity, dim), dtype=np.float64)
+        self._count = 0
+        self._next = 0
+
+    def add(self, encoding):
+        self._data[self._next] = encoding
+        self._next = (self._next + 1) % len(self._data)
+        self._count = min(self._count + 1, len(self._data))
+
+    def clear(self):
+        """Drop all samples, e.g. when the face in view may have changed."""
+        self._count = 0
+        self._next = 0
+
+    def encodings(self):
+        """Return the stored encodings as a (n, dim) array (a view, no copy)."""
+        return self._data[:self._count]
+
+    def __len__(self):
+        return self._count
+
+
+def distance_statistics(reference_encoding, encodings, trim_fraction=TRIM_FRACTION):
+    """
+    Distances of all encodings to the reference, summarised.
+
+    Returns:
+        dict: median, trimmed_mean, min, max and count of the Euclidean distances
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+    distances = np.sort(np.linalg.norm(encodings - np.asarray(reference_encoding, dtype=np.float64), axis=1))
+    count = len(distances)
+    if count == 0:
+        return {'median': None, 'trimmed_mean': None, 'min': None, 'max': None, 'count': 0}
+
+    cut = int(count * trim_fraction)
+    trimmed = distances[cut:count - cut] if count - 2 * cut > 0 else distances
+    return {
+        'median': float(np.median(distances)),
+        'trimmed_mean': float(trimmed.mean()),
+        'min': float(distances[0]),
+        'max': float(distances[-1]),
+        'count': count,
+    }
@@ -0,0 +1,97 @@
+# face_tracker.py
+"""
+Lightweight face tracking between full HOG detections.
+
+The liveness check only needs the horizontal face centre, so between periodic
+detections the face box is followed by normalized template matching on a small
+region around its last position. Matching is done on a downscaled grayscale
+copy, which makes a tracking step a tiny fraction of a HOG scan.
+
+Tracker state is a plain dict of numpy arrays and ints so it can be stored in
+the verification session and shipped to worker processes. An empty dict means
+tracking is on but no face is currently being tracked.
+"""
+import cv2
+
+TRACKER_REDETECT_INTERVAL = 5  # Run a full detection at least every Nth frame
+TRACKER_MIN_CONFIDENCE = 0.6  # Normalized correlation below which we re-detect
+TRACKER_SEARCH_MARGIN = 0.6  # Search window padding, as a fraction of the face size
+TRACKER_TEMPLATE_WIDTH = 48  # Template width in pixels after downscaling
+
+
+def _to_gray(frame):
+    return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def _scaled_template(gray, face_location, scale):
+    top, right, bottom, left = face_location
+    crop = gray[max(0, top):bottom, max(0, left):right]
+    if crop.size == 0:
+        return None
+    return cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def new_tracker_state(frame, face_location):
+    """Start tracking face_location (top, right, bottom, left) found by a full detection."""
+    top, right, bottom, left = face_location
+    scale = TRACKER_TEMPLATE_WIDTH / float(max(right - left, 1))
+    template = _scaled_template(_to_gray(frame), face_location, scale)
+    if template is None:
+        return None
+    return {
+        'face_location': tuple(int(v) for v in face_location),
+        'template': template,
+        'scale': scale,
+        'frame_width': frame.shape[1],
+        'frames_since_detection': 0,
+    }
+
+
+def needs_detection(tracker_state):
+    """True if the next frame should get a full detection instead of a tracking step."""
+    return not tracker_state or tracker_state['frames_since_detection'] >= TRACKER_REDETECT_INTERVAL
+
+
+def update_tracker(frame, tracker_state):
+    """
+    Follow the tracked face into frame.
+
+    Returns:
+        tuple: (face_location, confidence); face_location is None when the
+        match is below TRACKER_MIN_CONFIDENCE and a re-detection is needed.
+        tracker_state is updated in place on success.
+    """
+    gray = _to_gray(frame)
+    top, right, bottom, left = tracker_state['face_location']
+    width, height = right - left, bottom - top
+    pad_x = int(width * TRACKER_SEARCH_MARGIN)
+    pad_y = int(height * TRACKER_SEARCH_MARGIN)
+
+    roi_top = max(0, top - pad_y)
+    roi_left = max(0, left - pad_x)
+    roi_bottom = min(gray.shape[0], bottom + pad_y)
+    roi_right = min(gray.shape[1], right + pad_x)
+
+    scale = tracker_state['scale']
+    template = tracker_state['template']
+    roi = cv2.resize(gray[roi_top:roi_bottom, roi_left:roi_right], None,
+                     fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if roi.shape[0] < template.shape[0] or roi.shape[1] < template.shape[1]:
+        return None, 0.0
+
+    scores = cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED)
+    _, confidence, _, (match_x, match_y) = cv2.minMaxLoc(scores)
+    if confidence < TRACKER_MIN_CONFIDENCE:
+        return None, float(confidence)
+
+    new_left = roi_left + int(round(match_x / scale))
+    new_top = roi_top + int(round(match_y / scale))
+    face_location = (new_top, new_left + width, new_top + height, new_left)
+
+    # Refresh the template so gradual head turns do not erode the match
+    refreshed = _scaled_template(gray, face_location, scale)
+    if refreshed is not None and refreshed.shape == template.shape:
+        tracker_state['template'] = refreshed
+    tracker_state['face_location'] = face_location
+    tracker_state['frames_since_detection'] += 1
+    return face_location, float(confidence)
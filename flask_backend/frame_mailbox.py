@@ -0,0 +1,61 @@
+# frame_mailbox.py
+import threading
+import time
+
+
+class FrameMailbox:
+    """
+    Single-slot, latest-frame-wins mailbox per verification session.
+
+    A newer frame replaces an unprocessed older one, and only one caller per
+    session (the one that acquired it) processes frames at a time. Memory and
+    latency per session stay bounded however fast a client sends.
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def put(self, session_id, frame_data):
+        """
+        Park a frame for session_id, stamped with its arrival time.
+
+        Returns:
+            bool: True if an unprocessed older frame was replaced
+        """
+        with self._lock:
+            replaced = session_id in self._slots
+            self._slots[session_id] = (frame_data, time.time())
+            return replaced
+
+    def acquire(self, session_id):
+        """Become the frame processor for session_id. Returns False if another caller already is."""
+        with self._lock:
+            if session_id in self._busy:
+                return False
+            self._busy.add(session_id)
+            return True
+
+    def next_frame(self, session_id):
+        """
+        Take the latest frame for session_id as (frame_data, received_at).
+
+        Returns None and releases the session when the slot is empty; both
+        happen under one lock so a frame parked meanwhile is never stranded.
+        """
+        with self._lock:
+            frame = self._slots.pop(session_id, None)
+            if frame is None:
+                self._busy.discard(session_id)
+            return frame
+
+    def release(self, session_id):
+        """Give up processing for session_id without draining its slot."""
+        with self._lock:
+            self._busy.discard(session_id)
+
+    def discard(self, session_id):
+        """Drop any parked frame for session_id."""
+        with self._lock:
+            self._slots.pop(session_id, None)
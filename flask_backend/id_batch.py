@@ -0,0 +1,143 @@
+# id_batch.py
+"""
+Batch ID card verification for back-office re-verification.
+
+Card images are streamed one at a time from a zip archive or a directory and
+fanned out across a process pool, with a bounded number in flight, so memory
+use does not grow with the batch; one NDJSON record is produced per card as
+soon as it finishes. Used by the /verify/id/batch endpoint and as a CLI:
+
+    python id_batch.py cards.zip --workers 8 > results.ndjson
+    python id_batch.py ./cards --user-data users.json
+
+users.json optionally maps card file names to the userData object that
+/verify/id would receive, to compare extracted fields against.
+"""
+import argparse
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+IN_FLIGHT_PER_WORKER = 2  # Cards read ahead per worker, so workers never wait for the next one
+# Decompressed size limits for zip archives, so a zip bomb cannot exhaust memory
+MAX_CARD_BYTES = int(os.environ.get('VERIFID_BATCH_MAX_CARD_BYTES', 16 * 1024 * 1024))
+MAX_ARCHIVE_BYTES = int(os.environ.get('VERIFID_BATCH_MAX_ARCHIVE_BYTES', 2 * 1024 * 1024 * 1024))
+
+
+class ArchiveTooLargeError(ValueError):
+    """A zip member or the archive as a whole decompresses to more than the limits allow."""
+
+
+def is_card_image(name):
+    base = os.path.basename(name)
+    return not base.startswith('.') and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_card_images(source):
+    """
+    Yield (name, image_bytes) for every card image in source.
+
+    source is a directory path, a zip file path or a file-like zip archive.
+    Raises ArchiveTooLargeError, once reached, for a zip member larger than
+    MAX_CARD_BYTES or an archive larger than MAX_ARCHIVE_BYTES in total.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for filename in sorted(files):
+                if is_card_image(filename):
+                    path = os.path.join(root, filename)
+                    with open(path, 'rb') as f:
+                        yield os.path.relpath(path, source), f.read()
+        return
+
+    total = 0
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_card_image(info.filename):
+                continue
+            if info.file_size > MAX_CARD_BYTES:
+                raise ArchiveTooLargeError(f"{info.filename} is larger than {MAX_CARD_BYTES} bytes")
+            # The header's size can lie; never decompress more than the limit
+            with archive.open(info) as member:
+                data = member.read(MAX_CARD_BYTES + 1)
+            if len(data) > MAX_CARD_BYTES:
+                raise ArchiveTooLargeError(f"{info.filename} is larger than {MAX_CARD_BYTES} bytes")
+            total += len(data)
+            if total > MAX_ARCHIVE_BYTES:
+                raise ArchiveTooLargeError(f"archive is larger than {MAX_ARCHIVE_BYTES} bytes uncompressed")
+            yield info.filename, data
+
+
+def to_ndjson(record):
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def validate_user_data(user_data_by_file):
+    """Raise ValueError unless user_data_by_file maps file names to userData objects."""
+    if not isinstance(user_data_by_file, dict):
+        raise ValueError('userData must be a JSON object keyed by file name')
+    for name, user_data in user_data_by_file.items():
+        if user_data is not None and not isinstance(user_data, dict):
+            raise ValueError(f"userData for {name} must be a JSON object")
+
+
+def run_batch(source, workers=None, user_data_by_file=None, out=sys.stdout):
+    """Verify every card in source with a dedicated process pool, writing NDJSON to out."""
+    from ocr_utils import process_id_card_bytes
+    from worker_pool import warmup_worker
+
+    user_data_by_file = user_data_by_file or {}
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = IN_FLIGHT_PER_WORKER * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=warmup_worker) as executor:
+        pending = {}
+        try:
+            for name, data in iter_card_images(source):
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    _write_records(done, pending, out)
+                pending[executor.submit(process_id_card_bytes, name, data, user_data_by_file.get(name))] = name
+        finally:
+            # Also when the archive turns out too large: report the cards already submitted
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _write_records(done, pending, out)
+
+
+def _write_records(done, pending, out):
+    for future in done:
+        name = pending.pop(future)
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {'file': name, 'success': False, 'message': f"Processing failed: {e}"}
+        out.write(to_ndjson(record))
+    out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='zip archive or directory of ID card images')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--user-data', help='JSON file mapping card file names to userData objects')
+    args = parser.parse_args()
+
+    user_data_by_file = None
+    if args.user_data:
+        with open(args.user_data, 'r', encoding='utf-8') as f:
+            user_data_by_file = json.load(f)
+        try:
+            validate_user_data(user_data_by_file)
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        run_batch(args.source, args.workers, user_data_by_file)
+    except ArchiveTooLargeError as e:
+        sys.exit(f"Stopped: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# id_layout.py
+"""
+Layout-aware OCR for the Turkish national ID card (2017 chip card front).
+
+Instead of running Tesseract over the whole card and picking fields out of
+the word soup, the card is located, deskewed with a perspective warp onto a
+fixed-size canvas, and only the known field regions are read. Each field gets
+its own page segmentation mode, language and character whitelist, and its
+value is validated against the field's pattern (plus the TCKN checksum), so a
+misread region is reported as missing instead of polluting the result.
+
+Field boxes are fractions of the warped card (x0, y0, x1, y1) and can be tuned
+without touching the code that uses them; validate_fields() rejects boxes that
+fall outside the card or are empty.
+"""
+import logging
+import re
+
+import cv2
+import numpy as np
+
+from ocr_backend import get_ocr_backend
+from preprocessing import DEFAULT_LAYOUT_PIPELINE, run_pipeline
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = "(bulunamadı)"
+
+# ISO/IEC 7810 ID-1: 85.60 x 53.98 mm
+CARD_WIDTH = 1000
+CARD_HEIGHT = 631
+CARD_ASPECT = CARD_WIDTH / CARD_HEIGHT
+CARD_ASPECT_TOLERANCE = 0.25
+CARD_MIN_AREA_FRACTION = 0.2  # The card must cover at least this much of the photo
+CARD_DETECTION_SIZE = 800  # Longest side the photo is shrunk to for contour detection
+
+FIELD_TEXT_HEIGHT = 48  # Field crops are rescaled so text lines are about this tall
+FIELD_PADDING = 10  # White border added around each crop; Tesseract misreads text touching the edge
+LAYOUT_MIN_FIELDS = 3  # Validated fields, TCKN included, needed to trust the layout result
+
+DIGITS = '0123456789'
+UPPERCASE_ASCII = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+TURKISH_ID_FIELDS = {
+    'id_number': {
+        'box': (0.03, 0.18, 0.38, 0.30), 'psm': 7, 'lang': 'eng',
+        'whitelist': DIGITS, 'pattern': r'\d{11}',
+    },
+    'surname': {
+        'box': (0.33, 0.30, 0.78, 0.41), 'psm': 7, 'lang': 'tur',
+        'whitelist': None, 'pattern': r"[A-ZÇĞİÖŞÜ][A-ZÇĞİÖŞÜ '\-]+",
+    },
+    'name': {
+        'box': (0.33, 0.42, 0.78, 0.53), 'psm': 7, 'lang': 'tur',
+        'whitelist': None, 'pattern': r"[A-ZÇĞİÖŞÜ][A-ZÇĞİÖŞÜ '\-]+",
+    },
+    'birth_date': {
+        'box': (0.33, 0.55, 0.62, 0.65), 'psm': 7, 'lang': 'eng',
+        'whitelist': DIGITS + '.', 'pattern': r'\d{2}\.\d{2}\.\d{4}',
+    },
+    'gender': {
+        'box': (0.62, 0.55, 0.80, 0.65), 'psm': 8, 'lang': 'eng',
+        'whitelist': 'EKMF/', 'pattern': r'K/?F|E/?M',
+    },
+    'serial_number': {
+        'box': (0.33, 0.67, 0.62, 0.77), 'psm': 7, 'lang': 'eng',
+        'whitelist': UPPERCASE_ASCII + DIGITS, 'pattern': r'[A-Z]\d{2}[A-Z]\d{5}',
+    },
+    'nationality': {
+        'box': (0.62, 0.67, 0.85, 0.77), 'psm': 7, 'lang': 'eng',
+        'whitelist': 'TCUR./', 'pattern': r'T\.?C|TUR',
+    },
+    'expiry_date': {
+        'box': (0.33, 0.79, 0.62, 0.89), 'psm': 7, 'lang': 'eng',
+        'whitelist': DIGITS + '.', 'pattern': r'\d{2}\.\d{2}\.\d{4}',
+    },
+}
+
+
+def validate_fields(fields):
+    """Raise ValueError unless every field box lies inside the card and covers at least one pixel each way."""
+    for field, spec in fields.items():
+        x0, y0, x1, y1 = spec['box']
+        if not (0.0 <= x0 < x1 <= 1.0 and 0.0 <= y0 < y1 <= 1.0):
+            raise ValueError(f"Field {field} box {spec['box']} is not inside the card")
+        if int(x1 * CARD_WIDTH) <= int(x0 * CARD_WIDTH) or int(y1 * CARD_HEIGHT) <= int(y0 * CARD_HEIGHT):
+            raise ValueError(f"Field {field} box {spec['box']} is smaller than a pixel")
+
+
+validate_fields(TURKISH_ID_FIELDS)
+
+
+def is_valid_tckn(value):
+    """Check the two TCKN check digits."""
+    if not re.fullmatch(r'[1-9]\d{10}', value or ''):
+        return False
+    digits = [int(c) for c in value]
+    tenth = (sum(digits[0:9:2]) * 7 - sum(digits[1:8:2])) % 10
+    return digits[9] == tenth and digits[10] == sum(digits[:10]) % 10
+
+
+def _order_corners(points):
+    """Order four points as top-left, top-right, bottom-right, bottom-left."""
+    points = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    ordered = np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                        points[np.argmax(sums)], points[np.argmax(diffs)]], dtype=np.float32)
+    width = np.linalg.norm(ordered[1] - ordered[0])
+    height = np.linalg.norm(ordered[3] - ordered[0])
+    if height > width:
+        # Card photographed in portrait: rotate so the long edge maps to the canvas width
+        ordered = np.roll(ordered, -1, axis=0)
+    return ordered
+
+
+def shrink_image(img, scale):
+    """
+    Downscale img by scale < 1 with little aliasing.
+
+    INTER_AREA is only fast for exact halvings, so the image is halved with it
+    while possible and the remaining factor (> 0.5) is done with INTER_LINEAR.
+    """
+    while scale <= 0.5:
+        img = cv2.resize(img, (img.shape[1] // 2, img.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        scale *= 2
+    if scale < 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    return img
+
+
+def find_card_quad(img):
+    """
+    Find the ID card outline in a photo.
+
+    Returns:
+        np.ndarray: the four card corners (tl, tr, br, bl) in img coordinates,
+        or None if no card-shaped contour was found
+    """
+    height, width = img.shape[:2]
+    scale = min(1.0, CARD_DETECTION_SIZE / max(height, width))
+    small = shrink_image(img, scale)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = CARD_MIN_AREA_FRACTION * gray.shape[0] * gray.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        corners = approx if len(approx) == 4 else cv2.boxPoints(cv2.minAreaRect(contour))
+        corners = _order_corners(corners)
+        aspect = np.linalg.norm(corners[1] - corners[0]) / max(np.linalg.norm(corners[3] - corners[0]), 1.0)
+        if abs(aspect - CARD_ASPECT) <= CARD_ASPECT_TOLERANCE:
+            return corners * (img.shape[1] / gray.shape[1])
+    return None
+
+
+def warp_card(img, corners):
+    """Perspective-warp the card onto a CARD_WIDTH x CARD_HEIGHT canvas."""
+    target = np.array([[0, 0], [CARD_WIDTH - 1, 0], [CARD_WIDTH - 1, CARD_HEIGHT - 1], [0, CARD_HEIGHT - 1]],
+                      dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(np.asarray(corners, dtype=np.float32), target)
+    return cv2.warpPerspective(img, matrix, (CARD_WIDTH, CARD_HEIGHT), flags=cv2.INTER_LINEAR)
+
+
+def _field_image(card_gray, box, pipeline=None):
+    x0, y0, x1, y1 = box
+    crop = card_gray[int(y0 * CARD_HEIGHT):int(y1 * CARD_HEIGHT), int(x0 * CARD_WIDTH):int(x1 * CARD_WIDTH)]
+    scale = FIELD_TEXT_HEIGHT / max(crop.shape[0] * 0.6, 1)  # A field box is roughly 60% text line
+    if abs(scale - 1.0) > 0.1:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    binary = run_pipeline(crop, pipeline or DEFAULT_LAYOUT_PIPELINE)
+    return cv2.copyMakeBorder(binary, FIELD_PADDING, FIELD_PADDING, FIELD_PADDING, FIELD_PADDING,
+                              cv2.BORDER_CONSTANT, value=255)
+
+
+def read_field(card_gray, spec, pipeline=None):
+    """
+    OCR one field region and return its validated value, or None. pipeline
+    preprocesses the crop (preprocessing.run_pipeline); None uses
+    VERIFID_LAYOUT_PREPROCESSING.
+    """
+    text = get_ocr_backend().image_to_string(_field_image(card_gray, spec['box'], pipeline), lang=spec['lang'],
+                                             psm=spec['psm'], whitelist=spec.get('whitelist'))
+    text = ' '.join(text.split()).upper()
+    match = re.search(spec['pattern'], text)
+    return match.group(0).strip() if match else None
+
+
+def extract_fields_from_layout(img, fields=TURKISH_ID_FIELDS, corners=None, pipeline=None):
+    """
+    Read the ID card fields from their template regions.
+
+    corners are the card corners if they are already known, e.g. from the
+    upload quality gate. Custom fields are checked with validate_fields().
+    pipeline preprocesses each field crop; None uses VERIFID_LAYOUT_PREPROCESSING.
+
+    Returns:
+        dict: field values in the extract_text_from_id format, or None if the
+        card was not found or too few fields validated to trust the layout
+    """
+    if fields is not TURKISH_ID_FIELDS:
+        validate_fields(fields)
+    if corners is None:
+        corners = find_card_quad(img)
+    if corners is None:
+        logger.debug("No card outline found, layout OCR skipped")
+        return None
+
+    card = warp_card(img, corners)
+    card_gray = cv2.cvtColor(card, cv2.COLOR_BGR2GRAY)
+
+    id_card_info = {}
+    for field, spec in fields.items():
+        id_card_info[field] = read_field(card_gray, spec, pipeline) or NOT_FOUND
+
+    if not is_valid_tckn(id_card_info.get('id_number')):
+        id_card_info['id_number'] = NOT_FOUND
+    gender = id_card_info.get('gender', NOT_FOUND)
+    if gender != NOT_FOUND:
+        id_card_info['gender'] = "K/F" if gender.startswith('K') else "E/M"
+    if id_card_info.get('nationality', NOT_FOUND) != NOT_FOUND:
+        id_card_info['nationality'] = "T.C."
+
+    found = sum(1 for value in id_card_info.values() if value != NOT_FOUND)
+    if id_card_info.get('id_number') == NOT_FOUND or found < LAYOUT_MIN_FIELDS:
+        logger.debug("Layout OCR validated %d fields, falling back to full-card OCR", found)
+        return None
+    return id_card_info
@@ -1,12 +1,31 @@
 # liveness_service.py
 import cv2
-import face_recognition
 import numpy as np
 import base64
 import io
+import logging
 import os
 import random
-from PIL import Image
+
+from encoding_store import get_encoding_store
+from face_assets import FACE_INFO_DIR, get_face_asset_store
+from face_matching import MATCH_STATISTIC, MIN_SAMPLES_WITHOUT_FINAL_FRAME, distance_statistics
+from face_tracker import new_tracker_state, needs_detection, update_tracker
+from metrics import span
+
+# face_recognition (dlib and its models) is imported where it is used: the
+# server process only submits these functions to the worker pool, whose
+# workers load it once at startup (worker_pool.warmup_worker).
+
+logger = logging.getLogger(__name__)
+
+# Frames are shrunk by this factor before the HOG scan; detection cost falls
+# roughly with its square. Boxes are mapped back to full-frame coordinates.
+DETECTION_SCALE = float(os.environ.get('VERIFID_DETECTION_SCALE', '0.5'))
+DETECTION_UPSAMPLE = 1  # face_recognition's default number_of_times_to_upsample
+# Horizontal displacement that counts as a head turn, as a fraction of the
+# reference face width (40 px for a typical 160 px wide webcam face)
+MOVEMENT_THRESHOLD_RATIO = 0.25
 
 # --- Core Utilities ---
 
@@ -14,6 +33,7 @@ def base64_to_image(base64_string):
     """Converts a base64 encoded string into an OpenCV image (BGR format)."""
     if ',' in base64_string:
         base64_string = base64_string.split(',')[1]
+    from PIL import Image  # Only older clients still send base64 frames
     try:
         img_data = base64.b64decode(base64_string)
         image = Image.open(io.BytesIO(img_data))
@@ -21,46 +41,103 @@ def base64_to_image(base64_string):
     except Exception:
         return None
 
-def get_reference_face_encoding(user_id, face_info_dir='./face_info'):
-<<<<<<< HEAD
+def bytes_to_image(image_bytes):
+    """Decodes a raw JPEG/WebP/PNG buffer straight into an OpenCV image (BGR format)."""
+    try:
+        # frombuffer wraps the received bytes without copying them
+        return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except Exception:
+        return None
+
+def decode_frame(frame_data):
+    """Decodes a liveness frame sent as a binary attachment, or as a base64 data URL by older clients."""
+    with span('decode'):
+        if isinstance(frame_data, (bytes, bytearray, memoryview)):
+            return bytes_to_image(frame_data)
+        if isinstance(frame_data, str):
+            return base64_to_image(frame_data)
+        return None
+
+def get_reference_face_encoding(user_id, face_info_dir=FACE_INFO_DIR):
     """
-    Loads a reference image for a given user_id and returns the face encoding.
-    [VERSION WITH ENHANCED LOGGING]
+    Returns the reference face encoding for a given user_id.
+
+    Encodings are precomputed at enrolment and served from the encoding store.
+    Users enrolled before it existed, or whose ID card face could not be
+    encoded, are encoded from their stored face image once and backfilled
+    into the store.
     """
-    face_path = os.path.join(face_info_dir, f"{user_id}.jpg")
-    print(f"[DEBUG] Attempting to load reference face from: {os.path.abspath(face_path)}")
-
-    if not os.path.exists(face_path):
-        print(f"[ERROR] File does not exist at path: {face_path}")
-=======
-    """Loads a reference image for a given user_id and returns the face encoding."""
-    face_path = os.path.join(face_info_dir, f"{user_id}.jpg")
-    if not os.path.exists(face_path):
->>>>>>> 00f4710 (Yerel değişiklikler (dosya silme ve güncellemeler))
+    store = get_encoding_store(face_info_dir)
+    encoding = store.get(user_id)
+    if encoding is not None:
+        return encoding
+
+    assets = get_face_asset_store(face_info_dir)
+    asset = assets.get(user_id)
+    if asset is None:
+        logger.error("No reference face for user %s", user_id)
         return None
+    logger.debug("Encoding not in store, loading reference face from %s", asset["location"])
     try:
-        print(f"[DEBUG] File found. Loading image with face_recognition...")
-        reference_image = face_recognition.load_image_file(face_path)
-        print(f"[DEBUG] Image loaded successfully. Now encoding face...")
-        
+        import face_recognition
+        reference_image = face_recognition.load_image_file(io.BytesIO(assets.read_image(user_id)))
         reference_encodings = face_recognition.face_encodings(reference_image)
-<<<<<<< HEAD
 
         if not reference_encodings:
-            print(f"[ERROR] Image at {face_path} was loaded, but NO FACE was detected in it.")
+            logger.error("No face detected in reference image %s", asset["location"])
             return None
-        
-        print(f"[SUCCESS] Face encoding successful for user {user_id}.")
+
+        store.put(user_id, reference_encodings[0])
+        logger.info("Reference encoding computed and stored for user %s", user_id)
         return reference_encodings[0]
 
-    except Exception as e:
-        print(f"[CRITICAL ERROR] An exception occurred while processing {face_path}: {e}")
-=======
-        return reference_encodings[0] if reference_encodings else None
     except Exception:
->>>>>>> 00f4710 (Yerel değişiklikler (dosya silme ve güncellemeler))
+        logger.exception("Could not encode reference face %s", asset["location"])
         return None
 
+def detect_faces(frame, scale=DETECTION_SCALE):
+    """Detect faces on a downscaled copy of a BGR frame; boxes are returned in full-frame coordinates."""
+    import face_recognition
+    if 0 < scale < 1:
+        small_frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        small_frame, scale = frame, 1.0
+    with span('color_convert'):
+        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    with span('detect'):
+        face_locations = face_recognition.face_locations(rgb_small_frame, number_of_times_to_upsample=DETECTION_UPSAMPLE)
+    if scale == 1.0:
+        return face_locations
+
+    height, width = frame.shape[:2]
+    return [
+        (max(0, int(round(top / scale))), min(width, int(round(right / scale))),
+         min(height, int(round(bottom / scale))), max(0, int(round(left / scale))))
+        for top, right, bottom, left in face_locations
+    ]
+
+def _locate_faces(frame, tracker_state=None, force_detection=False):
+    """
+    Returns (face_locations, tracker_state, detected) for a frame.
+
+    Without a tracker_state this is a plain full-frame detection. In tracking
+    mode the tracker is tried first and a full detection re-seeds it when it is
+    due, forced or the tracker loses the face; a new state is only seeded from
+    a single face. detected is False when the tracker supplied the box: it
+    follows one face and cannot see others entering the frame.
+    """
+    if tracker_state is not None and not force_detection and not needs_detection(tracker_state):
+        with span('track'):
+            face_location, _ = update_tracker(frame, tracker_state)
+        if face_location is not None:
+            return [face_location], tracker_state, False
+
+    face_locations = detect_faces(frame)
+    if tracker_state is not None:
+        # An empty state keeps tracking mode on until a single face can seed it
+        tracker_state = (new_tracker_state(frame, face_locations[0]) if len(face_locations) == 1 else None) or {}
+    return face_locations, tracker_state, True
+
 # --- Functions Required by app.py ---
 
 def generate_random_liveness_commands(num_commands=3):
@@ -72,18 +149,36 @@ def generate_random_liveness_commands(num_commands=3):
         commands.append(random.choice(available))
     return commands
 
-def process_liveness_frame(frame, reference_center_x, command_to_check, face_detection_threshold=40):
-    """Process a single frame for liveness detection based on face displacement."""
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_frame)
+def process_liveness_frame(frame, reference_center_x, command_to_check, face_detection_threshold=40, tracker_state=None,
+                           reference_face_width=None, movement_threshold_ratio=MOVEMENT_THRESHOLD_RATIO,
+                           force_detection=False):
+    """
+    Process a single frame for liveness detection based on face displacement.
+
+    When reference_face_width is given, the displacement threshold is
+    movement_threshold_ratio times that width, so it does not depend on the
+    camera resolution; otherwise face_detection_threshold pixels is used.
+
+    With a tracker_state (tracking mode) the face is followed by the lightweight
+    tracker and full detection only runs every few frames or when tracking
+    confidence drops; the updated state is returned under "tracker_state".
+    force_detection skips the tracker for this frame. "face_count" is the
+    number of faces a full detection found, or None for a tracked frame.
+    """
+    face_locations, tracker_state, detected = _locate_faces(frame, tracker_state, force_detection)
+    face_count = len(face_locations) if detected else None
 
     if not face_locations:
-        return {"face_detected": False, "error_message": "No face detected in frame"}
+        return {"face_detected": False, "error_message": "No face detected in frame", "tracker_state": tracker_state,
+                "face_count": face_count}
     if len(face_locations) > 1:
-        return {"face_detected": False, "error_message": "Multiple faces detected"}
+        return {"face_detected": False, "error_message": "Multiple faces detected", "tracker_state": tracker_state,
+                "face_count": face_count}
 
     top, right, bottom, left = face_locations[0]
     current_center_x = (left + right) // 2
+    if reference_face_width:
+        face_detection_threshold = movement_threshold_ratio * reference_face_width
     
     movement_detected = "center"
     if current_center_x < reference_center_x - face_detection_threshold:
@@ -98,37 +193,128 @@ def process_liveness_frame(frame, reference_center_x, command_to_check, face_det
         "movement_detected": movement_detected,
         "command_matched": command_matched,
         "face_location": {"top": top, "right": right, "bottom": bottom, "left": left},
-        "face_size": {"width": right - left, "height": bottom - top}
+        "face_size": {"width": right - left, "height": bottom - top},
+        "tracker_state": tracker_state,
+        "face_count": face_count
     }
 
-def verify_face_match(frame, reference_encoding, tolerance=0.55):
-    """Verify if the face in the final frame matches the reference face encoding."""
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    live_encodings = face_recognition.face_encodings(rgb_frame)
+def encode_face(frame, face_location, landmark_model='large'):
+    """Compute the encoding of the face at a known box (top, right, bottom, left), or None."""
+    import face_recognition
+    with span('color_convert'):
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    with span('encode'):
+        encodings = face_recognition.face_encodings(rgb_frame, known_face_locations=[tuple(face_location)],
+                                                    model=landmark_model)
+    return encodings[0] if encodings else None
+
+def verify_face_match(frame, reference_encoding, tolerance=0.55, face_location=None, extra_encodings=None,
+                      landmark_model='large', statistic=MATCH_STATISTIC):
+    """
+    Verify if the face in the final frame matches the reference face encoding.
+
+    With face_location (top, right, bottom, left), the box the liveness step
+    already found in this frame, only the encoding is computed and no second
+    detection runs. extra_encodings sampled from earlier frames of the session
+    are scored together with the final frame and the chosen distance statistic
+    ('median' or 'trimmed_mean') decides the match. If the final frame has no
+    usable face, enough earlier samples can still decide on their own.
+    """
+    if face_location is not None:
+        live_encoding = encode_face(frame, face_location, landmark_model)
+        live_encodings = [live_encoding] if live_encoding is not None else []
+    else:
+        import face_recognition
+        with span('color_convert'):
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with span('detect_and_encode'):
+            live_encodings = face_recognition.face_encodings(rgb_frame, model=landmark_model)
 
-    if not live_encodings:
-        return False, 0.0, "No face detected in the final frame"
     if len(live_encodings) > 1:
         return False, 0.0, "Multiple faces detected"
 
-    face_distances = face_recognition.face_distance([reference_encoding], live_encodings[0])
-    match = bool(face_distances[0] <= tolerance)
-    confidence = float(1.0 - min(face_distances[0], 1.0))
+    extra_count = len(extra_encodings) if extra_encodings is not None else 0
+    if not live_encodings and extra_count < MIN_SAMPLES_WITHOUT_FINAL_FRAME:
+        return False, 0.0, "No face detected in the final frame"
+
+    encodings = np.empty((len(live_encodings) + extra_count, 128), dtype=np.float64)
+    if live_encodings:
+        encodings[0] = live_encodings[0]
+    if extra_count:
+        encodings[len(live_encodings):] = extra_encodings
+    stats = distance_statistics(reference_encoding, encodings)
+    distance = stats[statistic]
+    match = bool(distance <= tolerance)
+    confidence = float(1.0 - min(distance, 1.0))
     
-    message = "Success" if match else f"Face does not match (confidence: {confidence:.2f})"
+    message = "Success" if match else f"Face does not match (confidence: {confidence:.2f}, frames: {stats['count']})"
     return match, confidence, message
 
-<<<<<<< HEAD
-=======
-# --- Optional Security Functions (You can add these back if needed) ---
-# For now, these are stubbed so your app doesn't crash.
-# You can implement their real logic from your old liveness_detection.py if desired.
+# --- Worker Pool Entry Points ---
+# These run inside worker_pool processes, so they take the raw frame payload
+# and do the decoding there as well.
+
+def locate_face_in_frame(frame_data, start_tracking=False, sample_encoding=False):
+    """
+    Decode a frame and return the face box, for the centering step. A frame
+    with several faces ("face_count" > 1) gives no box.
+
+    With start_tracking, a tracker state seeded from that box is returned too;
+    with sample_encoding, the face's encoding as "face_encoding".
+    """
+    frame = decode_frame(frame_data)
+    if frame is None:
+        return {"decoded": False, "face_location": None, "tracker_state": None, "frame_width": None, "face_count": None}
+    face_locations = detect_faces(frame)
+    face_location = face_locations[0] if len(face_locations) == 1 else None
+    tracker_state = None
+    if start_tracking:
+        tracker_state = (new_tracker_state(frame, face_location) if face_location else None) or {}
+    face_encoding = encode_face(frame, face_location) if sample_encoding and face_location else None
+    return {"decoded": True, "face_location": face_location, "tracker_state": tracker_state,
+            "frame_width": frame.shape[1], "face_encoding": face_encoding, "face_count": len(face_locations)}
+
+def analyze_liveness_frame(frame_data, reference_center_x, command_to_check, reference_encoding=None, tracker_state=None,
+                           reference_face_width=None, reference_frame_width=None, sample_encoding=False,
+                           session_encodings=None):
+    """
+    Decode a frame and run the liveness check on it.
+
+    When reference_encoding is given (the last command of the sequence) and the
+    command matched, the final face match is done in the same call so the frame
+    never has to travel back to the server process; session_encodings sampled
+    earlier are aggregated into it. With sample_encoding, a frontal face's
+    encoding is returned as "face_encoding" for the session to collect.
+    Frames that feed the match either way get a full detection rather than a
+    tracking step, since only a detection sees a second face in the frame.
+
+    The client may be told to change resolution mid-session; reference_frame_width
+    is the width of the centering frame, and the reference position is rescaled
+    to this frame's width.
+    """
+    frame = decode_frame(frame_data)
+    if frame is None:
+        return None
 
-def detect_face_blur(frame, face_location):
-    """Stub function. Returns True to not interfere with the flow."""
-    return True, 100 # is_clear, blur_score
+    frame_width = frame.shape[1]
+    if reference_frame_width and frame_width != reference_frame_width:
+        factor = frame_width / float(reference_frame_width)
+        reference_center_x = reference_center_x * factor
+        if reference_face_width:
+            reference_face_width = reference_face_width * factor
+    if tracker_state and tracker_state.get('frame_width') != frame_width:
+        tracker_state = {}
 
-def validate_face_consistency(current_face_size, reference_face_size):
-    """Stub function. Returns True to not interfere with the flow."""
-    return True, 0 # is_consistent, size_difference
->>>>>>> 00f4710 (Yerel değişiklikler (dosya silme ve güncellemeler))
+    result = process_liveness_frame(frame, reference_center_x, command_to_check, tracker_state=tracker_state,
+                                    reference_face_width=reference_face_width,
+                                    force_detection=reference_encoding is not None or sample_encoding)
+    if reference_encoding is not None and result.get('command_matched'):
+        location = result['face_location']
+        face_location = (location['top'], location['right'], location['bottom'], location['left'])
+        result['face_match'] = verify_face_match(frame, reference_encoding, face_location=face_location,
+                                                 extra_encodings=session_encodings)
+    elif sample_encoding and result['face_count'] == 1 and result['movement_detected'] == 'center':
+        location = result['face_location']
+        result['face_encoding'] = encode_face(
+            frame, (location['top'], location['right'], location['bottom'], location['left']))
+    return result
@@ -0,0 +1,141 @@
+# log_config.py
+"""
+Process-wide logging setup.
+
+Log calls never write to a stream themselves: the root handler only puts the
+record on a bounded queue and a listener thread formats and writes it. When
+the queue is full the record is dropped rather than stalling a request.
+
+- Lazy formatting: records are queued with their msg and args unformatted, so
+  use logger.debug("... %s", value) rather than f-strings, and pass values
+  that will not change after the call (ids, numbers, strings).
+- Sampling: high-rate per-frame messages pass extra=sampled('event') and only
+  one in VERIFID_LOG_SAMPLE_EVERY of each event is written.
+- Redaction: bytes arguments, data URLs and long base64 runs (frames, face
+  crops) are replaced by their size, and messages are cut at
+  VERIFID_LOG_MAX_MESSAGE characters.
+"""
+import atexit
+import logging
+import os
+import queue
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get('VERIFID_LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('VERIFID_LOG_FILE')  # Unset: stderr only
+LOG_QUEUE_SIZE = int(os.environ.get('VERIFID_LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_EVERY = int(os.environ.get('VERIFID_LOG_SAMPLE_EVERY', 100))
+LOG_MAX_MESSAGE = int(os.environ.get('VERIFID_LOG_MAX_MESSAGE', 2000))
+# Flask-SocketIO / Engine.IO log every packet; only for debugging the transport
+SOCKETIO_LOGGING = os.environ.get('VERIFID_SOCKETIO_LOGGING', '0') == '1'
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+DATA_URL_RE = re.compile(r'data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+')
+BASE64_RUN_RE = re.compile(r'[A-Za-z0-9+/]{200,}={0,2}')
+
+_listener = None
+
+
+def sampled(event):
+    """extra= for a high-rate log call: only one in LOG_SAMPLE_EVERY per event is written."""
+    return {'sample_event': event}
+
+
+class EventSampler(logging.Filter):
+    """Pass the first of every `every` records per sample_event; other records always pass."""
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts = {}
+
+    def filter(self, record):
+        event = getattr(record, 'sample_event', None)
+        if event is None or self.every == 1:
+            return True
+        count = self._counts.get(event, 0)
+        self._counts[event] = count + 1
+        if count % self.every:
+            return False
+        if count:
+            record.msg = f"{record.msg} [1 in {self.every} logged]"
+        return True
+
+
+class RedactingFormatter(logging.Formatter):
+    """Formatter that strips image payloads and truncates long messages."""
+
+    def __init__(self, fmt=LOG_FORMAT, max_message=LOG_MAX_MESSAGE):
+        super().__init__(fmt)
+        self.max_message = max_message
+
+    def format(self, record):
+        if record.args:
+            args = record.args if isinstance(record.args, tuple) else (record.args,)
+            if any(isinstance(arg, (bytes, bytearray, memoryview)) for arg in args):
+                record.args = tuple(
+                    f"<{len(arg)} bytes>" if isinstance(arg, (bytes, bytearray, memoryview)) else arg
+                    for arg in args
+                )
+        record.msg = self.redact(record.getMessage())
+        record.args = None
+        return super().format(record)
+
+    def redact(self, message):
+        message = DATA_URL_RE.sub(lambda m: f"<data URL, {len(m.group())} chars>", message)
+        message = BASE64_RUN_RE.sub(lambda m: f"<base64, {len(m.group())} chars>", message)
+        if len(message) > self.max_message:
+            message = f"{message[:self.max_message]}... [{len(message) - self.max_message} chars truncated]"
+        return message
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that defers formatting to the listener and drops records when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Tracebacks must be rendered before the frames go away; the message is formatted by the listener
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    """Route all logging in this process through the queue. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = RedactingFormatter()
+    targets = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        targets.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for target in targets:
+        target.setFormatter(formatter)
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(EventSampler())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(handler.queue, *targets, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Flush what is still queued on exit
+    return _listener
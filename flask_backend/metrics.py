@@ -0,0 +1,204 @@
+# metrics.py
+"""
+Hot-path timing spans, counters and histograms, exposed in the Prometheus
+text format on /metrics.
+
+Every thread records into its own shard, so observing never takes a lock;
+shards are only summed when /metrics is scraped. Under gevent all greenlets
+share the hub thread's shard and cannot interleave within an observation.
+
+Spans timed inside worker pool processes are collected per task and shipped
+back with the task's result (see worker_pool), then recorded in the server
+process like local ones.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+class _Metric:
+    """A metric family; one sharded child per label value combination."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Shards:
+    """Per-thread lists of numbers; the owning thread is the only writer of its shard."""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def mine(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = [0] * self._size
+            with self._lock:
+                self._all.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def totals(self):
+        with self._lock:
+            shards = list(self._all)
+        return [sum(values) for values in zip(*shards)] if shards else [0] * self._size
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount=1):
+        self._shards.mine()[0] += amount
+
+    @property
+    def value(self):
+        return self._shards.totals()[0]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {child.value}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket, one for +Inf, then the running sum
+        self._shards = _Shards(len(buckets) + 2)
+
+    def observe(self, value):
+        shard = self._shards.mine()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """(cumulative bucket counts including +Inf, count, sum)."""
+        totals = self._shards.totals()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        cumulative, count, total = child.snapshot()
+        lines = []
+        for bound, running in zip(self.buckets + (float('inf'),), cumulative):
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{self.name}_bucket{self._label_text(values, [('le', le)])} {running}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+        return lines
+
+
+def render_prometheus():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram('verifid_stage_seconds', 'Time spent per processing stage', ('stage',))
+LIVENESS_FRAMES = Counter('verifid_liveness_frames_total', 'Liveness frames by event', ('event',))
+LIVENESS_FRAMES_DROPPED = Counter('verifid_liveness_frames_dropped_total',
+                                  'Liveness frames dropped before processing, by reason', ('reason',))
+ID_UPLOADS = Counter('verifid_id_uploads_total', '/verify/id requests by outcome', ('outcome',))
+
+
+# --- Spans ---
+
+_collector = None  # While a worker pool task runs: its [(stage, seconds)]
+
+
+def record_span(stage, seconds):
+    if _collector is not None:
+        _collector.append((stage, seconds))
+    else:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def record_spans(spans):
+    for stage, seconds in spans:
+        record_span(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as one observation of stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def run_collecting_spans(fn, args, kwargs):
+    """
+    Worker pool task wrapper: run fn and return (result, spans) so the spans
+    timed in this process can be recorded by the server.
+    """
+    global _collector
+    _collector = []
+    try:
+        return fn(*args, **kwargs), _collector
+    finally:
+        _collector = None
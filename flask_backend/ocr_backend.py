@@ -0,0 +1,157 @@
+# ocr_backend.py
+"""
+Tesseract backends for the ID card OCR.
+
+pytesseract starts a new tesseract process per call, round-trips the image
+through a temp file and reloads the traineddata each time. TesserocrBackend
+binds libtesseract in-process instead and keeps one initialised engine per
+language set alive for the lifetime of the worker, so a call only pays for
+the recognition itself. pytesseract stays as the fallback when tesserocr is
+not installed.
+
+Both backends take OpenCV (numpy) images and return pytesseract-shaped
+results, so callers do not care which one is active.
+"""
+import importlib.util
+import logging
+import os
+import threading
+
+import cv2
+
+# Looked up without importing: each backend imports its library when created,
+# so the one that is not used is never loaded
+TESSEROCR_AVAILABLE = importlib.util.find_spec('tesserocr') is not None
+
+logger = logging.getLogger(__name__)
+
+# auto: tesserocr when installed, else pytesseract
+OCR_BACKEND = os.environ.get('VERIFID_OCR_BACKEND', 'auto')
+WARMUP_LANGUAGES = ('tur+eng', 'tur', 'eng')  # Language sets used by ocr_utils and id_layout
+
+
+class PytesseractBackend:
+    """One tesseract subprocess per call."""
+
+    name = 'pytesseract'
+
+    def __init__(self):
+        import pytesseract
+        self._pytesseract = pytesseract
+
+    @staticmethod
+    def _config(lang, psm, whitelist):
+        config = f"--oem 3 --psm {psm} -l {lang}"
+        if whitelist:
+            config += f" -c tessedit_char_whitelist={whitelist}"
+        return config
+
+    def image_to_data(self, image, lang='tur+eng', psm=6, whitelist=None):
+        """Word-level OCR; returns a dict with at least "text" and "conf" lists."""
+        return self._pytesseract.image_to_data(image, config=self._config(lang, psm, whitelist),
+                                               output_type=self._pytesseract.Output.DICT)
+
+    def image_to_string(self, image, lang='eng', psm=7, whitelist=None):
+        return self._pytesseract.image_to_string(image, config=self._config(lang, psm, whitelist))
+
+    def warmup(self, languages=WARMUP_LANGUAGES):
+        self._pytesseract.get_tesseract_version()
+
+
+class TesserocrBackend:
+    """
+    In-process libtesseract with one persistent engine per language set.
+
+    An engine holds per-image state, so calls are serialised per engine.
+    Workers are single-threaded processes and never contend for the lock.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def _engine(self, lang):
+        engine = self._engines.get(lang)
+        if engine is None:
+            engine = self._tesserocr.PyTessBaseAPI(lang=lang, oem=self._tesserocr.OEM.DEFAULT)
+            self._engines[lang] = engine
+        return engine
+
+    def _recognize(self, engine, image, psm, whitelist):
+        engine.SetPageSegMode(psm)
+        engine.SetVariable('tessedit_char_whitelist', whitelist or '')
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        # Hand the pixel buffer over directly: no PIL conversion, no temp file
+        engine.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        engine.Recognize()
+
+    def image_to_data(self, image, lang='tur+eng', psm=6, whitelist=None):
+        """Word-level OCR; returns a dict with at least "text" and "conf" lists."""
+        data = {"text": [], "conf": []}
+        with self._lock:
+            engine = self._engine(lang)
+            try:
+                self._recognize(engine, image, psm, whitelist)
+                level = self._tesserocr.RIL.WORD
+                for word in self._tesserocr.iterate_level(engine.GetIterator(), level):
+                    text = word.GetUTF8Text(level)
+                    if text is None:
+                        continue
+                    data["text"].append(text)
+                    data["conf"].append(word.Confidence(level))
+            finally:
+                engine.Clear()
+        return data
+
+    def image_to_string(self, image, lang='eng', psm=7, whitelist=None):
+        with self._lock:
+            engine = self._engine(lang)
+            try:
+                self._recognize(engine, image, psm, whitelist)
+                return engine.GetUTF8Text()
+            finally:
+                engine.Clear()
+
+    def warmup(self, languages=WARMUP_LANGUAGES):
+        """Load the traineddata of every language set up front."""
+        with self._lock:
+            for lang in languages:
+                self._engine(lang)
+
+    def close(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.End()
+            self._engines.clear()
+
+
+def create_ocr_backend(name=OCR_BACKEND):
+    """Create a backend by name: auto, tesserocr or pytesseract."""
+    if name == 'pytesseract':
+        return PytesseractBackend()
+    if name in ('auto', 'tesserocr'):
+        if TESSEROCR_AVAILABLE:
+            return TesserocrBackend()
+        if name == 'tesserocr':
+            raise ImportError("VERIFID_OCR_BACKEND=tesserocr but the tesserocr package is not installed")
+        return PytesseractBackend()
+    raise ValueError(f"Unsupported OCR backend: {name}")
+
+
+_backend = None
+
+
+def get_ocr_backend():
+    """The process-wide backend, created on first use."""
+    global _backend
+    if _backend is None:
+        _backend = create_ocr_backend()
+        logger.info("Using %s OCR backend in process %s", _backend.name, os.getpid())
+    return _backend
@@ -1,32 +1,144 @@
 import cv2
-import pytesseract
-from pytesseract import Output
 import re
 import numpy as np
 import string
 import json
 import base64
-import traceback
+import hashlib
+import logging
 from datetime import datetime # Import datetime for date parsing
+import mmap
 import os
+import time
+
+from encoding_store import get_encoding_store
+from face_assets import FACE_INFO_DIR, get_face_asset_store
+from id_layout import extract_fields_from_layout
+from image_quality import prepare_id_image
+from preprocessing import run_pipeline
+from result_cache import content_hash
+from metrics import span
+from ocr_backend import get_ocr_backend
+
+logger = logging.getLogger(__name__)
+
+# "layout" reads the known field regions of the card and falls back to "full" OCR of the whole card.
+# "auto" uses layout only with the in-process tesserocr backend: it makes one OCR call per field,
+# and with pytesseract each call is a tesseract process, which costs more than one full-card pass.
+OCR_MODE = os.environ.get('VERIFID_OCR_MODE', 'auto')
+
+def layout_ocr_enabled():
+    """True if ID cards are read from their field regions (VERIFID_OCR_MODE)."""
+    if OCR_MODE == "auto":
+        return get_ocr_backend().name == "tesserocr"
+    return OCR_MODE == "layout"
+
+class IdCardAnalysis:
+    """
+    Per-request analysis of one ID card image.
 
-def extract_text_from_id(img, user_data=None):
-    """Process ID card image and extract text information"""
-    if img is None:
-        return {"success": False, "message": "Invalid image"}
+    The RGB conversion, face detection, face crops and face encoding are
+    computed on first use and then shared, so the OCR response and the
+    face_info save never detect the face twice. card_corners are the card
+    outline found by the upload quality gate, if it ran.
+    """
 
+    def __init__(self, img, card_corners=None):
+        self.img = img
+        self.card_corners = card_corners
+        self._rgb = None
+        self._face_locations = None
+        self._face_encoding = None
+        self._face_encoded = False
+        self._reference_face = None
+        self._reference_face_built = False
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            with span('color_convert'):
+                self._rgb = cv2.cvtColor(self.img, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @property
+    def face_locations(self):
+        if self._face_locations is None:
+            import face_recognition
+            rgb = self.rgb
+            with span('id_face_detect'):
+                self._face_locations = face_recognition.face_locations(rgb)
+        return self._face_locations
+
+    @property
+    def face_checked(self):
+        """True once face detection ran, so a None reference_face means the card has no face."""
+        return self._face_locations is not None
+
+    @property
+    def face_location(self):
+        """First detected face as (top, right, bottom, left), or None."""
+        return self.face_locations[0] if self.face_locations else None
+
+    def face_crop(self, margin):
+        """Crop of the first face with margin pixels around it, or None."""
+        if self.face_location is None:
+            return None
+        top, right, bottom, left = self.face_location
+        top = max(0, top - margin)
+        left = max(0, left - margin)
+        bottom = min(self.img.shape[0], bottom + margin)
+        right = min(self.img.shape[1], right + margin)
+        return self.img[top:bottom, left:right]
+
+    @property
+    def face_encoding(self):
+        """128-d encoding of the first face, or None."""
+        if not self._face_encoded:
+            self._face_encoded = True
+            if self.face_location is not None:
+                import face_recognition
+                rgb = self.rgb
+                with span('id_face_encode'):
+                    encodings = face_recognition.face_encodings(rgb, known_face_locations=[self.face_location])
+                self._face_encoding = encodings[0] if encodings else None
+        return self._face_encoding
+
+    @property
+    def reference_face(self):
+        """
+        The face_info asset for this card: {"jpeg": bytes of the 100 px
+        margin face crop, "encoding": its encoding or None, "box": the face
+        location in the card, "quality": sharpness (Laplacian variance) of
+        the face}, or None without a face.
+        """
+        if not self._reference_face_built:
+            self._reference_face_built = True
+            face_image = self.face_crop(100)  # Larger margin to make the saved face bigger
+            if face_image is not None:
+                _, buffer = cv2.imencode('.jpg', face_image)
+                face_gray = cv2.cvtColor(self.face_crop(0), cv2.COLOR_BGR2GRAY)
+                self._reference_face = {
+                    "jpeg": buffer.tobytes(),
+                    "encoding": self.face_encoding,
+                    "box": self.face_location,
+                    "quality": round(float(cv2.Laplacian(face_gray, cv2.CV_64F).var()), 1),
+                }
+        return self._reference_face
+
+def extract_fields_full_card(img, pipeline=None):
+    """
+    Run OCR over the whole preprocessed card and pick the fields out of the text.
+
+    pipeline is a preprocessing pipeline name or stage list; None uses
+    VERIFID_OCR_PREPROCESSING.
+    """
     # Image preprocessing
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    filtered = cv2.bilateralFilter(gray, 11, 17, 17)
-    thresh = cv2.adaptiveThreshold(filtered, 255,
-                                   cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY, 31, 15)
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 1))
-    preprocessed_image = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    with span('preprocess'):
+        preprocessed_image = run_pipeline(img, pipeline)
 
     # OCR processing
-    ocr_config = r'--oem 3 --psm 6 -l tur+eng'
-    ocr_result = pytesseract.image_to_data(preprocessed_image, config=ocr_config, output_type=Output.DICT)
+    with span('ocr'):
+        ocr_result = get_ocr_backend().image_to_data(preprocessed_image, lang='tur+eng', psm=6)
 
     detected_texts = []
     for i in range(len(ocr_result["text"])):
@@ -136,32 +248,46 @@ def extract_text_from_id(img, user_data=None):
     if "türk" in full_text_lower or "t.c" in full_text_lower:
         id_card_info["nationality"] = "T.C."
 
+    return id_card_info
+
+def verification_id_for(digest):
+    """Stable verification id for an upload with the given content hash."""
+    return "verify_" + digest[:12]
+
+def extract_text_from_id(img, user_data=None, analysis=None, digest=None):
+    """
+    Process ID card image and extract text information.
+
+    analysis is an IdCardAnalysis of img to share with save_face_from_id_card.
+    digest is the content hash of the upload, which the verification id is
+    derived from; without it the id is derived from the extracted fields.
+    """
+    if img is None:
+        return {"success": False, "message": "Invalid image"}
+    if analysis is None:
+        analysis = IdCardAnalysis(img)
+
+    # Read the fields from their template regions; fall back to OCR over the whole card
+    ocr_mode = "full"
+    id_card_info = None
+    if layout_ocr_enabled():
+        try:
+            with span('layout_ocr'):
+                id_card_info = extract_fields_from_layout(img, corners=analysis.card_corners)
+        except Exception as e:
+            logger.warning("Layout OCR failed, using full-card OCR: %s", e)
+        if id_card_info is not None:
+            ocr_mode = "layout"
+    if id_card_info is None:
+        id_card_info = extract_fields_full_card(img)
+
     # Extract face from ID card
-    face_image_base64 = None
-    try:
-        import face_recognition
-        rgb_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_image)
-
-        if face_locations:
-            top, right, bottom, left = face_locations[0]
-            margin = 30
-            top = max(0, top - margin)
-            left = max(0, left - margin)
-            bottom = min(img.shape[0], bottom + margin)
-            right = min(img.shape[1], right + margin)
-
-            face_image = img[top:bottom, left:right]
-            _, buffer = cv2.imencode('.jpg', face_image)
-            face_image_base64 = 'data:image/jpeg;base64,' + base64.b64encode(buffer).decode('utf-8')
-    except ImportError:
-        print("Face_recognition library not found. Face extraction skipped.")
-    except Exception as e:
-        print(f"Error extracting face: {str(e)}")
-        traceback.print_exc()
+    face_image_base64 = face_preview(analysis)
 
-    # Create verification ID
-    verification_id = "verify_" + str(abs(hash(str(id_card_info))))[:8]
+    # Create verification ID, deterministic for the same upload
+    if digest is None:
+        digest = hashlib.sha256(json.dumps(id_card_info, sort_keys=True).encode('utf-8')).hexdigest()
+    verification_id = verification_id_for(digest)
 
     # Prepare response
     response = {
@@ -170,18 +296,43 @@ def extract_text_from_id(img, user_data=None):
         "extracted_data": id_card_info,
         "verification_id": verification_id,
         "face_image": face_image_base64,
-        "user_match": {
-            "overall_match": False,
-            "match_percentage": 0,
-            "matches": []
-        }
+        "ocr_mode": ocr_mode,
+        # Compare with user data if provided
+        "user_match": compare_with_user_data(id_card_info, user_data)
+    }
+
+    return response
+
+def face_preview(analysis):
+    """The face crop shown in the /verify/id response as a base64 JPEG data URL, or None."""
+    try:
+        face_image = analysis.face_crop(30)
+
+        if face_image is not None:
+            _, buffer = cv2.imencode('.jpg', face_image)
+            return 'data:image/jpeg;base64,' + base64.b64encode(buffer).decode('utf-8')
+    except ImportError:
+        logger.warning("face_recognition library not found, face extraction skipped")
+    except Exception:
+        logger.exception("Error extracting face")
+    return None
+
+def compare_with_user_data(id_card_info, user_data):
+    """
+    Compare extracted ID card fields with the userData the user entered.
+
+    Returns:
+        dict: overall_match, match_percentage and per-field matches
+    """
+    user_match = {
+        "overall_match": False,
+        "match_percentage": 0,
+        "matches": []
     }
 
-    # Compare with user data if provided
     if user_data:
         try:
             user_data_dict = user_data if isinstance(user_data, dict) else json.loads(user_data)
-            print(f"User data for matching: {user_data_dict}")
 
             matches = []
             match_count = 0
@@ -206,7 +357,6 @@ def extract_text_from_id(img, user_data=None):
                     if extracted_value == "(bulunamadı)":
                         # If extracted data is missing, it's a mismatch for this field
                         current_match = False
-                        print(f"{user_key} match: False (Extracted data not found) - User: '{user_value}'")
                     else:
                         # Perform comparison based on the field type
                         if user_key == "gender":
@@ -215,7 +365,6 @@ def extract_text_from_id(img, user_data=None):
                             if (user_gender_lower == 'female' and ('k' in extracted_gender_normalized or 'f' in extracted_gender_normalized)) or \
                                (user_gender_lower == 'male' and ('e' in extracted_gender_normalized or 'm' in extracted_gender_normalized)):
                                 current_match = True
-                            print(f"Gender match: {current_match} - User: '{user_value}' vs Extracted: '{extracted_value}'")
                         
                         elif user_key == "birthDate":
                             # Frontend date format (2003-07-03T00:00:00.000Z) vs Extracted date format (03.07.2003)
@@ -226,11 +375,9 @@ def extract_text_from_id(img, user_data=None):
                                 current_match = user_birth_date_formatted == extracted_value.strip()
                             except (ValueError, AttributeError): # Handle if user_value is not a string or malformed
                                 current_match = False # Date format mismatch or error
-                            print(f"Birth Date match: {current_match} - User: '{user_value}' (formatted: '{user_birth_date_formatted}') vs Extracted: '{extracted_value}'")
 
                         else: # For serialNumber and idNumber
                             current_match = user_value.strip().upper() == extracted_value.strip().upper()
-                            print(f"{user_key} match: {current_match} - User: '{user_value}' vs Extracted: '{extracted_value}'")
                     
                     matches.append([user_key, current_match])
                     if current_match:
@@ -239,70 +386,207 @@ def extract_text_from_id(img, user_data=None):
             # Calculate match percentage
             match_percentage = (match_count / total_fields_to_compare * 100) if total_fields_to_compare > 0 else 0
 
-            response["user_match"] = {
+            user_match = {
                 "overall_match": match_percentage >= 50, # You can adjust this threshold
                 "match_percentage": match_percentage,
                 "matches": matches
             }
 
-            print(f"Match results: {match_count}/{total_fields_to_compare} fields matched ({match_percentage}%)")
-            print(f"Final matches array: {matches}")
+            # Field names and outcomes only; the values are personal data
+            logger.debug("User data match: %s/%s fields (%s)", match_count, total_fields_to_compare, matches)
 
-        except Exception as e:
-            print(f"Error comparing user data: {str(e)}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error comparing user data")
 
-    return response
+    return user_match
+
+def store_reference_face(user_id, reference_face, face_info_dir=FACE_INFO_DIR):
+    """
+    Write a reference face asset (see IdCardAnalysis.reference_face) to the
+    face asset store and its encoding to the encoding store.
 
-def save_face_from_id_card(img, user_id):
+    Returns:
+        str: Location of the saved face image
+    """
+    asset = get_face_asset_store(face_info_dir).save(user_id, reference_face["jpeg"], box=reference_face.get("box"),
+                                                     quality=reference_face.get("quality"))
+    logger.debug("Face image saved to %s", asset["location"])
+
+    # Precompute the reference encoding once so liveness sessions never re-encode the JPEG
+    if reference_face["encoding"] is not None:
+        get_encoding_store(face_info_dir).put(user_id, reference_face["encoding"])
+    else:
+        # Never leave a previous enrolment's encoding to be matched against the new face
+        get_encoding_store(face_info_dir).delete(user_id)
+        logger.warning("Could not compute reference encoding for user %s", user_id)
+
+    return asset["location"]
+
+def delete_reference_face(user_id, face_info_dir=FACE_INFO_DIR):
+    """Forget user_id's reference face and its precomputed encoding."""
+    get_face_asset_store(face_info_dir).delete(user_id)
+    get_encoding_store(face_info_dir).delete(user_id)
+
+def save_face_from_id_card(img, user_id, analysis=None):
     """
     Extract face from ID card image and save it to face_info directory
     
     Args:
         img: OpenCV image of the ID card
         user_id: User ID to use as filename
+        analysis: IdCardAnalysis of img shared with extract_text_from_id
     
     Returns:
         bool: True if successful, False otherwise
         str: Path to saved face image or error message
     """
     try:
-        # Create face_info directory if it doesn't exist
-        face_info_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'face_info')
-        os.makedirs(face_info_dir, exist_ok=True)
+        # Extract face from ID card, reusing the detection of this request if there was one
+        if analysis is None:
+            analysis = IdCardAnalysis(img)
         
-        # Extract face from ID card
-        import face_recognition
-        rgb_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_image)
-        
-        if not face_locations:
+        reference_face = analysis.reference_face
+        if reference_face is None:
             return False, "No face detected in ID card"
         
-        # Get the first face with a larger margin
-        top, right, bottom, left = face_locations[0]
-        
-        # Increase margin to make the extracted face bigger
-        margin = 100
-        
-        # Calculate new boundaries with larger margins
-        top = max(0, top - margin)
-        left = max(0, left - margin)
-        bottom = min(img.shape[0], bottom + margin)
-        right = min(img.shape[1], right + margin)
-        
-        # Extract face image
-        face_image = img[top:bottom, left:right]
-        
-        # Save face image to file
-        file_path = os.path.join(face_info_dir, f"{user_id}.jpg")
-        cv2.imwrite(file_path, face_image)
-        
-        print(f"Face image saved to {file_path}")
-        return True, file_path
+        return True, store_reference_face(user_id, reference_face)
     except Exception as e:
-        error_msg = f"Error saving face image: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return False, error_msg
+        logger.exception("Error saving face image for user %s", user_id)
+        return False, f"Error saving face image: {str(e)}"
+
+def rejected_upload_result(quality):
+    """OCR result for an upload turned away by the quality gate."""
+    return {"success": False, "message": quality["message"], "quality": quality}
+
+def prepare_id_upload(upload):
+    """
+    prepare_id_image for a /verify/id upload: its bytes, or the path of a
+    spooled upload, which is memory-mapped rather than read.
+    """
+    if isinstance(upload, str):
+        with open(upload, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return prepare_id_image(data)
+    return prepare_id_image(upload)
+
+def process_id_card_upload(img, card_corners=None, user_data=None, user_id=None, digest=None):
+    """
+    Worker pool entry point for /verify/id: run OCR on a card image that
+    passed the quality gate (prepare_id_upload) and, when a user_id is given,
+    save the reference face.
+
+    Args:
+        img: the normalized card image
+        card_corners: the card outline the quality gate found in img
+        user_data: userData JSON string or dict to compare against
+        user_id: user whose reference face is saved
+        digest: content hash of the upload
+
+    Returns:
+        dict: OCR result
+        tuple: (success, path_or_error) from save_face_from_id_card, or None
+        dict: result cache entry for the upload (id_card_cache_entry)
+    """
+    # One analysis per upload: the face is detected once for both consumers
+    analysis = IdCardAnalysis(img, card_corners)
+    ocr_result = extract_text_from_id(img, user_data, analysis, digest)
+    face_save_result = save_face_from_id_card(img, user_id, analysis) if user_id else None
+    face_checked = bool(user_id) and analysis.face_checked
+    cache_entry = id_card_cache_entry(ocr_result, analysis.reference_face if face_checked else None, face_checked)
+    return ocr_result, face_save_result, cache_entry
+
+def id_card_cache_entry(ocr_result, reference_face, face_checked):
+    """
+    Result cache entry for one upload: the OCR result without the user_data
+    comparison, and the reference face asset if face_checked (the face was
+    looked for, so None means the card has no face).
+    """
+    ocr_result = {key: value for key, value in ocr_result.items() if key != "user_match"}
+    return {"ocr_result": ocr_result, "reference_face": reference_face, "face_checked": face_checked}
+
+def persisted_cache_entry(entry):
+    """
+    A cache entry as it may be persisted: the extracted fields without any
+    face data. The face preview, face crop and encoding are biometric data
+    and stay in memory only; an entry read back from disk is marked
+    faces_stripped and restore_id_card_faces redoes the face work for it.
+    """
+    ocr_result = entry["ocr_result"]
+    faces_stripped = "face_image" in ocr_result
+    if faces_stripped:
+        ocr_result = dict(ocr_result, face_image=None)
+    return dict(entry, ocr_result=ocr_result, reference_face=None, face_checked=False, faces_stripped=faces_stripped)
+
+def restore_id_card_faces(img, card_corners=None, entry=None, user_id=None):
+    """
+    Worker pool entry point for a disk-tier cache hit: redo the face work of
+    persisted_cache_entry(entry) on the card image, but not its OCR.
+
+    Returns:
+        dict: the cache entry with its face preview and, for a user_id, its
+        reference face
+    """
+    analysis = IdCardAnalysis(img, card_corners)
+    ocr_result = dict(entry["ocr_result"], face_image=face_preview(analysis))
+    face_checked = bool(user_id) and analysis.face_checked
+    return id_card_cache_entry(ocr_result, analysis.reference_face if face_checked else None, face_checked)
+
+def id_card_result_from_cache(entry, user_data=None, user_id=None):
+    """
+    Rebuild a /verify/id result from a cache entry, redoing only the
+    user_data comparison and, for a user_id, the reference face save.
+
+    Returns:
+        (ocr_result, face_save_result) like process_id_card_upload, or None
+        if the entry lacks its face preview or the face asset a user_id needs
+    """
+    if entry.get("faces_stripped") or (user_id and not entry["face_checked"]):
+        return None
+    ocr_result = entry["ocr_result"]
+    if "quality" in ocr_result:
+        return ocr_result, None
+    ocr_result["user_match"] = compare_with_user_data(ocr_result["extracted_data"], user_data)
+
+    face_save_result = None
+    if user_id:
+        if entry["reference_face"] is None:
+            face_save_result = (False, "No face detected in ID card")
+        else:
+            try:
+                face_save_result = (True, store_reference_face(user_id, entry["reference_face"]))
+            except Exception as e:
+                logger.exception("Error saving cached face image for user %s", user_id)
+                face_save_result = (False, f"Error saving face image: {str(e)}")
+    return ocr_result, face_save_result
+
+def process_id_card_bytes(name, image_bytes, user_data=None):
+    """
+    Worker pool entry point for batch verification: decode one card image in
+    memory and run OCR and face extraction on it.
+
+    Returns:
+        dict: one batch result record (without the base64 face preview)
+    """
+    started = time.time()
+    img, card_corners, quality = prepare_id_image(image_bytes)
+    if img is None:
+        return {"file": name, "success": False, "message": "Could not decode image"}
+    if not quality["ok"]:
+        return {"file": name, "success": False, "message": quality["message"], "reason": quality["reason"],
+                "elapsed_ms": round((time.time() - started) * 1000, 1)}
+
+    try:
+        result = extract_text_from_id(img, user_data, IdCardAnalysis(img, card_corners), content_hash(image_bytes))
+    except Exception as e:
+        logger.exception("Error processing batch card %s", name)
+        return {"file": name, "success": False, "message": f"Error processing image: {str(e)}"}
+    return {
+        "file": name,
+        "success": result.get("success", False),
+        "message": result.get("message"),
+        "verification_id": result.get("verification_id"),
+        "extracted_data": result.get("extracted_data", {}),
+        "user_match": result.get("user_match"),
+        "face_detected": result.get("face_image") is not None,
+        "elapsed_ms": round((time.time() - started) * 1000, 1)
+    }
 
@@ -0,0 +1,174 @@
+# preprocessing.py
+"""
+OCR preprocessing pipelines built from named stages.
+
+A pipeline is plain configuration: a list of (stage name, params) pairs run
+in order over the card image. Every stage is a single OpenCV/numpy operation
+on the whole image, so variants can be compared and swapped without touching
+the OCR code. benchmarks/preprocessing_eval.py scores each variant on labeled
+cards (field accuracy against milliseconds per image) and recommends the
+cheapest one that meets the accuracy target; select it with
+VERIFID_OCR_PREPROCESSING. The field crops of layout OCR (id_layout) go
+through the same pipelines, selected with VERIFID_LAYOUT_PREPROCESSING.
+"""
+import os
+
+import cv2
+import numpy as np
+
+DEFAULT_PIPELINE = os.environ.get('VERIFID_OCR_PREPROCESSING', 'bilateral_adaptive')
+DEFAULT_LAYOUT_PIPELINE = os.environ.get('VERIFID_LAYOUT_PREPROCESSING', 'otsu')
+
+
+def grayscale(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def downscale(img, max_width=1200):
+    """Shrink images wider than max_width; never upscale."""
+    if img.shape[1] <= max_width:
+        return img
+    scale = max_width / img.shape[1]
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def clahe(img, clip_limit=2.0, tile_size=8):
+    """Contrast-limited adaptive histogram equalization, evens out glare and shadows."""
+    return cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_size, tile_size)).apply(img)
+
+
+def bilateral(img, diameter=11, sigma_color=17, sigma_space=17):
+    """Edge-preserving smoothing. Cost grows with diameter squared per pixel."""
+    return cv2.bilateralFilter(img, diameter, sigma_color, sigma_space)
+
+
+def gaussian_blur(img, kernel_size=3):
+    return cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
+
+
+def sharpen(img, amount=1.0, sigma=1.0):
+    """Unsharp mask: img + amount * (img - blurred)."""
+    blurred = cv2.GaussianBlur(img, (0, 0), sigma)
+    return cv2.addWeighted(img, 1.0 + amount, blurred, -amount, 0)
+
+
+def adaptive_threshold(img, block_size=31, c=15):
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, c)
+
+
+def otsu(img):
+    """Global threshold chosen from the histogram; one pass, no neighbourhood work."""
+    _, binary = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def morph_close(img, kernel_size=2):
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    return cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
+
+
+def deskew(img, max_angle=15.0):
+    """Rotate the text upright, estimating the skew from the box around all dark pixels."""
+    _, ink = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(ink)
+    if coords is None:
+        return img
+    angle = cv2.minAreaRect(coords)[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.2 or abs(angle) > max_angle:
+        return img
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+STAGES = {
+    'grayscale': grayscale,
+    'downscale': downscale,
+    'clahe': clahe,
+    'bilateral': bilateral,
+    'gaussian_blur': gaussian_blur,
+    'sharpen': sharpen,
+    'adaptive_threshold': adaptive_threshold,
+    'otsu': otsu,
+    'morph_close': morph_close,
+    'deskew': deskew,
+}
+
+PIPELINES = {
+    # The original extract_text_from_id preprocessing, minus its 1x1 morphological close (a no-op)
+    'bilateral_adaptive': [
+        ('grayscale', {}),
+        ('bilateral', {'diameter': 11, 'sigma_color': 17, 'sigma_space': 17}),
+        ('adaptive_threshold', {'block_size': 31, 'c': 15}),
+    ],
+    'clahe_otsu': [
+        ('grayscale', {}),
+        ('clahe', {}),
+        ('otsu', {}),
+    ],
+    'clahe_adaptive': [
+        ('grayscale', {}),
+        ('clahe', {}),
+        ('gaussian_blur', {'kernel_size': 3}),
+        ('adaptive_threshold', {'block_size': 31, 'c': 15}),
+    ],
+    'sharpen_otsu': [
+        ('grayscale', {}),
+        ('downscale', {'max_width': 1200}),
+        ('sharpen', {'amount': 1.0}),
+        ('otsu', {}),
+    ],
+    'deskew_clahe_otsu': [
+        ('grayscale', {}),
+        ('downscale', {'max_width': 1200}),
+        ('deskew', {}),
+        ('clahe', {}),
+        ('otsu', {}),
+    ],
+    'gray': [
+        ('grayscale', {}),  # Tesseract's own Otsu binarization does the rest
+    ],
+    # The original id_layout field binarization; a field crop holds one evenly lit text line
+    'otsu': [
+        ('grayscale', {}),
+        ('otsu', {}),
+    ],
+}
+
+
+def get_pipeline(name):
+    if name not in PIPELINES:
+        raise ValueError(f"Unknown preprocessing pipeline: {name} (known: {', '.join(PIPELINES)})")
+    return PIPELINES[name]
+
+
+def run_pipeline(img, pipeline=None):
+    """
+    Run img through a pipeline, given by name or as [(stage, params)].
+    The default is VERIFID_OCR_PREPROCESSING.
+    """
+    if pipeline is None or isinstance(pipeline, str):
+        pipeline = get_pipeline(pipeline or DEFAULT_PIPELINE)
+    for stage, params in pipeline:
+        img = STAGES[stage](img, **params)
+    return np.ascontiguousarray(img)
+
+
+def select_pipeline(scores, min_accuracy):
+    """
+    Pick the cheapest variant whose accuracy meets min_accuracy.
+
+    Args:
+        scores: {name: {"accuracy": float, "ms_per_image": float}}
+
+    Returns:
+        str: the chosen name, or the most accurate one if none qualifies
+    """
+    qualifying = [name for name, score in scores.items() if score['accuracy'] >= min_accuracy]
+    if not qualifying:
+        return max(scores, key=lambda name: (scores[name]['accuracy'], -scores[name]['ms_per_image']))
+    return min(qualifying, key=lambda name: scores[name]['ms_per_image'])
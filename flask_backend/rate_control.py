@@ -0,0 +1,91 @@
+# rate_control.py
+"""
+Server-driven frame rate negotiation for liveness sessions.
+
+The server tells each client at what fps, resolution and JPEG quality to send
+frames (the "liveness_rate" event) and moves the session up or down a ladder
+of settings based on measured processing latency and worker pool queue depth.
+Frames the server cannot keep up with are then never captured or sent.
+
+All state lives in the session dict so it survives session store round trips.
+"""
+import time
+
+# Ordered from best quality to cheapest
+RATE_LEVELS = [
+    {'fps': 4, 'width': 640, 'height': 480, 'quality': 0.7},
+    {'fps': 2, 'width': 640, 'height': 480, 'quality': 0.6},
+    {'fps': 2, 'width': 480, 'height': 360, 'quality': 0.6},
+    {'fps': 1, 'width': 640, 'height': 480, 'quality': 0.6},
+    {'fps': 1, 'width': 480, 'height': 360, 'quality': 0.5},
+    {'fps': 1, 'width': 320, 'height': 240, 'quality': 0.5},
+]
+# What the server used to process: clients sent 2 fps and every second frame was skipped.
+# Sessions only go faster when frames are quick and the pool is idle.
+DEFAULT_RATE_LEVEL = 3
+
+LATENCY_SMOOTHING = 0.3  # Weight of the newest sample in the latency moving average
+DEGRADE_BUDGET = 0.8  # Step down when latency exceeds this fraction of the frame interval
+UPGRADE_BUDGET = 0.35  # Step up when latency stays under this fraction of the next level's interval
+RATE_CHANGE_COOLDOWN = 2.0  # Seconds between two changes, so a single slow frame does not flap
+
+
+def rate_settings(level):
+    """Return the payload for the liveness_rate event at the given level."""
+    settings = dict(RATE_LEVELS[level])
+    settings['level'] = level
+    return settings
+
+
+def initial_rate_level(queue_depth, max_pending):
+    """Pick a starting level for a new session from the current pool load."""
+    if max_pending <= 0 or queue_depth < max_pending / 2:
+        return DEFAULT_RATE_LEVEL
+    if queue_depth < max_pending:
+        return DEFAULT_RATE_LEVEL + 1
+    return len(RATE_LEVELS) - 1
+
+
+def start_rate_control(session, queue_depth, max_pending):
+    """Initialise rate control state in session and return the settings to advertise."""
+    level = initial_rate_level(queue_depth, max_pending)
+    session['rate_level'] = level
+    session['rate_latency'] = None
+    session['rate_changed_at'] = time.time()
+    return rate_settings(level)
+
+
+def update_rate_control(session, latency, queue_depth, max_pending):
+    """
+    Record the processing latency of one frame and adjust the session level.
+
+    Returns:
+        dict: new settings to send to the client, or None if unchanged
+    """
+    if 'rate_level' not in session:
+        return None
+
+    previous = session.get('rate_latency')
+    smoothed = latency if previous is None else LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * previous
+    session['rate_latency'] = smoothed
+
+    now = time.time()
+    if now - session.get('rate_changed_at', 0) < RATE_CHANGE_COOLDOWN:
+        return None
+
+    level = session['rate_level']
+    interval = 1.0 / RATE_LEVELS[level]['fps']
+    new_level = level
+
+    if (smoothed > DEGRADE_BUDGET * interval or queue_depth >= max_pending) and level < len(RATE_LEVELS) - 1:
+        new_level = level + 1
+    elif level > 0 and queue_depth < max_pending / 2:
+        faster_interval = 1.0 / RATE_LEVELS[level - 1]['fps']
+        if smoothed < UPGRADE_BUDGET * faster_interval:
+            new_level = level - 1
+
+    if new_level == level:
+        return None
+    session['rate_level'] = new_level
+    session['rate_changed_at'] = now
+    return rate_settings(new_level)
@@ -0,0 +1,440 @@
+# resp_server.py
+"""
+Minimal Redis-protocol server for running a local cluster without Redis.
+
+It implements the commands the shared session store (session_store.RedisSessionStore)
+and Flask-SocketIO's message queue use: strings with expiry, sets, sorted sets,
+pub/sub and MULTI/EXEC pipelines with WATCH. Everything lives in this process's memory, so sessions
+survive server worker restarts but not a restart of this process. Use a real
+Redis for anything beyond one machine.
+
+    python resp_server.py --port 6390
+"""
+import argparse
+import asyncio
+import fnmatch
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = 1.0  # Seconds between scans for expired keys
+
+
+class SimpleString(str):
+    pass
+
+
+class ReplyError(Exception):
+    pass
+
+
+class MultiReply:
+    """Several top-level replies to one command, as SUBSCRIBE sends one per channel."""
+
+    def __init__(self, replies):
+        self.replies = replies
+
+
+class Map(dict):
+    """A RESP3 map; sent as a flat key/value array to RESP2 clients."""
+
+
+class Push(list):
+    """An out-of-band RESP3 push (pub/sub frames); a plain array for RESP2 clients."""
+
+
+def encode_reply(value, protocol=2):
+    """Serialize a reply for a client speaking RESP2 or RESP3 (after HELLO 3)."""
+    if value is None:
+        return b"_\r\n" if protocol == 3 else b"$-1\r\n"
+    if isinstance(value, ReplyError):
+        return b"-" + str(value).encode() + b"\r\n"
+    if isinstance(value, SimpleString):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, Map):
+        items = [item for pair in value.items() for item in pair]
+        if protocol == 3:
+            return b"%%%d\r\n" % len(value) + b"".join(encode_reply(item, protocol) for item in items)
+        value = items
+    prefix = b">" if protocol == 3 and isinstance(value, Push) else b"*"
+    return prefix + b"%d\r\n" % len(value) + b"".join(encode_reply(item, protocol) for item in value)
+
+
+OK = SimpleString("OK")
+QUEUED = SimpleString("QUEUED")
+
+
+async def read_command(reader):
+    """One command as a list of bytes arguments (RESP array or inline), or None at EOF."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # Inline command, as typed into telnet
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        if not header.startswith(b"$"):
+            raise ReplyError("ERR Protocol error: expected bulk string")
+        data = await reader.readexactly(int(header[1:]) + 2)
+        args.append(data[:-2])
+    return args
+
+
+def parse_score_bound(bound):
+    """A ZRANGEBYSCORE bound as (score, exclusive): b"-inf", b"1.5" or b"(1.5"."""
+    if bound.startswith(b"("):
+        return float(bound[1:]), True
+    return float(bound), False
+
+
+def in_score_range(score, low, high):
+    (low, low_exclusive), (high, high_exclusive) = low, high
+    return (score > low if low_exclusive else score >= low) and (score < high if high_exclusive else score <= high)
+
+
+class Keyspace:
+    """
+    Keys holding bytes, sets or sorted sets (member -> score dicts), with
+    absolute expiry times. Every change to a key bumps its version, which
+    WATCH compares at EXEC time.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+        self._clock = 0
+
+    def touch(self, key):
+        self._clock += 1
+        self.versions[key] = self._clock
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            del self.expires[key]
+            self.touch(key)
+        return key in self.data
+
+    def get(self, key, kind=None):
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if kind is not None and not isinstance(value, kind):
+            raise ReplyError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        self.touch(key)
+
+    def delete(self, key):
+        existed = self._alive(key)
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        if existed:
+            self.touch(key)
+        return existed
+
+    def expire_at(self, key, expires_at):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = expires_at
+        self.touch(key)
+        return 1
+
+    def sweep(self):
+        now = time.time()
+        for key in [key for key, expires_at in self.expires.items() if expires_at <= now]:
+            self.data.pop(key, None)
+            del self.expires[key]
+            self.touch(key)
+
+
+class RespServer:
+    def __init__(self):
+        self.keyspace = Keyspace()
+        self.channels = {}  # channel -> {subscribed writer: its protocol version}
+
+    # --- Commands; each takes the connection state and the arguments after the name ---
+
+    def cmd_ping(self, conn, *args):
+        if conn["subscriptions"] and conn["protocol"] == 2:
+            return [b"pong", args[0] if args else b""]  # RESP2 clients in pub/sub mode expect a message
+        return args[0] if args else SimpleString("PONG")
+
+    def cmd_echo(self, conn, message):
+        return message
+
+    def cmd_hello(self, conn, *args):
+        if args:
+            protocol = int(args[0])
+            if protocol not in (2, 3):
+                return ReplyError("NOPROTO unsupported protocol version")
+            conn["protocol"] = protocol
+        return Map({"server": "verifid-resp", "version": "7.0.0", "proto": conn["protocol"],
+                    "id": id(conn) & 0xffffffff, "mode": "standalone", "role": "master", "modules": []})
+
+    def cmd_select(self, conn, db):
+        return OK  # One keyspace; clients only ever use db 0 here
+
+    def cmd_client(self, conn, *args):
+        return OK  # CLIENT SETNAME/SETINFO sent by clients on connect
+
+    def cmd_get(self, conn, key):
+        return self.keyspace.get(key, bytes)
+
+    def cmd_set(self, conn, key, value, *options):
+        options = [option.upper() for option in options]
+        exists = self.keyspace.get(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        self.keyspace.set(key, value)
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                self.keyspace.expire_at(key, time.time() + int(options[options.index(unit) + 1]) * scale)
+        return OK
+
+    def cmd_del(self, conn, *keys):
+        return sum(self.keyspace.delete(key) for key in keys)
+
+    def cmd_exists(self, conn, *keys):
+        return sum(self.keyspace.get(key) is not None for key in keys)
+
+    def cmd_expire(self, conn, key, seconds):
+        return self.keyspace.expire_at(key, time.time() + int(seconds))
+
+    def cmd_expireat(self, conn, key, timestamp):
+        return self.keyspace.expire_at(key, int(timestamp))
+
+    def cmd_ttl(self, conn, key):
+        if self.keyspace.get(key) is None:
+            return -2
+        expires_at = self.keyspace.expires.get(key)
+        return -1 if expires_at is None else max(0, round(expires_at - time.time()))
+
+    def cmd_keys(self, conn, pattern):
+        pattern = pattern.decode()
+        return [key for key in list(self.keyspace.data)
+                if self.keyspace.get(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)]
+
+    def cmd_flushdb(self, conn, *args):
+        self.keyspace = Keyspace()
+        return OK
+
+    def cmd_sadd(self, conn, key, *members):
+        members_set = self.keyspace.get(key, set)
+        if members_set is None:
+            members_set = set()
+            self.keyspace.set(key, members_set)
+        before = len(members_set)
+        members_set.update(members)
+        self.keyspace.touch(key)
+        return len(members_set) - before
+
+    def cmd_srem(self, conn, key, *members):
+        members_set = self.keyspace.get(key, set)
+        if members_set is None:
+            return 0
+        before = len(members_set)
+        members_set.difference_update(members)
+        self.keyspace.touch(key)
+        if not members_set:
+            self.keyspace.delete(key)
+        return before - len(members_set)
+
+    def cmd_smembers(self, conn, key):
+        return sorted(self.keyspace.get(key, set) or ())
+
+    def cmd_zadd(self, conn, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        scores = self.keyspace.get(key, dict)
+        if scores is None:
+            scores = {}
+            self.keyspace.set(key, scores)
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in scores
+            scores[member] = float(score)
+        self.keyspace.touch(key)
+        return added
+
+    def cmd_zrem(self, conn, key, *members):
+        scores = self.keyspace.get(key, dict)
+        if scores is None:
+            return 0
+        removed = sum(scores.pop(member, None) is not None for member in members)
+        self.keyspace.touch(key)
+        if not scores:
+            self.keyspace.delete(key)
+        return removed
+
+    def cmd_zrangebyscore(self, conn, key, low, high):
+        low, high = parse_score_bound(low), parse_score_bound(high)
+        scores = self.keyspace.get(key, dict) or {}
+        return [member for member, score in sorted(scores.items(), key=lambda item: (item[1], item[0]))
+                if in_score_range(score, low, high)]
+
+    def cmd_zremrangebyscore(self, conn, key, low, high):
+        members = self.cmd_zrangebyscore(conn, key, low, high)
+        return self.cmd_zrem(conn, key, *members) if members else 0
+
+    def cmd_watch(self, conn, *keys):
+        if conn["transaction"] is not None:
+            return ReplyError("ERR WATCH inside MULTI is not allowed")
+        if not keys:
+            raise TypeError
+        for key in keys:
+            self.keyspace._alive(key)
+            conn["watched"].setdefault(key, self.keyspace.versions.get(key, 0))
+        return OK
+
+    def cmd_unwatch(self, conn):
+        conn["watched"].clear()
+        return OK
+
+    def cmd_publish(self, conn, channel, message):
+        subscribers = self.channels.get(channel, {})
+        frames = {}
+        for writer, protocol in subscribers.items():
+            if protocol not in frames:
+                frames[protocol] = encode_reply(Push([b"message", channel, message]), protocol)
+            writer.write(frames[protocol])
+        return len(subscribers)
+
+    def cmd_subscribe(self, conn, *channels):
+        replies = []
+        for channel in channels:
+            self.channels.setdefault(channel, {})[conn["writer"]] = conn["protocol"]
+            conn["subscriptions"].add(channel)
+            replies.append(Push([b"subscribe", channel, len(conn["subscriptions"])]))
+        return MultiReply(replies)
+
+    def cmd_unsubscribe(self, conn, *channels):
+        replies = []
+        for channel in channels or list(conn["subscriptions"]):
+            self._unsubscribe(conn, channel)
+            replies.append(Push([b"unsubscribe", channel, len(conn["subscriptions"])]))
+        if not replies:
+            replies.append(Push([b"unsubscribe", None, 0]))
+        return MultiReply(replies)
+
+    def _unsubscribe(self, conn, channel):
+        conn["subscriptions"].discard(channel)
+        subscribers = self.channels.get(channel)
+        if subscribers is not None:
+            subscribers.pop(conn["writer"], None)
+            if not subscribers:
+                del self.channels[channel]
+
+    # --- Connection handling ---
+
+    def execute(self, conn, args):
+        name = args[0].decode().lower()
+        if conn["transaction"] is not None and name not in ("exec", "discard", "multi"):
+            conn["transaction"].append(args)
+            return QUEUED
+        if name == "multi":
+            if conn["transaction"] is not None:
+                return ReplyError("ERR MULTI calls can not be nested")
+            conn["transaction"] = []
+            return OK
+        if name in ("exec", "discard"):
+            queued, conn["transaction"] = conn["transaction"], None
+            if queued is None:
+                return ReplyError(f"ERR {name.upper()} without MULTI")
+            watched, conn["watched"] = conn["watched"], {}
+            if name == "discard":
+                return OK
+            for key, version in watched.items():
+                self.keyspace._alive(key)
+                if self.keyspace.versions.get(key, 0) != version:
+                    return None  # A watched key changed: the transaction is aborted
+            return [self.execute(conn, queued_args) for queued_args in queued]
+
+        handler = getattr(self, "cmd_" + name, None)
+        if handler is None:
+            return ReplyError(f"ERR unknown command '{name}'")
+        try:
+            return handler(conn, *args[1:])
+        except TypeError:
+            return ReplyError(f"ERR wrong number of arguments for '{name}' command")
+        except ReplyError as e:
+            return e
+        except ValueError:
+            return ReplyError("ERR value is not an integer or out of range")
+
+    async def handle(self, reader, writer):
+        conn = {"writer": writer, "subscriptions": set(), "transaction": None, "watched": {}, "protocol": 2}
+        try:
+            while True:
+                try:
+                    args = await read_command(reader)
+                except ReplyError as e:
+                    writer.write(encode_reply(e, conn["protocol"]))
+                    break
+                if args is None:
+                    break
+                if not args:
+                    continue
+                if args[0].lower() == b"quit":
+                    writer.write(encode_reply(OK, conn["protocol"]))
+                    break
+                reply = self.execute(conn, args)
+                if isinstance(reply, MultiReply):
+                    writer.write(b"".join(encode_reply(item, conn["protocol"]) for item in reply.replies))
+                else:
+                    writer.write(encode_reply(reply, conn["protocol"]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in list(conn["subscriptions"]):
+                self._unsubscribe(conn, channel)
+            writer.close()
+
+    async def sweep_forever(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            self.keyspace.sweep()
+
+
+async def serve(host, port):
+    server = RespServer()
+    listener = await asyncio.start_server(server.handle, host, port)
+    logger.info("Redis-protocol stand-in listening on %s:%s", host, port)
+    sweeper = asyncio.ensure_future(server.sweep_forever())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        sweeper.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
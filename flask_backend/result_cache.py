@@ -0,0 +1,193 @@
+# result_cache.py
+"""
+Content-addressed cache of /verify/id results.
+
+Users often resubmit the same card photo after a form error. Results are
+keyed by the SHA-256 of the uploaded bytes, so an identical resubmission is
+answered without decoding the image or touching the worker pool; only the
+user_data comparison is redone.
+
+Two tiers:
+- memory: an LRU bounded by entry count and by pickled size
+- disk (optional): one pickle per entry under a hash-sharded directory,
+  bounded by total size. Entries are pickled, so the directory must only be
+  writable by the server. Writes and trimming run on a background thread,
+  never on the request that put the entry.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = int(os.environ.get('VERIFID_RESULT_CACHE_SIZE', 1024))  # Entries; 0 disables the cache
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('VERIFID_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+RESULT_CACHE_DIR = os.environ.get('VERIFID_RESULT_CACHE_DIR')  # Unset: no disk tier
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get('VERIFID_RESULT_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+DISK_TRIM_TARGET = 0.9  # Disk tier is trimmed to this fraction of its bound
+MAX_PENDING_DISK_WRITES = 64  # Further entries skip the disk tier while the disk lags behind
+
+
+def content_hash(data):
+    """Hex SHA-256 of an upload's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """Two-tier LRU keyed by content hash; values are picklable objects."""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_MAX_BYTES,
+                 disk_dir=RESULT_CACHE_DIR, disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (pickled value, size)
+        self._bytes = 0
+        self._disk_bytes = None  # Scanned lazily on the first disk write
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._disk_writer = None
+        if disk_dir:
+            os.makedirs(disk_dir, mode=0o700, exist_ok=True)
+            self._disk_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-cache-disk')
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Return a fresh copy of the cached value, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                return pickle.loads(item[0])
+
+        data = self._read_disk(key)
+        if data is None:
+            return None
+        with self._lock:
+            self._remember(key, data)
+        return pickle.loads(data)
+
+    def put(self, key, value, disk_value=None, persist=True):
+        """
+        Cache value under key. disk_value, if given, is written to the disk
+        tier instead, e.g. value without data that must not be persisted;
+        with persist False the entry stays in memory only.
+        """
+        if not self.enabled:
+            return
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, data)
+            if not self.disk_dir or not persist:
+                return
+            if self._pending_writes >= MAX_PENDING_DISK_WRITES:
+                logger.debug("Disk tier busy, keeping result %s in memory only", key)
+                return
+            self._pending_writes += 1
+        if disk_value is not None:
+            data = pickle.dumps(disk_value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._disk_writer.submit(self._write_disk, key, data)
+
+    def flush(self):
+        """Wait for the pending disk writes."""
+        if self._disk_writer is not None:
+            self._disk_writer.submit(lambda: None).result()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, data):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        if len(data) > self.max_bytes:
+            return
+        self._entries[key] = (data, len(data))
+        self._bytes += len(data)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    # --- Disk tier ---
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.pkl')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Could not read cached result %s: %s", key, e)
+            return None
+
+    def _write_disk(self, key, data):
+        """Runs on the disk writer thread."""
+        try:
+            self._store_disk(key, data)
+        finally:
+            with self._lock:
+                self._pending_writes -= 1
+
+    def _store_disk(self, key, data):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # Readers never see a partial entry
+        except OSError as e:
+            logger.warning("Could not write cached result %s: %s", key, e)
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_bytes += len(data)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._trim_disk()
+
+    def _scan_disk(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for filename in files:
+                if filename.endswith('.pkl'):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _trim_disk(self):
+        """Delete the least recently written entries until the disk tier is below DISK_TRIM_TARGET."""
+        entries = sorted(self._scan_disk(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * DISK_TRIM_TARGET
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,15 @@
+# server.py
+"""
+Entry point of a VerifID server process:
+
+    python server.py
+
+The worker pool spawns its processes, and spawn re-imports the parent's main
+script in every worker. app.py builds the Flask app, the session store and
+the log listener at import, so it must not be that script; this module only
+imports it under the __main__ guard.
+"""
+
+if __name__ == '__main__':
+    from app import serve
+    serve()
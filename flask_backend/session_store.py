@@ -0,0 +1,253 @@
+# session_store.py
+"""
+Verification session storage.
+
+Sessions expire by the same rules the old full-scan cleanup used: 10 minutes
+after creation, 5 minutes after a disconnect, 30 seconds after completing or
+failing. Each store tracks the resulting expiry time per session, so cleanup
+only touches sessions that actually expired, and keeps a socket sid -> session
+reverse index for disconnect handling.
+
+Sessions are plain dicts. Callers mutate them and then call save(); the
+in-memory store hands out the stored dict itself, the Redis store a copy.
+Handlers that hold a session across a wait (a worker pool job) write through
+update() instead, which applies their change to the session as it is now, so
+changes other handlers or server processes made meanwhile are not lost.
+"""
+import heapq
+import logging
+import pickle
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX_AGE = 600  # Seconds a session may live in total
+DISCONNECTED_SESSION_TTL = 300  # Seconds a disconnected session is kept for reconnection
+FINISHED_SESSION_TTL = 30  # Seconds a completed/failed session is kept for frontend cleanup
+UPDATE_ATTEMPTS = 5  # Optimistic read-modify-write attempts before update() gives up
+EXPIRY_RETENTION = 3600  # Seconds expired session ids stay listed for the cleanup() of every process
+
+
+class SessionConflictError(Exception):
+    """update() lost the race for a session to concurrent writers UPDATE_ATTEMPTS times in a row."""
+
+
+def session_expiry(session):
+    """Absolute time at which session expires under the cleanup rules."""
+    expires_at = session.get('created_at', 0) + SESSION_MAX_AGE
+    if session.get('disconnected') and 'disconnected_at' in session:
+        expires_at = min(expires_at, session['disconnected_at'] + DISCONNECTED_SESSION_TTL)
+    if session.get('status') in ['completed', 'failed'] and 'completed_at' in session:
+        expires_at = min(expires_at, session['completed_at'] + FINISHED_SESSION_TTL)
+    return expires_at
+
+
+class InMemorySessionStore:
+    """Process-local session store with an expiry heap and a socket sid index."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._expiry = {}
+        self._heap = []
+        self._sid_index = {}
+        self._sid_of = {}
+        self._lock = threading.RLock()
+
+    def get(self, session_id):
+        """Return the session dict, or None if it does not exist or has expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or self._expiry[session_id] <= time.time():
+                return None
+            return session
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def save(self, session_id, session):
+        """Store session and update its expiry and sid index entries."""
+        with self._lock:
+            self._sessions[session_id] = session
+            expires_at = session_expiry(session)
+            if self._expiry.get(session_id) != expires_at:
+                self._expiry[session_id] = expires_at
+                # Older heap entries for this session are skipped lazily in cleanup()
+                heapq.heappush(self._heap, (expires_at, session_id))
+            self._index_sid(session_id, session.get('socket_sid'))
+
+    def update(self, session_id, apply):
+        """
+        Read-modify-write a session atomically. apply(session) mutates the
+        current session and may return False to leave it unsaved. Returns the
+        session, or None if it does not exist.
+        """
+        with self._lock:
+            session = self.get(session_id)
+            if session is None:
+                return None
+            if apply(session) is not False:
+                self.save(session_id, session)
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._expiry.pop(session_id, None)
+            self._index_sid(session_id, None)
+
+    def find_by_sid(self, sid):
+        """Return [(session_id, session)] for the sessions bound to a socket sid."""
+        with self._lock:
+            return [(session_id, self._sessions[session_id]) for session_id in self._sid_index.get(sid, ())]
+
+    def cleanup(self, now=None):
+        """Remove expired sessions in O(expired log n) and return their ids."""
+        now = time.time() if now is None else now
+        removed = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, session_id = heapq.heappop(self._heap)
+                if self._expiry.get(session_id) != expires_at:
+                    continue  # Superseded by a later save or already deleted
+                self.delete(session_id)
+                removed.append(session_id)
+        return removed
+
+    def _index_sid(self, session_id, sid):
+        old_sid = self._sid_of.get(session_id)
+        if old_sid == sid:
+            return
+        if old_sid is not None:
+            ids = self._sid_index.get(old_sid)
+            if ids is not None:
+                ids.discard(session_id)
+                if not ids:
+                    del self._sid_index[old_sid]
+        if sid is None:
+            self._sid_of.pop(session_id, None)
+        else:
+            self._sid_of[session_id] = sid
+            self._sid_index.setdefault(sid, set()).add(session_id)
+
+
+class RedisSessionStore:
+    """
+    Session store shared by several server processes through a Redis-protocol server.
+
+    Any server speaking the Redis protocol can back it. Expiry is delegated to
+    the server with EXPIREAT; a sorted set of expiry times additionally lets
+    cleanup() report the sessions that expired, so each process can drop its
+    own per-session state. Expired ids stay in that set for EXPIRY_RETENTION
+    seconds and every process reports those past its own last cleanup, since
+    the process holding a session's state is not necessarily the first one
+    to clean up. Sessions hold numpy arrays and are pickled, so the server
+    must be trusted infrastructure.
+    """
+
+    def __init__(self, client, prefix='verifid:'):
+        self._client = client
+        self._prefix = prefix
+        self._cleaned_until = time.time()
+
+    def _session_key(self, session_id):
+        return f"{self._prefix}session:{session_id}"
+
+    def _sid_key(self, sid):
+        return f"{self._prefix}sid:{sid}"
+
+    @property
+    def _expiry_key(self):
+        return f"{self._prefix}expiry"
+
+    def get(self, session_id):
+        data = self._client.get(self._session_key(session_id))
+        return pickle.loads(data) if data is not None else None
+
+    def __contains__(self, session_id):
+        return bool(self._client.exists(self._session_key(session_id)))
+
+    def save(self, session_id, session):
+        pipe = self._client.pipeline()
+        self._queue_save(pipe, session_id, session)
+        pipe.execute()
+
+    def _queue_save(self, pipe, session_id, session):
+        expires_at = session_expiry(session)
+        if expires_at <= time.time():
+            self._queue_delete(pipe, session_id)
+            return
+        pipe.set(self._session_key(session_id), pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL))
+        pipe.expireat(self._session_key(session_id), int(expires_at) + 1)
+        pipe.zadd(self._expiry_key, {session_id: expires_at})
+        sid = session.get('socket_sid')
+        if sid:
+            pipe.sadd(self._sid_key(sid), session_id)
+            pipe.expireat(self._sid_key(sid), int(time.time()) + SESSION_MAX_AGE)
+
+    def update(self, session_id, apply):
+        """
+        Read-modify-write a session with WATCH/MULTI: if another client writes
+        it in between, the write is dropped and apply() runs again on the new
+        version, so apply must not have side effects beyond the session.
+        Returns the session, or None if it does not exist.
+        """
+        import redis
+
+        key = self._session_key(session_id)
+        for _ in range(UPDATE_ATTEMPTS):
+            with self._client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    if data is None:
+                        return None
+                    session = pickle.loads(data)
+                    if apply(session) is False:
+                        return session
+                    pipe.multi()
+                    self._queue_save(pipe, session_id, session)
+                    pipe.execute()
+                    return session
+                except redis.WatchError:
+                    logger.debug("Session %s changed during update, retrying", session_id)
+        raise SessionConflictError(f"Session {session_id} kept changing during update")
+
+    def delete(self, session_id):
+        pipe = self._client.pipeline()
+        self._queue_delete(pipe, session_id)
+        pipe.execute()
+
+    def _queue_delete(self, pipe, session_id):
+        pipe.delete(self._session_key(session_id))
+        pipe.zrem(self._expiry_key, session_id)
+
+    def find_by_sid(self, sid):
+        found = []
+        for session_id in self._client.smembers(self._sid_key(sid)):
+            session_id = session_id.decode() if isinstance(session_id, bytes) else session_id
+            session = self.get(session_id)
+            if session is not None and session.get('socket_sid') == sid:
+                found.append((session_id, session))
+        return found
+
+    def cleanup(self, now=None):
+        """Return the ids of sessions that expired since this store's last cleanup."""
+        now = time.time() if now is None else now
+        pipe = self._client.pipeline()
+        pipe.zrangebyscore(self._expiry_key, f"({self._cleaned_until}", now)
+        pipe.zremrangebyscore(self._expiry_key, '-inf', now - EXPIRY_RETENTION)
+        expired, _ = pipe.execute()
+        self._cleaned_until = max(self._cleaned_until, now)
+        return [session_id.decode() if isinstance(session_id, bytes) else session_id for session_id in expired]
+
+
+def create_session_store(url=None):
+    """Create a session store from a URL: empty or memory:// for in-process, redis:// for shared."""
+    if not url or url.startswith('memory://'):
+        return InMemorySessionStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        logger.info("Using shared Redis session store at %s", url)
+        return RedisSessionStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported session store URL: {url}")
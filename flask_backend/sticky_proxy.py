@@ -0,0 +1,160 @@
+# sticky_proxy.py
+"""
+Sticky TCP load balancer for a local VerifID cluster.
+
+Each client connection is routed by the first HTTP request on it: requests
+carrying a verification_id query parameter (every Socket.IO request from the
+liveness page, handshake and polling included) go to the backend chosen for
+that id by rendezvous hashing; other requests are spread by client address.
+All frames of one liveness session therefore reach the same server, where its
+frame mailbox lives. WebSocket upgrades are piped through unchanged.
+
+A backend that refuses connections is skipped for BACKEND_RETRY_AFTER seconds
+and its sessions move to the next backend in their ranking, which picks them
+up from the shared session store. Backends whose /ready does not answer 200,
+such as a restarted server still warming up, only get traffic when no ready
+backend is left.
+
+    python sticky_proxy.py --port 5001 127.0.0.1:5101 127.0.0.1:5102
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 64 * 1024
+BACKEND_RETRY_AFTER = 2.0  # Seconds a refusing backend is skipped
+READY_PATH = '/ready'
+PROBE_INTERVAL = 1.0  # Seconds between readiness probes of each backend
+PIPE_CHUNK = 64 * 1024
+
+
+def affinity_key(head, client_host):
+    """The routing key of a connection from its first request head: verification_id, else the client address."""
+    try:
+        target = head.split(b"\r\n", 1)[0].split(b" ")[1].decode('latin-1')
+    except IndexError:
+        return client_host
+    values = parse_qs(urlsplit(target).query).get('verification_id')
+    return values[0] if values else client_host
+
+
+def rank_backends(key, backends):
+    """Backends in rendezvous-hash order for key; removing one only moves the keys it owned."""
+    def weight(backend):
+        return hashlib.blake2b(f"{backend}|{key}".encode(), digest_size=8).digest()
+    return sorted(backends, key=weight, reverse=True)
+
+
+class StickyProxy:
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self._down_until = {}
+        self._ready = {}
+
+    async def probe_forever(self, backend):
+        """Keep self._ready[backend] current from GET /ready."""
+        host, port = backend.rsplit(':', 1)
+        while True:
+            ready = False
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), PROBE_INTERVAL)
+                writer.write(f"GET {READY_PATH} HTTP/1.0\r\nHost: {backend}\r\n\r\n".encode())
+                status_line = await asyncio.wait_for(reader.readline(), PROBE_INTERVAL)
+                ready = status_line.split(b" ")[1:2] == [b"200"]
+            except (OSError, asyncio.TimeoutError):
+                pass
+            finally:
+                if writer is not None:
+                    writer.close()
+            if ready != self._ready.get(backend, False):
+                logger.info("Backend %s is %s", backend, "ready" if ready else "not ready")
+            self._ready[backend] = ready
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    async def _connect(self, key):
+        now = time.time()
+        ranked = rank_backends(key, self.backends)
+        # Ready backends first, then ones still warming up; those marked down are still tried last
+        up = [b for b in ranked if self._down_until.get(b, 0) <= now]
+        candidates = ([b for b in up if self._ready.get(b)] + [b for b in up if not self._ready.get(b)]
+                      + [b for b in ranked if self._down_until.get(b, 0) > now])
+        for backend in candidates:
+            host, port = backend.rsplit(':', 1)
+            try:
+                reader, writer = await asyncio.open_connection(host, int(port))
+            except OSError:
+                if self._down_until.get(backend, 0) <= now:
+                    logger.warning("Backend %s unavailable, routing around it", backend)
+                self._down_until[backend] = now + BACKEND_RETRY_AFTER
+                continue
+            self._down_until.pop(backend, None)
+            return backend, reader, writer
+        return None, None, None
+
+    async def handle(self, client_reader, client_writer):
+        client_host = client_writer.get_extra_info('peername')[0]
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        key = affinity_key(head, client_host)
+        backend, reader, writer = await self._connect(key)
+        if backend is None:
+            client_writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await client_writer.drain()
+            client_writer.close()
+            return
+
+        writer.write(head)
+        await asyncio.gather(self._pipe(client_reader, writer), self._pipe(reader, client_writer))
+
+    async def _pipe(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(PIPE_CHUNK)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, backends):
+    proxy = StickyProxy(backends)
+    listener = await asyncio.start_server(proxy.handle, host, port, limit=MAX_HEADER_BYTES)
+    logger.info("Sticky proxy on %s:%s -> %s", host, port, ', '.join(backends))
+    probes = [asyncio.ensure_future(proxy.probe_forever(backend)) for backend in backends]
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        for probe in probes:
+            probe.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('backends', nargs='+', help='host:port of each server process')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.backends))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+# The backend modules import each other by their flat names, as when app.py runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resp_server import RespServer  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def resp_url():
+    """A Redis-protocol stand-in served from a background thread."""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    async def start():
+        state['listener'] = await asyncio.start_server(RespServer().handle, '127.0.0.1', 0)
+        state['port'] = state['listener'].sockets[0].getsockname()[1]
+        started.set()
+
+    thread = threading.Thread(target=lambda: (loop.run_until_complete(start()), loop.run_forever()), daemon=True)
+    thread.start()
+    started.wait(5)
+    yield f"redis://127.0.0.1:{state['port']}/0"
+
+    async def stop():
+        state['listener'].close()
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
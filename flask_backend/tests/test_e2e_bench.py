@@ -0,0 +1,34 @@
+import pytest
+
+from benchmarks import e2e_bench
+from metrics import STAGE_SECONDS, render_prometheus
+
+
+def test_stage_totals_are_parsed_from_metrics():
+    text = '\n'.join([
+        'verifid_stage_seconds_bucket{stage="decode",le="0.01"} 3',
+        'verifid_stage_seconds_count{stage="decode"} 4',
+        'verifid_stage_seconds_sum{stage="decode"} 0.02',
+        'verifid_stage_seconds_count{stage="ocr"} 1',
+        'verifid_stage_seconds_sum{stage="ocr"} 1.5',
+        'verifid_other_seconds_count{stage="decode"} 99',
+    ])
+    assert e2e_bench.parse_stage_totals(text) == {'decode': (4, 0.02), 'ocr': (1, 1.5)}
+
+
+def test_stage_totals_match_the_rendered_histogram():
+    totals = e2e_bench.parse_stage_totals(render_prometheus())
+    before = totals.get('bench_test', (0, 0.0))
+    STAGE_SECONDS.labels('bench_test').observe(0.25)
+    count, seconds = e2e_bench.parse_stage_totals(render_prometheus())['bench_test']
+    assert count == before[0] + 1
+    assert seconds == pytest.approx(before[1] + 0.25)
+
+
+def test_stage_deltas_leave_out_idle_stages():
+    before = {'decode': (4, 0.02), 'ocr': (1, 1.5)}
+    after = {'decode': (6, 0.05), 'ocr': (1, 1.5), 'detect': (2, 0.1)}
+    assert e2e_bench.stage_deltas(before, after) == {
+        'decode': {'count': 2, 'total_ms': 30.0, 'mean_ms': 15.0},
+        'detect': {'count': 2, 'total_ms': 100.0, 'mean_ms': 50.0},
+    }
@@ -0,0 +1,130 @@
+import json
+import os
+
+import numpy as np
+
+import encoding_store
+from encoding_store import EncodingStore, get_encoding_store
+
+
+def encoding(value):
+    return np.full(128, value, dtype=np.float64)
+
+
+def test_put_get_roundtrip(tmp_path):
+    store = EncodingStore(str(tmp_path))
+    store.put('alice', encoding(0.25))
+
+    result = store.get('alice')
+    assert result.dtype == np.float64
+    assert np.allclose(result, 0.25)
+    assert store.get('bob') is None
+    assert 'alice' in store and len(store) == 1
+
+
+def test_user_ids_are_strings(tmp_path):
+    store = EncodingStore(str(tmp_path))
+    store.put(42, encoding(0.5))
+    assert np.allclose(store.get('42'), 0.5)
+
+
+def test_reenrolment_replaces_encoding(tmp_path):
+    store = EncodingStore(str(tmp_path))
+    store.put('alice', encoding(0.1))
+    store.put('alice', encoding(0.9))
+
+    assert np.allclose(store.get('alice'), 0.9)
+    assert len(store) == 1
+
+
+def test_other_process_sees_enrolments_and_reenrolments(tmp_path):
+    writer = EncodingStore(str(tmp_path))
+    reader = EncodingStore(str(tmp_path))
+    writer.put('alice', encoding(0.1))
+    assert np.allclose(reader.get('alice'), 0.1)  # Now in reader's LRU
+
+    writer.put('alice', encoding(0.7))
+    assert np.allclose(reader.get('alice'), 0.7)
+
+
+def test_delete(tmp_path):
+    store = EncodingStore(str(tmp_path))
+    store.put('alice', encoding(0.1))
+    store.put('bob', encoding(0.2))
+    store.delete('alice')
+    store.delete('nobody')
+
+    assert store.get('alice') is None
+    assert 'alice' not in store
+    assert np.allclose(store.get('bob'), 0.2)
+    assert EncodingStore(str(tmp_path)).get('alice') is None
+
+
+def test_delete_drops_other_processes_cached_encoding(tmp_path):
+    writer = EncodingStore(str(tmp_path))
+    reader = EncodingStore(str(tmp_path))
+    writer.put('alice', encoding(0.1))
+    assert reader.get('alice') is not None
+
+    writer.delete('alice')
+    assert reader.get('alice') is None
+
+
+def test_snapshot_holds_latest_rows(tmp_path):
+    store = EncodingStore(str(tmp_path))
+    assert store.snapshot()[0] == []
+    store.put('alice', encoding(0.1))
+    store.put('bob', encoding(0.2))
+    store.put('alice', encoding(0.3))
+    store.delete('bob')
+
+    user_ids, vectors = store.snapshot()
+    assert user_ids == ['alice']
+    assert vectors.shape == (1, 128) and vectors.dtype == np.float32
+    assert np.allclose(vectors[0], 0.3)
+
+
+def test_enrolment_appends_one_index_record(tmp_path):
+    store = EncodingStore(str(tmp_path))
+    store.put('alice', encoding(0.1))
+    store.put('bob', encoding(0.2))
+    store.delete('alice')
+    with open(store.index_path) as f:
+        assert [json.loads(line) for line in f] == [
+            {'user': 'alice', 'row': 0}, {'user': 'bob', 'row': 1}, {'user': 'alice', 'row': None}]
+
+
+def test_index_of_older_versions_is_converted(tmp_path):
+    np.stack([encoding(0.1), encoding(0.2)]).astype(np.float32).tofile(tmp_path / 'encodings.f32')
+    (tmp_path / 'encodings_index.json').write_text(json.dumps({'alice': 0, 'bob': 1}))
+    store = EncodingStore(str(tmp_path))
+    assert np.allclose(store.get('bob'), 0.2)
+    assert len(store) == 2
+
+
+def test_index_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(encoding_store, 'INDEX_COMPACT_MIN', 8)
+    writer = EncodingStore(str(tmp_path))
+    reader = EncodingStore(str(tmp_path))
+    writer.put('alice', encoding(0.1))
+    writer.put('bob', encoding(0.2))
+    assert np.allclose(reader.get('bob'), 0.2)  # Cached in the reader
+
+    writer.delete('bob')
+    for i in range(10):
+        writer.put('alice', encoding(i / 10))
+
+    with open(writer.index_path) as f:
+        assert len(f.readlines()) <= 8
+    # The reader read the journal before it was replaced; bob's deletion still applies
+    assert reader.get('bob') is None
+    assert np.allclose(reader.get('alice'), 0.9)
+    assert len(EncodingStore(str(tmp_path))) == 1
+
+
+def test_store_files_move_out_of_face_info(tmp_path):
+    EncodingStore(str(tmp_path)).put('alice', encoding(0.25))  # Where older versions kept them
+    store = get_encoding_store(str(tmp_path))
+    assert store.directory == str(tmp_path / 'encodings')
+    assert np.allclose(store.get('alice'), 0.25)
+    assert not os.path.exists(tmp_path / 'encodings.f32')
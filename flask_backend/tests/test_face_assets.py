@@ -0,0 +1,135 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import face_assets
+from encoding_store import get_encoding_store
+from face_assets import FaceAssetStore, Journal
+
+
+def jpeg(content):
+    return b'\xff\xd8' + content + b'\xff\xd9'
+
+
+def write_legacy(directory, user_id, data, mtime):
+    path = os.path.join(directory, f"{user_id}.jpg")
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize('backend', ['directory', 'pack'])
+def test_save_and_read_back(tmp_path, backend):
+    store = FaceAssetStore(str(tmp_path), backend=backend)
+    metadata = store.save('alice', jpeg(b'1'), box=(1, 2, 3, 4), quality=80.0)
+    assert metadata['box'] == [1, 2, 3, 4]
+
+    other = FaceAssetStore(str(tmp_path), backend=backend)  # Another process
+    assert other.get('alice')['quality'] == 80.0
+    assert 'encoding' not in other.get('alice')  # Kept in the encoding store only
+    assert other.read_image('alice') == jpeg(b'1')
+    assert 'alice' in other and 'bob' not in other
+    assert other.get('bob') is None
+
+    store.save('alice', jpeg(b'2'))
+    assert other.read_image('alice') == jpeg(b'2')
+    store.delete('alice')
+    assert 'alice' not in other and len(other) == 0
+
+
+def test_journal_starts_over_when_the_file_is_replaced(tmp_path):
+    path = str(tmp_path / 'refs.log')
+    writer, reader = Journal(path), Journal(path)
+    writer.append([{'n': i} for i in range(5)])
+    assert reader.read_new() == ([{'n': i} for i in range(5)], True)
+    assert reader.read_new() == ([], False)
+
+    writer.rewrite([{'n': 9}])
+    assert reader.read_new() == ([{'n': 9}], True)
+    writer.append([{'n': 10}])
+    assert reader.read_new() == ([{'n': 10}], False)
+    assert reader.records == 2
+
+
+def test_refs_log_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(face_assets, 'REFS_COMPACT_MIN', 8)
+    store = FaceAssetStore(str(tmp_path))
+    other = FaceAssetStore(str(tmp_path))
+    store.save('alice', jpeg(b'a'))
+    store.save('bob', jpeg(b'b'))
+    assert len(other) == 2
+
+    store.delete('bob')
+    for i in range(10):
+        store.save('alice', jpeg(b'a%d' % i))
+
+    with open(store._refs.path) as f:
+        assert len(f.readlines()) <= 8
+    # A process that read the old file must not keep its records, such as bob's
+    assert 'bob' not in other
+    assert other.read_image('alice') == jpeg(b'a9')
+    assert len(FaceAssetStore(str(tmp_path))) == 1
+
+
+def test_legacy_files_are_imported_once_and_moved(tmp_path):
+    write_legacy(str(tmp_path), 'alice', jpeg(b'old'), time.time() - 100)
+    store = FaceAssetStore(str(tmp_path))
+    assert 'alice' not in store  # Lookups never scan face_info/
+
+    assert store.import_legacy_files() == 1
+    assert store.read_image('alice') == jpeg(b'old')
+    assert not os.path.exists(tmp_path / 'alice.jpg')
+    assert (tmp_path / 'legacy_imported' / 'alice.jpg').read_bytes() == jpeg(b'old')
+    assert store.import_legacy_files() == 0
+    assert FaceAssetStore(str(tmp_path)).read_image('alice') == jpeg(b'old')
+
+
+def test_legacy_file_newer_than_the_face_replaces_it_and_its_encoding(tmp_path):
+    encodings = get_encoding_store(str(tmp_path))
+    store = FaceAssetStore(str(tmp_path))
+    store.save('alice', jpeg(b'new'))
+    encodings.put('alice', np.full(128, 0.5))
+
+    # Older than the current face: moved aside, not imported
+    write_legacy(str(tmp_path), 'alice', jpeg(b'older'), time.time() - 100)
+    assert store.import_legacy_files() == 0
+    assert store.read_image('alice') == jpeg(b'new')
+    assert not os.path.exists(tmp_path / 'alice.jpg')
+
+    # Written by a server still on the old version after the re-enrolment
+    write_legacy(str(tmp_path), 'alice', jpeg(b're-enrolled'), time.time() + 5)
+    assert store.import_legacy_files() == 1
+    assert store.read_image('alice') == jpeg(b're-enrolled')
+    assert encodings.get('alice') is None
+
+
+def test_partly_written_legacy_files_wait(tmp_path):
+    store = FaceAssetStore(str(tmp_path))
+    write_legacy(str(tmp_path), 'alice', jpeg(b'face')[:-2], time.time())
+    assert store.import_legacy_files() == 0
+    assert os.path.exists(tmp_path / 'alice.jpg')
+    write_legacy(str(tmp_path), 'alice', jpeg(b'face'), time.time() + 1)
+    assert store.import_legacy_files() == 1
+    assert store.read_image('alice') == jpeg(b'face')
+
+
+def test_legacy_imports_are_batched(tmp_path, monkeypatch):
+    monkeypatch.setattr(face_assets, 'LEGACY_IMPORT_BATCH', 2)
+    for i in range(5):
+        write_legacy(str(tmp_path), f'user{i}', jpeg(b'%d' % i), time.time())
+    store = FaceAssetStore(str(tmp_path))
+    assert store.import_legacy_files() == 5
+    assert len(FaceAssetStore(str(tmp_path))) == 5
+    assert len(os.listdir(tmp_path / 'legacy_imported')) == 5
+
+
+def test_deleting_a_user_removes_the_legacy_files(tmp_path):
+    write_legacy(str(tmp_path), 'alice', jpeg(b'old'), time.time() - 100)
+    store = FaceAssetStore(str(tmp_path))
+    store.import_legacy_files()
+    store.delete('alice')
+    assert not os.path.exists(tmp_path / 'legacy_imported' / 'alice.jpg')
+    assert 'alice' not in store
+    assert 'alice' not in FaceAssetStore(str(tmp_path))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from face_index import ENCODING_DIM, BruteForceIndex, DuplicateFaceIndex, IVFIndex
+
+
+@pytest.fixture
+def gallery():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, ENCODING_DIM)).astype(np.float32)
+    return [f"user{i}" for i in range(len(vectors))], vectors
+
+
+def exact_neighbours(vectors, query, k):
+    return list(np.argsort(np.linalg.norm(vectors - query, axis=1))[:k])
+
+
+def test_brute_force_search_is_exact(gallery):
+    user_ids, vectors = gallery
+    index = BruteForceIndex()
+    index.build(user_ids, vectors)
+    query = vectors[42] + 0.01
+    results = index.search(query, k=3)
+    assert [user_id for user_id, _ in results] == [user_ids[i] for i in exact_neighbours(vectors, query, 3)]
+    assert results[0][1] == pytest.approx(np.linalg.norm(vectors[42] - query), abs=1e-3)  # float32 norm expansion
+
+
+def test_brute_force_add_grows_and_replaces():
+    index = BruteForceIndex()
+    assert index.search(np.zeros(ENCODING_DIM)) == []
+    for i in range(40):
+        index.add(f"user{i}", np.full(ENCODING_DIM, i, dtype=np.float32))
+    assert len(index) == 40
+
+    index.add("user3", np.full(ENCODING_DIM, 100, dtype=np.float32))
+    assert len(index) == 40
+    assert index.search(np.full(ENCODING_DIM, 100), k=1)[0] == ("user3", pytest.approx(0.0))
+
+
+def test_ivf_finds_the_nearest_encoding(gallery):
+    user_ids, vectors = gallery
+    index = IVFIndex(nlist=8, nprobe=8)
+    index.build(user_ids, vectors)
+    assert len(index) == len(user_ids)
+    user_id, distance = index.search(vectors[7], k=1)[0]
+    assert user_id == "user7" and distance == pytest.approx(0.0, abs=1e-3)
+
+
+def test_ivf_re_enrolment_replaces_the_built_entry(gallery):
+    user_ids, vectors = gallery
+    index = IVFIndex(nlist=8, nprobe=8)
+    index.build(user_ids, vectors)
+
+    index.add("user7", vectors[8] + 0.01)
+    assert index.overflow_size == 1
+    assert len(index) == len(user_ids)
+    ids = [user_id for user_id, _ in index.search(vectors[7], k=len(user_ids))]
+    assert ids.count("user7") == 1  # Only the new encoding; the stale row is skipped
+    assert index.search(vectors[8], k=2)[0][0] in ("user7", "user8")
+
+
+def test_duplicates_exclude_the_user_and_respect_the_threshold(gallery):
+    user_ids, vectors = gallery
+    index = DuplicateFaceIndex()
+    index.build(user_ids, vectors)
+    index.add("new", vectors[3] + 0.001)
+
+    assert [user_id for user_id, _ in index.find_duplicates(vectors[3] + 0.001, exclude_user_id="new")] == ["user3"]
+    assert index.find_duplicates(vectors[3] + 0.2, exclude_user_id="new", threshold=0.1) == []
+
+
+def test_duplicate_index_switches_to_ivf_for_large_galleries(gallery):
+    user_ids, vectors = gallery
+    index = DuplicateFaceIndex(brute_force_max=100)
+    assert index.needs_rebuild(101)
+    index.build(user_ids, vectors)
+    assert index.built_at is not None
+    assert not index.needs_rebuild(len(user_ids))
+    assert index.find_duplicates(vectors[9], threshold=0.01)[0][0] == "user9"
@@ -0,0 +1,40 @@
+import numpy as np
+
+from face_matching import ENCODING_DIM, EncodingRingBuffer, distance_statistics
+
+
+def encoding(value):
+    return np.full(ENCODING_DIM, value, dtype=np.float64)
+
+
+def test_ring_buffer_keeps_the_newest_samples():
+    buffer = EncodingRingBuffer(capacity=3)
+    for value in range(5):
+        buffer.add(encoding(value))
+    assert len(buffer) == 3
+    assert sorted(buffer.encodings()[:, 0]) == [2, 3, 4]
+
+
+def test_cleared_buffer_starts_over():
+    buffer = EncodingRingBuffer(capacity=3)
+    buffer.add(encoding(1))
+    buffer.add(encoding(2))
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.encodings().shape == (0, ENCODING_DIM)
+
+    buffer.add(encoding(3))
+    assert buffer.encodings()[:, 0].tolist() == [3]
+
+
+def test_distance_statistics_resist_one_outlier():
+    reference = np.zeros(ENCODING_DIM)
+    step = 1 / np.sqrt(ENCODING_DIM)  # Encoding at distance 1 per unit of value
+    stats = distance_statistics(reference, [encoding(0.3 * step)] * 4 + [encoding(5 * step)])
+    assert stats['count'] == 5
+    assert np.isclose(stats['median'], 0.3)
+    assert np.isclose(stats['trimmed_mean'], 0.3)
+    assert np.isclose(stats['max'], 5.0)
+
+
+def test_distance_statistics_of_no_samples():
+    assert distance_statistics(np.zeros(ENCODING_DIM), np.empty((0, ENCODING_DIM)))['count'] == 0
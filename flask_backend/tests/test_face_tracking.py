@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+import liveness_service
+from face_tracker import (TRACKER_MIN_CONFIDENCE, TRACKER_REDETECT_INTERVAL, needs_detection, new_tracker_state,
+                          update_tracker)
+
+FACE = (100, 200, 200, 100)  # top, right, bottom, left
+
+
+def frame_with_patch(top, left, size=100, seed=0):
+    """Gray frame with a textured square standing in for a face."""
+    frame = np.full((480, 640, 3), 128, dtype=np.uint8)
+    patch = np.random.default_rng(seed).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    frame[top:top + size, left:left + size] = patch
+    return frame
+
+
+def test_tracker_follows_a_moving_face():
+    state = new_tracker_state(frame_with_patch(100, 100), FACE)
+    assert not needs_detection(state)
+
+    location, confidence = update_tracker(frame_with_patch(100, 130), state)
+    assert confidence >= TRACKER_MIN_CONFIDENCE
+    top, right, bottom, left = location
+    assert abs(left - 130) <= 3 and abs(top - 100) <= 3
+    assert (right - left, bottom - top) == (100, 100)
+    assert state['face_location'] == location
+
+
+def test_tracker_loses_a_face_that_disappears():
+    state = new_tracker_state(frame_with_patch(100, 100), FACE)
+    location, _ = update_tracker(np.full((480, 640, 3), 128, dtype=np.uint8), state)
+    assert location is None
+
+
+def test_detection_is_due_after_the_interval():
+    state = new_tracker_state(frame_with_patch(100, 100), FACE)
+    for _ in range(TRACKER_REDETECT_INTERVAL):
+        assert not needs_detection(state)
+        update_tracker(frame_with_patch(100, 100), state)
+    assert needs_detection(state)
+    assert needs_detection({})
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    """Replace the dlib detector with a queue of canned detection results."""
+    queue = []
+
+    def detect_faces(frame):
+        return queue.pop(0)
+    monkeypatch.setattr(liveness_service, 'detect_faces', detect_faces)
+    return queue
+
+
+def test_tracked_frames_report_no_face_count(detections):
+    frame = frame_with_patch(100, 100)
+    detections.append([FACE])
+    result = liveness_service.process_liveness_frame(frame, 150, 'center', tracker_state={})
+    assert result['face_detected'] and result['face_count'] == 1
+
+    result = liveness_service.process_liveness_frame(frame, 150, 'center', tracker_state=result['tracker_state'])
+    assert result['face_detected'] and result['face_count'] is None
+
+
+def test_forced_detection_sees_a_second_face(detections):
+    frame = frame_with_patch(100, 100)
+    detections.append([FACE])
+    state = liveness_service.process_liveness_frame(frame, 150, 'center', tracker_state={})['tracker_state']
+
+    detections.append([FACE, (100, 500, 200, 400)])
+    result = liveness_service.process_liveness_frame(frame, 150, 'center', tracker_state=state, force_detection=True)
+    assert not result['face_detected']
+    assert result['error_message'] == "Multiple faces detected"
+    assert result['face_count'] == 2
+    assert result['tracker_state'] == {}  # Not seeded from either face
+
+
+def test_centering_refuses_several_faces(detections, monkeypatch):
+    frame = frame_with_patch(100, 100)
+    monkeypatch.setattr(liveness_service, 'decode_frame', lambda data: frame)
+
+    detections.append([FACE, (100, 500, 200, 400)])
+    result = liveness_service.locate_face_in_frame(b'jpeg', start_tracking=True)
+    assert result['face_location'] is None and result['face_count'] == 2
+    assert result['tracker_state'] == {}
+
+    detections.append([FACE])
+    result = liveness_service.locate_face_in_frame(b'jpeg', start_tracking=True)
+    assert result['face_location'] == FACE and result['face_count'] == 1
+    assert result['tracker_state']['face_location'] == FACE
+
+
+def test_frames_feeding_the_match_are_detected(detections, monkeypatch):
+    frame = frame_with_patch(100, 100)
+    monkeypatch.setattr(liveness_service, 'decode_frame', lambda data: frame)
+    monkeypatch.setattr(liveness_service, 'encode_face', lambda frame, location: np.ones(128))
+    detections.append([FACE])
+    state = liveness_service.analyze_liveness_frame(b'jpeg', 150, 'center', tracker_state={})['tracker_state']
+
+    # A tracked frame would follow the first face and miss the second one
+    detections.append([FACE, (100, 500, 200, 400)])
+    result = liveness_service.analyze_liveness_frame(b'jpeg', 150, 'center', tracker_state=state, sample_encoding=True)
+    assert not detections
+    assert result['face_count'] == 2 and 'face_encoding' not in result
+
+    detections.append([FACE])
+    result = liveness_service.analyze_liveness_frame(b'jpeg', 150, 'center', tracker_state={}, sample_encoding=True)
+    assert result['face_count'] == 1 and result['face_encoding'] is not None
@@ -0,0 +1,41 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from liveness_service import decode_frame
+
+
+@pytest.fixture
+def frame():
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    image[:, 32:] = (0, 0, 255)
+    return image
+
+
+def encoded(frame, ext):
+    ok, buffer = cv2.imencode(ext, frame)
+    assert ok
+    return buffer.tobytes()
+
+
+@pytest.mark.parametrize('ext', ['.jpg', '.png', '.webp'])
+def test_binary_frames(frame, ext):
+    data = encoded(frame, ext)
+    for payload in (data, bytearray(data), memoryview(data)):
+        decoded = decode_frame(payload)
+        assert decoded.shape == frame.shape
+
+
+def test_base64_data_url_from_older_clients(frame):
+    pytest.importorskip('PIL')
+    data_url = 'data:image/png;base64,' + base64.b64encode(encoded(frame, '.png')).decode()
+    decoded = decode_frame(data_url)
+    assert decoded.shape == frame.shape
+    assert np.array_equal(decoded, frame)  # PNG is lossless; channels come back in BGR order
+
+
+@pytest.mark.parametrize('payload', [b'not an image', 'data:image/png;base64,!!!', None, 12])
+def test_undecodable_frames(payload):
+    assert decode_frame(payload) is None
@@ -0,0 +1,51 @@
+from frame_mailbox import FrameMailbox
+
+
+def test_latest_frame_wins():
+    mailbox = FrameMailbox()
+    assert mailbox.put('s', b'frame-1') is False
+    assert mailbox.put('s', b'frame-2') is True
+
+    assert mailbox.acquire('s')
+    frame, received_at = mailbox.next_frame('s')
+    assert frame == b'frame-2' and received_at > 0
+    assert mailbox.next_frame('s') is None
+
+
+def test_one_processor_per_session():
+    mailbox = FrameMailbox()
+    assert mailbox.acquire('s')
+    assert not mailbox.acquire('s')
+    assert mailbox.acquire('other')
+
+    mailbox.release('s')
+    assert mailbox.acquire('s')
+
+
+def test_draining_the_slot_releases_the_session():
+    mailbox = FrameMailbox()
+    mailbox.put('s', b'frame')
+    assert mailbox.acquire('s')
+    assert mailbox.next_frame('s') is not None
+    assert mailbox.next_frame('s') is None  # Empty: released in the same step
+    assert mailbox.acquire('s')
+
+
+def test_frame_parked_while_processing_is_picked_up():
+    mailbox = FrameMailbox()
+    mailbox.put('s', b'frame-1')
+    assert mailbox.acquire('s')
+    assert mailbox.next_frame('s')[0] == b'frame-1'
+
+    # Another handler parks a frame and backs off, since this one holds the session
+    mailbox.put('s', b'frame-2')
+    assert not mailbox.acquire('s')
+    assert mailbox.next_frame('s')[0] == b'frame-2'
+
+
+def test_discard_drops_the_parked_frame():
+    mailbox = FrameMailbox()
+    mailbox.put('s', b'frame')
+    mailbox.discard('s')
+    assert mailbox.acquire('s')
+    assert mailbox.next_frame('s') is None
@@ -0,0 +1,133 @@
+import io
+import json
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+import id_batch
+import ocr_utils
+
+
+def zip_of(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name in names:
+            archive.writestr(name, name.encode())
+    buffer.seek(0)
+    return buffer
+
+
+def test_iter_card_images_skips_non_images():
+    archive = zip_of(['a.jpg', 'scans/b.PNG', 'notes.txt', '.hidden.jpg', '__MACOSX/._c.jpg'])
+    assert list(id_batch.iter_card_images(archive)) == [('a.jpg', b'a.jpg'), ('scans/b.PNG', b'scans/b.PNG')]
+
+
+def test_iter_card_images_walks_directories(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'b.jpg').write_bytes(b'b')
+    (tmp_path / 'a.webp').write_bytes(b'a')
+    (tmp_path / 'readme.md').write_bytes(b'x')
+    assert sorted(id_batch.iter_card_images(str(tmp_path))) == [('a.webp', b'a'), ('sub/b.jpg', b'b')]
+
+
+@pytest.mark.parametrize('user_data', [[], 'cards', {'a.jpg': ['name']}])
+def test_user_data_must_map_names_to_objects(user_data):
+    with pytest.raises(ValueError):
+        id_batch.validate_user_data(user_data)
+
+
+def test_run_batch_bounds_cards_in_flight(monkeypatch):
+    lock = threading.Lock()
+    counts = {'in_flight': 0, 'max': 0}
+
+    class Executor(ThreadPoolExecutor):
+        def __init__(self, max_workers, initializer=None):
+            super().__init__(max_workers)
+
+        def submit(self, fn, *args):
+            with lock:
+                counts['in_flight'] += 1
+                counts['max'] = max(counts['max'], counts['in_flight'])
+            future = super().submit(fn, *args)
+            future.add_done_callback(lambda _: release())
+            return future
+
+    def release():
+        with lock:
+            counts['in_flight'] -= 1
+
+    def process(name, data, user_data):
+        time.sleep(0.005)
+        if name == 'card3.jpg':
+            raise RuntimeError('unreadable')
+        return {'file': name, 'success': True, 'user_data': user_data}
+
+    monkeypatch.setattr(id_batch, 'ProcessPoolExecutor', Executor)
+    monkeypatch.setattr(ocr_utils, 'process_id_card_bytes', process)
+    out = io.StringIO()
+    names = [f"card{i}.jpg" for i in range(20)]
+    id_batch.run_batch(zip_of(names), workers=2, user_data_by_file={'card1.jpg': {'name': 'A'}}, out=out)
+
+    records = {record['file']: record for record in map(json.loads, out.getvalue().splitlines())}
+    assert sorted(records) == sorted(names)
+    assert records['card1.jpg']['user_data'] == {'name': 'A'}
+    assert not records['card3.jpg']['success']
+    assert counts['max'] <= id_batch.IN_FLIGHT_PER_WORKER * 2
+
+
+@pytest.fixture
+def client():
+    app = pytest.importorskip('app')
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize('user_data', ['[1]', '"cards"', '{"a.jpg": 5}', '{not json'])
+def test_batch_endpoint_rejects_bad_user_data(client, user_data):
+    response = client.post('/verify/id/batch', data={'userData': user_data, 'archive': (zip_of(['a.jpg']), 'a.zip')})
+    assert response.status_code == 400
+
+
+def test_batch_endpoint_rejects_bad_archives(client):
+    response = client.post('/verify/id/batch', data={'archive': (io.BytesIO(b'not a zip'), 'a.zip')})
+    assert response.status_code == 400
+    response = client.post('/verify/id/batch', data={'archive': (zip_of(['notes.txt']), 'a.zip')})
+    assert response.status_code == 400
+    assert response.json['error'] == 'No card images found'
+
+
+def test_oversized_members_are_refused(monkeypatch):
+    monkeypatch.setattr(id_batch, 'MAX_CARD_BYTES', 8)
+    cards = id_batch.iter_card_images(zip_of(['a.jpg', 'much_too_long_name.jpg']))
+    assert next(cards) == ('a.jpg', b'a.jpg')
+    with pytest.raises(id_batch.ArchiveTooLargeError, match='much_too_long_name.jpg'):
+        next(cards)
+
+
+def test_archives_are_capped_in_total(monkeypatch):
+    monkeypatch.setattr(id_batch, 'MAX_ARCHIVE_BYTES', 12)
+    with pytest.raises(id_batch.ArchiveTooLargeError):
+        list(id_batch.iter_card_images(zip_of(['a.jpg', 'b.jpg', 'c.jpg'])))
+
+
+def test_batch_endpoint_names_failed_cards(client, monkeypatch):
+    app = pytest.importorskip('app')
+
+    def imap_unordered(fn, tasks, max_in_flight=None):
+        for args in tasks:
+            future = Future()
+            future.set_exception(RuntimeError('worker died'))
+            yield args, future
+
+    monkeypatch.setattr(app.pool, 'imap_unordered', imap_unordered)
+    response = client.post('/verify/id/batch', data={'archive': (zip_of(['a.jpg', 'b.jpg']), 'a.zip')})
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(record['file'], record['success']) for record in records] == [('a.jpg', False), ('b.jpg', False)]
+
+
+def test_batch_endpoint_rejects_oversized_archives(client, monkeypatch):
+    monkeypatch.setattr(id_batch, 'MAX_CARD_BYTES', 2)
+    response = client.post('/verify/id/batch', data={'archive': (zip_of(['a.jpg']), 'a.zip')})
+    assert response.status_code == 400
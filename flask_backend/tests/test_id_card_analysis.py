@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from ocr_utils import IdCardAnalysis
+
+face_recognition = pytest.importorskip('face_recognition')
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    """Count the face detections run, returning one face box."""
+    calls = []
+
+    def face_locations(rgb, *args, **kwargs):
+        calls.append(rgb.shape)
+        return [(40, 140, 140, 40)]
+    monkeypatch.setattr(face_recognition, 'face_locations', face_locations)
+    monkeypatch.setattr(face_recognition, 'face_encodings', lambda rgb, known_face_locations=None: [np.ones(128)])
+    return calls
+
+
+def test_one_detection_serves_ocr_preview_and_face_save(detections):
+    card = np.random.default_rng(0).integers(0, 255, (300, 480, 3), dtype=np.uint8)
+    analysis = IdCardAnalysis(card)
+    assert not analysis.face_checked
+
+    preview = analysis.face_crop(30)  # extract_text_from_id
+    reference_face = analysis.reference_face  # save_face_from_id_card
+    assert preview.shape[:2] == (160, 160)
+    assert reference_face['box'] == (40, 140, 140, 40)
+    assert reference_face['encoding'] is not None and reference_face['jpeg']
+    assert len(detections) == 1
+    assert analysis.face_checked
+
+
+def test_card_without_face_has_no_reference_face(monkeypatch):
+    monkeypatch.setattr(face_recognition, 'face_locations', lambda rgb, *args, **kwargs: [])
+    analysis = IdCardAnalysis(np.zeros((300, 480, 3), dtype=np.uint8))
+    assert analysis.face_crop(30) is None
+    assert analysis.reference_face is None
+    assert analysis.face_encoding is None
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+import pytest
+
+import id_layout
+import ocr_utils
+from id_layout import (CARD_ASPECT, NOT_FOUND, TURKISH_ID_FIELDS, extract_fields_from_layout, find_card_quad,
+                       is_valid_tckn, validate_fields)
+
+VALID_TCKN = '10000000146'
+
+
+@pytest.mark.parametrize('value, valid', [
+    (VALID_TCKN, True),
+    ('10000000147', False),  # Wrong second check digit
+    ('10000000156', False),  # Wrong first check digit
+    ('00000000000', False),  # Leading zero
+    ('1000000014', False),
+    ('1000000014a', False),
+    (None, False),
+])
+def test_is_valid_tckn(value, valid):
+    assert is_valid_tckn(value) is valid
+
+
+class FakeBackend:
+    """Answers image_to_string with canned field texts, in field order."""
+
+    name = 'fake'
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.calls = []
+
+    def image_to_string(self, image, lang='eng', psm=7, whitelist=None):
+        self.calls.append((image.shape, lang, psm, whitelist))
+        return self.texts.pop(0)
+
+
+@pytest.fixture
+def card():
+    """A photo that is the card, edge to edge, with its corners."""
+    img = np.full((631, 1000, 3), 230, dtype=np.uint8)
+    corners = np.array([[0, 0], [999, 0], [999, 630], [0, 630]], dtype=np.float32)
+    return img, corners
+
+
+def use_backend(monkeypatch, texts):
+    backend = FakeBackend(texts)
+    monkeypatch.setattr(id_layout, 'get_ocr_backend', lambda: backend)
+    return backend
+
+
+def test_fields_are_read_and_normalised(monkeypatch, card):
+    backend = use_backend(monkeypatch, [VALID_TCKN, 'yılmaz', 'AYŞE  NUR', '01.02.1990', 'KF', 'A12B34567',
+                                        'TC', '01.02.2030'])
+    img, corners = card
+    fields = extract_fields_from_layout(img, corners=corners)
+    assert fields == {
+        'id_number': VALID_TCKN, 'surname': 'YILMAZ', 'name': 'AYŞE NUR', 'birth_date': '01.02.1990',
+        'gender': 'K/F', 'serial_number': 'A12B34567', 'nationality': 'T.C.', 'expiry_date': '01.02.2030',
+    }
+    assert len(backend.calls) == len(TURKISH_ID_FIELDS)
+    assert backend.calls[0][1:] == ('eng', 7, '0123456789')
+
+
+def test_invalid_fields_are_reported_missing(monkeypatch, card):
+    use_backend(monkeypatch, [VALID_TCKN, 'YILMAZ', '1234', '1.2.90', 'KF', 'A12B34567', '', 'garbage'])
+    img, corners = card
+    fields = extract_fields_from_layout(img, corners=corners)
+    assert fields['name'] == NOT_FOUND and fields['birth_date'] == NOT_FOUND
+    assert fields['nationality'] == NOT_FOUND and fields['expiry_date'] == NOT_FOUND
+
+
+def test_layout_is_not_trusted_without_a_valid_tckn(monkeypatch, card):
+    use_backend(monkeypatch, ['10000000147', 'YILMAZ', 'AYŞE', '01.02.1990', 'KF', 'A12B34567', 'TC', '01.02.2030'])
+    img, corners = card
+    assert extract_fields_from_layout(img, corners=corners) is None
+
+
+@pytest.mark.parametrize('box', [(0.5, 0.1, 1.2, 0.2), (-0.1, 0.1, 0.2, 0.2), (0.4, 0.1, 0.3, 0.2),
+                                 (0.1, 0.1, 0.1005, 0.2)])
+def test_field_boxes_must_lie_inside_the_card(box, card):
+    fields = {'id_number': dict(TURKISH_ID_FIELDS['id_number'], box=box)}
+    with pytest.raises(ValueError):
+        validate_fields(fields)
+    img, corners = card
+    with pytest.raises(ValueError):
+        extract_fields_from_layout(img, fields=fields, corners=corners)
+
+
+def test_card_outline_is_found():
+    photo = np.full((900, 1200, 3), 40, dtype=np.uint8)
+    card_height = int(800 / CARD_ASPECT)
+    cv2.rectangle(photo, (200, 200), (1000, 200 + card_height), (230, 230, 230), -1)
+    corners = find_card_quad(photo)
+    assert corners is not None
+    assert np.allclose(corners[0], (200, 200), atol=8)
+    assert np.allclose(corners[2], (1000, 200 + card_height), atol=8)
+
+
+def test_auto_mode_uses_layout_only_in_process(monkeypatch):
+    monkeypatch.setattr(ocr_utils, 'OCR_MODE', 'auto')
+    for name, expected in (('tesserocr', True), ('pytesseract', False)):
+        backend = FakeBackend([])
+        backend.name = name
+        monkeypatch.setattr(ocr_utils, 'get_ocr_backend', lambda: backend)
+        assert ocr_utils.layout_ocr_enabled() is expected
+    monkeypatch.setattr(ocr_utils, 'OCR_MODE', 'full')
+    assert not ocr_utils.layout_ocr_enabled()
@@ -0,0 +1,71 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from id_layout import CARD_ASPECT
+from image_quality import TARGET_CARD_WIDTH, decode_image, prepare_id_image
+from ocr_utils import prepare_id_upload
+
+
+def card_photo(width=1600, height=1200, card_width=1200, background=40, card_gray=225, blur=0):
+    """JPEG of a card with printed lines of text on a dark table."""
+    photo = np.full((height, width, 3), background, dtype=np.uint8)
+    card_height = int(card_width / CARD_ASPECT)
+    left, top = (width - card_width) // 2, (height - card_height) // 2
+    cv2.rectangle(photo, (left, top), (left + card_width, top + card_height), (card_gray,) * 3, -1)
+    for line in range(1, 7):
+        cv2.putText(photo, 'YILMAZ 12345678950 01.02.1990', (left + 40, top + line * card_height // 7),
+                    cv2.FONT_HERSHEY_SIMPLEX, card_width / 900, (20, 20, 20), 3)
+    if blur:
+        photo = cv2.GaussianBlur(photo, (0, 0), blur)
+    return cv2.imencode('.jpg', photo)[1].tobytes()
+
+
+def test_sharp_card_passes_and_is_normalized():
+    img, corners, quality = prepare_id_image(card_photo(width=3200, height=2400, card_width=2400))
+    assert quality['ok'] and quality['card_found']
+    assert abs(np.linalg.norm(corners[1] - corners[0]) - TARGET_CARD_WIDTH) < 20
+    assert img.shape[1] < 3200
+
+
+@pytest.mark.parametrize('photo, reason', [
+    (card_photo(blur=6), 'blurry'),
+    (card_photo(background=5, card_gray=30), 'too_dark'),
+    (cv2.imencode('.jpg', np.full((1200, 1200, 3), 128, dtype=np.uint8))[1].tobytes(), 'no_card_found'),
+    (card_photo(width=400, height=300, card_width=300), 'too_small'),
+])
+def test_bad_photos_are_rejected_with_a_reason(photo, reason):
+    img, _, quality = prepare_id_image(photo)
+    assert img is not None
+    assert not quality['ok'] and quality['reason'] == reason and quality['message']
+
+
+def test_unreadable_upload():
+    img, corners, quality = prepare_id_image(b'not an image')
+    assert img is None and quality['reason'] == 'image_unreadable'
+
+
+def test_large_jpeg_is_decoded_at_reduced_size():
+    # Halved straight from the DCT while the long side stays at least DECODE_MIN_LONG_SIDE
+    assert decode_image(card_photo(width=4000, height=3000, card_width=3000)).shape[1] == 2000
+    assert decode_image(card_photo(width=3000, height=2000, card_width=2000)).shape[1] == 3000
+
+
+def test_spooled_upload_is_mapped(tmp_path):
+    path = tmp_path / 'upload'
+    path.write_bytes(card_photo())
+    img, corners, quality = prepare_id_upload(str(path))
+    assert quality['ok'] and img is not None
+
+
+def test_verify_id_rejects_before_the_worker_pool(monkeypatch):
+    app = pytest.importorskip('app')
+
+    def run(*args, **kwargs):
+        raise AssertionError('rejected photos must not reach the worker pool')
+    monkeypatch.setattr(app.pool, 'run', run)
+    response = app.app.test_client().post('/verify/id', data={'file': (io.BytesIO(card_photo(blur=6)), 'card.jpg')})
+    assert response.status_code == 422
+    assert response.json['reason'] == 'blurry'
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import liveness_service
+
+
+@pytest.fixture
+def detected_face(monkeypatch):
+    """Make every detection find one face; set its box through the returned list."""
+    box = [(100, 200, 200, 100)]
+    monkeypatch.setattr(liveness_service, 'detect_faces', lambda frame: list(box))
+    return box
+
+
+def face_at_center_x(center_x, width=100):
+    left = center_x - width // 2
+    return (100, left + width, 200, left)
+
+
+@pytest.mark.parametrize('center_x, movement', [(300, 'center'), (270, 'center'), (260, 'right'), (340, 'left')])
+def test_movement_threshold_scales_with_the_reference_face(detected_face, center_x, movement):
+    detected_face[0] = face_at_center_x(center_x)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    # 0.25 of a 140 px reference face: turns beyond 35 px count
+    result = liveness_service.process_liveness_frame(frame, 300, movement, reference_face_width=140)
+    assert result['movement_detected'] == movement
+    assert result['command_matched']
+
+
+def test_pixel_threshold_without_a_reference_width(detected_face):
+    detected_face[0] = face_at_center_x(250)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    assert liveness_service.process_liveness_frame(frame, 300, 'right')['movement_detected'] == 'right'
+    assert liveness_service.process_liveness_frame(frame, 300, 'center',
+                                                   face_detection_threshold=60)['movement_detected'] == 'center'
+
+
+def test_downscaled_detection_returns_full_frame_boxes():
+    face_recognition = pytest.importorskip('face_recognition')
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    calls = []
+    real_face_locations = face_recognition.face_locations
+
+    def face_locations(image, number_of_times_to_upsample=1):
+        calls.append(image.shape)
+        real_face_locations(image, number_of_times_to_upsample)
+        return [(50, 150, 150, 50)]
+
+    face_recognition.face_locations = face_locations
+    try:
+        boxes = liveness_service.detect_faces(frame, scale=0.5)
+    finally:
+        face_recognition.face_locations = real_face_locations
+    assert calls == [(240, 320, 3)]
+    assert boxes == [(100, 300, 300, 100)]
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+import pytest
+
+app = pytest.importorskip('app')
+from session_store import InMemorySessionStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = InMemorySessionStore()
+    monkeypatch.setattr(app, 'session_store', store)
+    return store
+
+
+def in_progress_session(**fields):
+    session = {'user_id': 'u1', 'created_at': time.time(), 'status': 'in_progress', 'reference_encoding': np.ones(128),
+               'liveness_commands': ['left', 'right', 'up'], 'current_command_index': 1,
+               'command_start_time': time.time() - 4, 'rate_level': 2, 'rate_changed_at': 0.0,
+               'tracker_state': {'box': (1, 2, 3, 4)}, 'disconnected': False}
+    session.update(fields)
+    return session
+
+
+def start(client):
+    client.emit('start_liveness_check', {'verification_id': 'v1'})
+    return {event['name']: event['args'][0] for event in client.get_received()}
+
+
+def test_restart_on_a_live_session_keeps_the_command_clock(store):
+    session = in_progress_session()
+    store.save('v1', session)
+    events = start(app.socketio.test_client(app.app))
+
+    stored = store.get('v1')
+    assert stored['command_start_time'] == session['command_start_time']
+    assert stored['tracker_state'] == session['tracker_state']
+    assert stored['rate_changed_at'] == 0.0
+    assert events['liveness_instruction'] == {'instruction': 'Please look right'}
+    assert events['liveness_rate']['level'] == 2
+
+
+def test_resume_moves_the_command_clock_past_the_disconnect(store):
+    now = time.time()
+    session = in_progress_session(command_start_time=now - 30, disconnected=True, disconnected_at=now - 26)
+    store.save('v1', session)
+    events = start(app.socketio.test_client(app.app))
+
+    stored = store.get('v1')
+    # 4 s of the command had passed when the client went away; they still count
+    assert now - 4.5 < stored['command_start_time'] < now - 3.5
+    assert not stored['disconnected'] and 'disconnected_at' not in stored
+    assert stored['tracker_state'] == {}
+    assert events['liveness_instruction'] == {'instruction': 'Please look right'}
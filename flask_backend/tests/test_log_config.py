@@ -0,0 +1,63 @@
+import logging
+import queue
+import sys
+
+from log_config import EventSampler, NonBlockingQueueHandler, RedactingFormatter, sampled
+
+
+def make_record(msg, *args, **extra):
+    record = logging.LogRecord('verifid', logging.INFO, __file__, 1, msg, args or None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampler_passes_one_in_every_per_event():
+    sampler = EventSampler(every=3)
+    passed = [sampler.filter(make_record('frame', **sampled('frame'))) for _ in range(7)]
+    assert passed == [True, False, False, True, False, False, True]
+    assert sampler.filter(make_record('other', **sampled('other')))
+    assert all(sampler.filter(make_record('unsampled')) for _ in range(5))
+
+
+def test_sampled_records_say_they_are_sampled():
+    sampler = EventSampler(every=2)
+    records = [make_record('frame %s', i, **sampled('frame')) for i in range(3)]
+    for record in records:
+        sampler.filter(record)
+    assert records[0].msg == 'frame %s'
+    assert records[2].msg == 'frame %s [1 in 2 logged]'
+
+
+def test_formatter_redacts_payloads():
+    formatter = RedactingFormatter(fmt='%(message)s', max_message=2000)
+    assert formatter.format(make_record('frame %s from %s', b'\xff' * 1024, 'user1')) == 'frame <1024 bytes> from user1'
+    data_url = 'data:image/jpeg;base64,' + 'A' * 50
+    assert formatter.format(make_record('got %s', data_url)) == f"got <data URL, {len(data_url)} chars>"
+    assert formatter.format(make_record('got ' + 'QUJD' * 100)) == 'got <base64, 400 chars>'
+
+
+def test_formatter_truncates_long_messages():
+    formatter = RedactingFormatter(fmt='%(message)s', max_message=10)
+    assert formatter.format(make_record('x' * 25)) == 'xxxxxxxxxx... [15 chars truncated]'
+
+
+def test_queue_handler_drops_records_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.emit(make_record('message %s', i))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    record = handler.queue.get_nowait()
+    assert (record.msg, record.args) == ('message %s', (0,))  # Formatting is left to the listener
+
+
+def test_queue_handler_renders_tracebacks_before_queueing():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.LogRecord('verifid', logging.ERROR, __file__, 1, 'failed', None, sys.exc_info())
+    handler.emit(record)
+    queued = handler.queue.get_nowait()
+    assert queued.exc_info is None
+    assert 'ValueError: boom' in queued.exc_text
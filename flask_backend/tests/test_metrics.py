@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, record_spans, render_prometheus, run_collecting_spans, span
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Keeps metrics created by a test out of the process-wide registry."""
+    monkeypatch.setattr(metrics, 'REGISTRY', [])
+    return metrics.REGISTRY
+
+
+def test_counter_sums_every_thread(registry):
+    counter = Counter('test_events_total', 'Events', ('kind',))
+
+    def work():
+        for _ in range(1000):
+            counter.labels('a').inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.labels('b').inc(5)
+    assert counter.labels('a').value == 4000
+    assert counter.render() == ['# HELP test_events_total Events', '# TYPE test_events_total counter',
+                                'test_events_total{kind="a"} 4000', 'test_events_total{kind="b"} 5']
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram('test_seconds', 'Durations', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{le="0.1"} 2', 'test_seconds_bucket{le="1.0"} 3', 'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_count 4', 'test_seconds_sum 3.65',
+    ]
+
+
+def test_render_prometheus_lists_registered_metrics(registry):
+    Counter('test_a_total', 'A').inc()
+    Histogram('test_b_seconds', 'B', ('stage',)).labels('decode').observe(0.2)
+    text = render_prometheus()
+    assert text.endswith('\n')
+    assert 'test_a_total 1\n' in text
+    assert 'test_b_seconds_count{stage="decode"} 1\n' in text
+
+
+def test_span_records_its_stage():
+    before = metrics.STAGE_SECONDS.labels('test_span').snapshot()[1]
+    with pytest.raises(RuntimeError):
+        with span('test_span'):
+            raise RuntimeError('recorded anyway')
+    assert metrics.STAGE_SECONDS.labels('test_span').snapshot()[1] == before + 1
+
+
+def collect(stage):
+    with span(stage):
+        pass
+    return 'done'
+
+
+def test_spans_in_worker_tasks_are_collected_not_recorded():
+    child = metrics.STAGE_SECONDS.labels('test_worker_span')
+    before = child.snapshot()[1]
+    result, spans = run_collecting_spans(collect, ('test_worker_span',), {})
+    assert result == 'done'
+    assert [stage for stage, _ in spans] == ['test_worker_span']
+    assert child.snapshot()[1] == before
+    assert metrics._collector is None
+
+    record_spans(spans)
+    assert child.snapshot()[1] == before + 1
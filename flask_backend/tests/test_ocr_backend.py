@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import ocr_backend
+from ocr_backend import PytesseractBackend, create_ocr_backend
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_ocr_backend('easyocr')
+
+
+def test_tesserocr_must_be_installed_when_requested(monkeypatch):
+    monkeypatch.setattr(ocr_backend, 'TESSEROCR_AVAILABLE', False)
+    with pytest.raises(ImportError):
+        create_ocr_backend('tesserocr')
+
+
+def test_auto_falls_back_to_pytesseract(monkeypatch):
+    pytest.importorskip('pytesseract')
+    monkeypatch.setattr(ocr_backend, 'TESSEROCR_AVAILABLE', False)
+    assert create_ocr_backend('auto').name == 'pytesseract'
+
+
+def test_pytesseract_config():
+    assert PytesseractBackend._config('tur', 7, None) == '--oem 3 --psm 7 -l tur'
+    assert PytesseractBackend._config('eng', 8, 'EKMF/') == '--oem 3 --psm 8 -l eng -c tessedit_char_whitelist=EKMF/'
+
+
+def test_tesserocr_reads_rendered_text():
+    pytest.importorskip('tesserocr')
+    import cv2
+    image = np.full((80, 400), 255, dtype=np.uint8)
+    cv2.putText(image, '12345678950', (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+    backend = create_ocr_backend('tesserocr')
+    try:
+        backend.warmup(('eng',))
+        assert backend.image_to_string(image, lang='eng', psm=7, whitelist='0123456789').strip() == '12345678950'
+        data = backend.image_to_data(image, lang='eng', psm=7)
+        assert len(data['text']) == len(data['conf']) > 0
+    finally:
+        backend.close()
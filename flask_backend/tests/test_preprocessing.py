@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import id_layout
+from benchmarks import preprocessing_eval
+from preprocessing import PIPELINES, get_pipeline, run_pipeline, select_pipeline
+
+
+@pytest.fixture
+def card():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, (631, 1000, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('name', sorted(PIPELINES))
+def test_every_pipeline_yields_a_contiguous_gray_image(card, name):
+    out = run_pipeline(card, name)
+    assert out.ndim == 2 and out.dtype == np.uint8 and out.flags['C_CONTIGUOUS']
+
+
+def test_pipelines_can_be_given_as_stage_lists(card):
+    assert np.array_equal(run_pipeline(card, [('grayscale', {}), ('otsu', {})]), run_pipeline(card, 'otsu'))
+    with pytest.raises(ValueError):
+        get_pipeline('sepia')
+
+
+def test_select_pipeline_prefers_the_cheapest_accurate_variant():
+    scores = {
+        'slow': {'accuracy': 0.95, 'ms_per_image': 90.0},
+        'fast': {'accuracy': 0.93, 'ms_per_image': 20.0},
+        'sloppy': {'accuracy': 0.70, 'ms_per_image': 5.0},
+    }
+    assert select_pipeline(scores, 0.92) == 'fast'
+    assert select_pipeline(scores, 0.99) == 'slow'
+
+
+def test_layout_field_crops_go_through_the_pipeline(card):
+    gray = card[:, :, 0]
+    box = id_layout.TURKISH_ID_FIELDS['id_number']['box']
+    binary = id_layout._field_image(gray, box)  # Default: the original Otsu binarization
+    assert set(np.unique(binary)) <= {0, 255}
+    assert len(np.unique(id_layout._field_image(gray, box, 'gray'))) > 2
+
+
+def test_layout_evaluation_counts_fallbacks(monkeypatch, card):
+    def layout(img, corners=None, pipeline=None):
+        return None if corners is None else {'id_number': '10000000146'}
+    monkeypatch.setattr(preprocessing_eval, 'extract_fields_from_layout', layout)
+    monkeypatch.setattr(preprocessing_eval, 'extract_fields_full_card', lambda img, pipeline=None: {'id_number': '1'})
+
+    cards = [('a.jpg', card, np.zeros((4, 2)), {'id_number': '10000000146'}),
+             ('b.jpg', card, None, {'id_number': '10000000146'})]
+    score = preprocessing_eval.evaluate(cards, 'otsu', 'layout')
+    assert score['accuracy'] == 0.5 and score['fallbacks'] == 1
+    assert score['preprocess_ms'] is None
+    assert preprocessing_eval.evaluate(cards, 'otsu', 'full')['accuracy'] == 0.0
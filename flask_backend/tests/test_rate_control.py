@@ -0,0 +1,74 @@
+import pytest
+
+import rate_control
+from rate_control import (DEFAULT_RATE_LEVEL, RATE_LEVELS, initial_rate_level, rate_settings, start_rate_control,
+                          update_rate_control)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_control.time, 'time', lambda: now[0])
+    return now
+
+
+def test_initial_level_follows_pool_load():
+    assert initial_rate_level(0, 8) == DEFAULT_RATE_LEVEL
+    assert initial_rate_level(5, 8) == DEFAULT_RATE_LEVEL + 1
+    assert initial_rate_level(8, 8) == len(RATE_LEVELS) - 1
+    assert initial_rate_level(3, 0) == DEFAULT_RATE_LEVEL
+
+
+def test_default_level_keeps_the_processed_frame_rate_of_frame_skipping():
+    # Clients used to send 640x480 frames at 2 fps, of which every FRAME_SKIP_RATE = 2nd was processed
+    assert RATE_LEVELS[DEFAULT_RATE_LEVEL] == {'fps': 1, 'width': 640, 'height': 480, 'quality': 0.6}
+
+
+def test_settings_payload():
+    assert rate_settings(0) == dict(RATE_LEVELS[0], level=0)
+
+
+def test_slow_frames_step_down_after_the_cooldown(clock):
+    session = {}
+    start_rate_control(session, 0, 8)
+    interval = 1.0 / RATE_LEVELS[DEFAULT_RATE_LEVEL]['fps']
+
+    assert update_rate_control(session, interval, 0, 8) is None  # Still cooling down
+    clock[0] += 3
+    settings = update_rate_control(session, interval, 0, 8)
+    assert settings['level'] == DEFAULT_RATE_LEVEL + 1
+    assert session['rate_level'] == DEFAULT_RATE_LEVEL + 1
+
+
+def test_full_pool_steps_down_even_when_frames_are_fast(clock):
+    session = {}
+    start_rate_control(session, 0, 8)
+    clock[0] += 3
+    assert update_rate_control(session, 0.01, 8, 8)['level'] == DEFAULT_RATE_LEVEL + 1
+
+
+def test_fast_frames_on_an_idle_pool_step_up(clock):
+    session = {}
+    start_rate_control(session, 0, 8)
+    clock[0] += 3
+    assert update_rate_control(session, 0.01, 0, 8)['level'] == DEFAULT_RATE_LEVEL - 1
+    for _ in range(DEFAULT_RATE_LEVEL - 1):
+        clock[0] += 3
+        update_rate_control(session, 0.01, 0, 8)
+    assert session['rate_level'] == 0
+    clock[0] += 3
+    assert update_rate_control(session, 0.01, 0, 8) is None  # Already at the best level
+
+
+def test_latency_is_smoothed(clock):
+    session = {}
+    start_rate_control(session, 0, 8)
+    update_rate_control(session, 1.0, 0, 8)
+    update_rate_control(session, 0.0, 0, 8)
+    assert session['rate_latency'] == pytest.approx(1.0 - rate_control.LATENCY_SMOOTHING)
+
+
+def test_sessions_without_rate_control_are_left_alone():
+    session = {}
+    assert update_rate_control(session, 1.0, 0, 8) is None
+    assert session == {}
@@ -0,0 +1,62 @@
+import pytest
+
+app = pytest.importorskip('app')
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def test_ping_answers_while_warming_up(client, monkeypatch):
+    monkeypatch.setitem(app.startup_state, 'status', 'warming_up')
+    assert client.get('/ping').status_code == 200
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.json['status'] == 'warming_up'
+
+
+def test_ready_once_warm(client, monkeypatch):
+    monkeypatch.setitem(app.startup_state, 'status', 'ready')
+    monkeypatch.setattr(app.pool, 'broken_error', None)
+    assert client.get('/ready').status_code == 200
+
+
+def test_not_ready_while_the_pool_is_broken(client, monkeypatch):
+    monkeypatch.setitem(app.startup_state, 'status', 'ready')
+    monkeypatch.setattr(app.pool, 'broken_error', 'BrokenProcessPool: worker died')
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.json['pool_error'] == 'BrokenProcessPool: worker died'
+
+
+def test_failed_warmup_is_reported(monkeypatch):
+    monkeypatch.setattr(app, 'WARMUP_MODE', 'eager')
+    state = dict(app.startup_state)
+
+    def fail(timeout=None):
+        raise RuntimeError('models missing')
+
+    monkeypatch.setattr(app.pool, 'start', fail)
+    monkeypatch.setattr(app, 'import_legacy_faces', lambda: 0)
+    try:
+        app.warm_up()
+        assert app.startup_state['status'] == 'failed'
+        assert app.startup_state['error'] == 'models missing'
+    finally:
+        app.startup_state.clear()
+        app.startup_state.update(state)
+
+
+def test_warmup_imports_legacy_faces_before_ready(monkeypatch):
+    monkeypatch.setattr(app, 'WARMUP_MODE', 'lazy')
+    state = dict(app.startup_state)
+    imported = []
+    monkeypatch.setattr(app, 'import_legacy_faces', lambda: imported.append(app.startup_state['status']) or 1)
+    try:
+        app.startup_state['status'] = 'starting'
+        app.warm_up()
+        assert imported == ['starting'] and app.startup_state['status'] == 'ready'
+    finally:
+        app.startup_state.clear()
+        app.startup_state.update(state)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from encoding_store import get_encoding_store
+from face_assets import get_face_asset_store
+from ocr_utils import delete_reference_face, store_reference_face
+
+
+def reference_face(jpeg, encoding):
+    return {"jpeg": jpeg, "encoding": encoding, "box": (10, 60, 60, 10), "quality": 120.0}
+
+
+def test_store_reference_face_precomputes_encoding(tmp_path):
+    location = store_reference_face('alice', reference_face(b'face-1', np.full(128, 0.2)), str(tmp_path))
+
+    assert np.allclose(get_encoding_store(str(tmp_path)).get('alice'), 0.2)
+    assert get_face_asset_store(str(tmp_path)).get('alice')['location'] == location
+
+
+def test_reenrolment_without_encoding_forgets_the_old_one(tmp_path):
+    store_reference_face('alice', reference_face(b'face-1', np.full(128, 0.2)), str(tmp_path))
+    store_reference_face('alice', reference_face(b'face-2', None), str(tmp_path))
+
+    assert get_encoding_store(str(tmp_path)).get('alice') is None
+    assert get_face_asset_store(str(tmp_path)).read_image('alice') == b'face-2'
+
+
+def test_delete_reference_face_forgets_face_and_encoding(tmp_path):
+    store_reference_face('alice', reference_face(b'face-1', np.full(128, 0.2)), str(tmp_path))
+    delete_reference_face('alice', str(tmp_path))
+
+    assert get_encoding_store(str(tmp_path)).get('alice') is None
+    assert 'alice' not in get_face_asset_store(str(tmp_path))
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+redis = pytest.importorskip('redis')
+
+
+@pytest.fixture
+def client(resp_url, request):
+    client = redis.Redis.from_url(resp_url)
+    yield client
+    client.delete(*client.keys(f"{request.node.name}:*") or ['unused'])
+    client.close()
+
+
+@pytest.fixture
+def key(request):
+    return f"{request.node.name}:key"
+
+
+def test_strings_and_expiry(client, key):
+    assert client.get(key) is None
+    assert client.set(key, b'value')
+    assert not client.set(key, b'other', nx=True)
+    assert client.get(key) == b'value'
+    assert client.ttl(key) == -1
+    client.expire(key, 100)
+    assert 0 < client.ttl(key) <= 100
+    client.expireat(key, int(time.time()) - 1)
+    assert client.get(key) is None
+    assert client.ttl(key) == -2
+
+
+def test_sets_and_sorted_sets(client, key):
+    assert client.sadd(key, 'a', 'b', 'a') == 2
+    assert client.srem(key, 'a') == 1
+    assert client.smembers(key) == {b'b'}
+    with pytest.raises(redis.ResponseError):
+        client.get(key)
+
+    zkey = key + ':z'
+    client.zadd(zkey, {'a': 1, 'b': 2, 'c': 3})
+    assert client.zrangebyscore(zkey, '(1', 3) == [b'b', b'c']
+    assert client.zremrangebyscore(zkey, '-inf', 2) == 2
+    assert client.zrem(zkey, 'c') == 1
+    assert client.zrangebyscore(zkey, '-inf', '+inf') == []
+
+
+def test_transactions_abort_when_a_watched_key_changes(client, key):
+    client.set(key, b'1')
+    with client.pipeline() as pipe:
+        pipe.watch(key)
+        client.set(key, b'2')  # Written by another client between WATCH and EXEC
+        pipe.multi()
+        pipe.set(key, b'3')
+        with pytest.raises(redis.WatchError):
+            pipe.execute()
+    assert client.get(key) == b'2'
+
+    with client.pipeline() as pipe:
+        pipe.watch(key)
+        pipe.multi()
+        pipe.set(key, b'3')
+        pipe.get(key)
+        assert pipe.execute() == [True, b'3']
+
+
+def test_expiry_and_discard_end_a_watch(client, key):
+    client.set(key, b'1', px=50)
+    with client.pipeline() as pipe:
+        pipe.watch(key)
+        time.sleep(0.1)  # The watched key expires before EXEC
+        pipe.multi()
+        pipe.set(key, b'2')
+        with pytest.raises(redis.WatchError):
+            pipe.execute()
+
+    client.set(key, b'1')
+    conn = redis.Redis(connection_pool=client.connection_pool, single_connection_client=True)
+    conn.execute_command('WATCH', key)
+    conn.execute_command('MULTI')
+    conn.execute_command('DISCARD')
+    client.set(key, b'2')  # No longer watched
+    conn.execute_command('MULTI')
+    conn.execute_command('SET', key, b'3')
+    assert conn.execute_command('EXEC') == [b'OK']
+    conn.close()
+
+
+def test_publish_reaches_subscribers(client, key):
+    pubsub = client.pubsub()
+    pubsub.subscribe(key)
+    assert pubsub.get_message(timeout=1)['type'] == 'subscribe'
+    assert client.publish(key, b'hello') == 1
+    message = pubsub.get_message(timeout=1)
+    assert (message['type'], message['data']) == ('message', b'hello')
+    pubsub.close()
+
+
+def test_unknown_commands_are_errors(client):
+    with pytest.raises(redis.ResponseError, match='unknown command'):
+        client.execute_command('NOSUCHCOMMAND')
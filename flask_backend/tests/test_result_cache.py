@@ -0,0 +1,117 @@
+import numpy as np
+
+import ocr_utils
+from ocr_utils import id_card_cache_entry, id_card_result_from_cache, persisted_cache_entry, restore_id_card_faces
+from result_cache import ResultCache, content_hash
+
+REFERENCE_FACE = {'jpeg': b'face', 'encoding': np.ones(128), 'box': (1, 2, 3, 0), 'quality': 80.0}
+OCR_RESULT = {'success': True, 'extracted_data': {'id_number': '10000000146', 'birth_date': '01.02.1990',
+                                                  'serial_number': 'A12B34567', 'gender': 'K/F'},
+              'face_image': 'data:image/jpeg;base64,', 'user_match': {'overall_match': True}}
+
+
+def test_memory_tier_is_bounded_lru():
+    cache = ResultCache(max_entries=2, max_bytes=1 << 20)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_get_returns_a_fresh_copy():
+    cache = ResultCache()
+    cache.put('a', {'list': [1]})
+    cache.get('a')['list'].append(2)
+    assert cache.get('a') == {'list': [1]}
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path))
+    cache.put('ab12', {'ok': True})
+    cache.flush()
+    assert ResultCache(disk_dir=str(tmp_path)).get('ab12') == {'ok': True}
+
+
+def test_disk_tier_is_trimmed(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path), disk_max_bytes=2000)
+    for i in range(10):
+        cache.put(content_hash(bytes([i])), b'x' * 500)
+    cache.flush()
+    assert sum(size for _, size, _ in cache._scan_disk()) <= 2000
+
+
+def test_face_data_is_not_persisted(tmp_path):
+    entry = id_card_cache_entry(OCR_RESULT, REFERENCE_FACE, True)
+    cache = ResultCache(disk_dir=str(tmp_path))
+    cache.put('ab12', entry, disk_value=persisted_cache_entry(entry))
+    cache.flush()
+    assert cache.get('ab12')['reference_face']['jpeg'] == b'face'
+
+    from_disk = ResultCache(disk_dir=str(tmp_path)).get('ab12')
+    assert from_disk['reference_face'] is None and not from_disk['face_checked']
+    assert from_disk['ocr_result']['face_image'] is None and from_disk['faces_stripped']
+    assert from_disk['ocr_result']['extracted_data'] == OCR_RESULT['extracted_data']
+    assert b'data:image' not in (tmp_path / 'ab' / 'ab12.pkl').read_bytes()
+    # The face work is redone before the entry is served, with or without a user_id
+    assert id_card_result_from_cache(from_disk, user_id='u1') is None
+    assert id_card_result_from_cache(from_disk) is None
+
+
+def test_rejected_uploads_are_persisted_whole():
+    entry = id_card_cache_entry({'success': False, 'quality': {'ok': False}}, None, False)
+    assert not persisted_cache_entry(entry)['faces_stripped']
+    assert id_card_result_from_cache(persisted_cache_entry(entry)) is not None
+
+
+def test_restore_redoes_only_the_face_work(monkeypatch):
+    monkeypatch.setattr(ocr_utils, 'face_preview', lambda analysis: 'data:image/jpeg;base64,AA==')
+    monkeypatch.setattr(ocr_utils.IdCardAnalysis, 'face_checked', True)
+    monkeypatch.setattr(ocr_utils.IdCardAnalysis, 'reference_face', REFERENCE_FACE)
+    monkeypatch.setattr(ocr_utils, 'extract_text_from_id', None)  # No OCR
+    stripped = persisted_cache_entry(id_card_cache_entry(OCR_RESULT, REFERENCE_FACE, True))
+
+    restored = restore_id_card_faces(np.zeros((4, 4, 3), np.uint8), None, stripped, 'u1')
+    assert restored['ocr_result']['face_image'] == 'data:image/jpeg;base64,AA=='
+    assert restored['ocr_result']['extracted_data'] == OCR_RESULT['extracted_data']
+    assert restored['face_checked'] and restored['reference_face'] is REFERENCE_FACE
+    assert 'faces_stripped' not in restored
+
+    restored = restore_id_card_faces(np.zeros((4, 4, 3), np.uint8), None, stripped)
+    assert restored['reference_face'] is None and not restored['face_checked']
+    assert id_card_result_from_cache(restored)[0]['face_image'] == 'data:image/jpeg;base64,AA=='
+
+
+def test_disk_writes_do_not_block_put(tmp_path, monkeypatch):
+    import threading
+    release = threading.Event()
+    cache = ResultCache(disk_dir=str(tmp_path))
+    store_disk = cache._store_disk
+    monkeypatch.setattr(cache, '_store_disk', lambda key, data: release.wait(5) and store_disk(key, data))
+    cache.put('ab12', {'ok': True})
+    assert cache.get('ab12') == {'ok': True} and not (tmp_path / 'ab' / 'ab12.pkl').exists()
+    release.set()
+    cache.flush()
+    assert (tmp_path / 'ab' / 'ab12.pkl').exists()
+
+
+def test_cache_hit_redoes_the_user_data_comparison_and_face_save(monkeypatch):
+    saved = []
+    monkeypatch.setattr(ocr_utils, 'store_reference_face', lambda user_id, face: saved.append(user_id) or 'loc')
+    entry = id_card_cache_entry(OCR_RESULT, REFERENCE_FACE, True)
+    assert 'user_match' not in entry['ocr_result']
+
+    ocr_result, face_save_result = id_card_result_from_cache(entry, {'idNumber': '10000000146'}, 'u1')
+    assert ocr_result['user_match']['match_percentage'] == 100
+    assert face_save_result == (True, 'loc') and saved == ['u1']
+
+
+def test_cached_card_without_face():
+    entry = id_card_cache_entry(OCR_RESULT, None, True)
+    assert id_card_result_from_cache(entry, user_id='u1')[1] == (False, "No face detected in ID card")
+
+
+def test_disabled_cache():
+    cache = ResultCache(max_entries=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None and not cache.enabled
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from session_store import (DISCONNECTED_SESSION_TTL, EXPIRY_RETENTION, FINISHED_SESSION_TTL, SESSION_MAX_AGE,
+                           InMemorySessionStore, RedisSessionStore, session_expiry)
+
+redis = pytest.importorskip('redis')
+
+
+@pytest.fixture
+def redis_store(resp_url, request):
+    return RedisSessionStore(redis.Redis.from_url(resp_url), prefix=f"test:{request.node.name}:")
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def store(request):
+    if request.param == 'memory':
+        return InMemorySessionStore()
+    return request.getfixturevalue('redis_store')
+
+
+def test_session_expiry_rules():
+    created = 1000.0
+    assert session_expiry({'created_at': created}) == created + SESSION_MAX_AGE
+    assert session_expiry({'created_at': created, 'disconnected': True, 'disconnected_at': created + 10}) \
+        == created + 10 + DISCONNECTED_SESSION_TTL
+    assert session_expiry({'created_at': created, 'status': 'completed', 'completed_at': created + 20}) \
+        == created + 20 + FINISHED_SESSION_TTL
+
+
+def test_save_get_and_find_by_sid(store):
+    store.save('a', {'created_at': time.time(), 'status': 'centering', 'socket_sid': 'sid-1'})
+    assert store.get('a')['status'] == 'centering'
+    assert 'a' in store
+    assert [session_id for session_id, _ in store.find_by_sid('sid-1')] == ['a']
+    assert store.get('missing') is None
+
+
+def test_update_applies_to_current_session(store):
+    store.save('a', {'created_at': time.time(), 'status': 'centering', 'frame_counter': 0})
+
+    def bump(session):
+        session['frame_counter'] += 1
+
+    store.update('a', bump)
+    store.update('a', bump)
+    assert store.get('a')['frame_counter'] == 2
+    assert store.update('missing', bump) is None
+
+
+def test_update_can_decline_the_write(store):
+    store.save('a', {'created_at': time.time(), 'status': 'completed', 'completed_at': time.time()})
+
+    def restart(session):
+        if session['status'] == 'completed':
+            return False
+        session['status'] = 'centering'
+
+    store.update('a', restart)
+    assert store.get('a')['status'] == 'completed'
+
+
+def test_redis_update_retries_on_a_concurrent_write(redis_store):
+    redis_store.save('a', {'created_at': time.time(), 'status': 'in_progress', 'frame_counter': 0})
+    seen = []
+
+    def disconnect_meanwhile(session):
+        seen.append(dict(session))
+        if len(seen) == 1:
+            # Another handler writes the session between this handler's read and its write
+            other = redis_store.get('a')
+            other.update(disconnected=True, disconnected_at=time.time())
+            redis_store.save('a', other)
+        session['frame_counter'] += 1
+
+    redis_store.update('a', disconnect_meanwhile)
+    session = redis_store.get('a')
+    assert len(seen) == 2
+    assert session['frame_counter'] == 1
+    assert session['disconnected'] is True
+
+
+def test_cleanup_returns_expired_ids(store):
+    now = time.time()
+    store.save('old', {'created_at': now - SESSION_MAX_AGE + 5})
+    store.save('fresh', {'created_at': now})
+    assert store.cleanup(now) == []
+    assert store.cleanup(now + 10) == ['old']
+    assert store.cleanup(now + 20) == []
+
+
+def test_redis_cleanup_reports_expiry_to_every_process(resp_url):
+    client = redis.Redis.from_url(resp_url)
+    first = RedisSessionStore(client, prefix='test:shared:')
+    second = RedisSessionStore(client, prefix='test:shared:')
+    now = time.time()
+    first.save('old', {'created_at': now - SESSION_MAX_AGE + 5})
+
+    assert first.cleanup(now + 10) == ['old']
+    assert second.cleanup(now + 10) == ['old']
+    assert second.cleanup(now + 20) == []
+    # Reported ids are dropped from the expiry set once past the retention period
+    first.cleanup(now + 10 + EXPIRY_RETENTION)
+    assert client.zrangebyscore('test:shared:expiry', '-inf', '+inf') == []
+
+
+def test_redis_delete_forgets_expiry(redis_store):
+    now = time.time()
+    redis_store.save('a', {'created_at': now - SESSION_MAX_AGE + 5})
+    redis_store.delete('a')
+    assert redis_store.get('a') is None
+    assert redis_store.cleanup(now + 10) == []
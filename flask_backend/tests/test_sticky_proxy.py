@@ -0,0 +1,63 @@
+import asyncio
+import collections
+
+import sticky_proxy
+from sticky_proxy import StickyProxy, affinity_key, rank_backends
+
+BACKENDS = [f"127.0.0.1:{5100 + i}" for i in range(4)]
+
+
+def test_affinity_key_is_the_verification_id():
+    head = b"GET /socket.io/?EIO=4&transport=polling&verification_id=abc HTTP/1.1\r\nHost: x\r\n\r\n"
+    assert affinity_key(head, '10.0.0.1') == 'abc'
+    assert affinity_key(b"POST /verify/id HTTP/1.1\r\n\r\n", '10.0.0.1') == '10.0.0.1'
+    assert affinity_key(b"garbage\r\n\r\n", '10.0.0.1') == '10.0.0.1'
+
+
+def test_rank_backends_is_stable_and_spreads_keys():
+    assert rank_backends('abc', BACKENDS) == rank_backends('abc', list(reversed(BACKENDS)))
+    owners = collections.Counter(rank_backends(f"session{i}", BACKENDS)[0] for i in range(1000))
+    assert set(owners) == set(BACKENDS)
+    assert min(owners.values()) > 150
+
+
+def test_removing_a_backend_only_moves_its_own_keys():
+    removed = BACKENDS[1]
+    remaining = [backend for backend in BACKENDS if backend != removed]
+    for i in range(500):
+        ranked = rank_backends(f"session{i}", BACKENDS)
+        expected = ranked[1] if ranked[0] == removed else ranked[0]
+        assert rank_backends(f"session{i}", remaining)[0] == expected
+
+
+def test_probe_closes_the_connection_when_the_backend_does_not_answer(monkeypatch):
+    monkeypatch.setattr(sticky_proxy, 'PROBE_INTERVAL', 0.05)
+
+    async def run():
+        events = []
+        probed_twice = asyncio.Event()
+
+        async def silent(reader, writer):
+            n = len([event for event in events if event[0] == 'open'])
+            events.append(('open', n))
+            if n == 1:
+                probed_twice.set()
+            await reader.read()  # Returns once the prober closes its side
+            events.append(('closed', n))
+            writer.close()
+
+        listener = await asyncio.start_server(silent, '127.0.0.1', 0)
+        backend = f"127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+        proxy = StickyProxy([backend])
+        probe = asyncio.ensure_future(proxy.probe_forever(backend))
+        try:
+            await asyncio.wait_for(probed_twice.wait(), 2)
+        finally:
+            probe.cancel()
+            listener.close()
+        return proxy._ready[backend], events
+
+    ready, events = asyncio.run(run())
+    assert ready is False
+    # The timed-out probe connection is closed before the next probe opens one
+    assert events.index(('closed', 0)) < events.index(('open', 1))
@@ -0,0 +1,73 @@
+import hashlib
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+app = pytest.importorskip('app')
+
+
+def test_small_uploads_stay_in_memory():
+    data = b'\xff\xd8 small jpeg'
+    upload, digest = app.read_upload(FileStorage(io.BytesIO(data), 'card.jpg'))
+    assert upload == data
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_large_uploads_are_spooled(monkeypatch):
+    monkeypatch.setattr(app, 'UPLOAD_SPOOL_THRESHOLD', 16)
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    upload, digest = app.read_upload(FileStorage(io.BytesIO(data), 'card.jpg'))
+    try:
+        assert isinstance(upload, str)
+        with open(upload, 'rb') as f:
+            assert f.read() == data
+        assert digest == hashlib.sha256(data).hexdigest()
+    finally:
+        os.remove(upload)
+
+
+def test_spooled_upload_is_removed_after_the_request(monkeypatch):
+    monkeypatch.setattr(app, 'UPLOAD_SPOOL_THRESHOLD', 16)
+    spooled = []
+    read_upload = app.read_upload
+
+    def spy(file):
+        upload, digest = read_upload(file)
+        spooled.append(upload)
+        return upload, digest
+    monkeypatch.setattr(app, 'read_upload', spy)
+
+    response = app.app.test_client().post('/verify/id', data={'file': (io.BytesIO(b'not an image' * 4), 'card.jpg')})
+    assert response.status_code == 400
+    assert isinstance(spooled[0], str) and not os.path.exists(spooled[0])
+
+
+def test_disk_cache_hit_redoes_only_the_face_work(tmp_path, monkeypatch):
+    from ocr_utils import id_card_cache_entry, persisted_cache_entry
+    from result_cache import ResultCache
+
+    data = b'\xff\xd8 card photo'
+    ocr_result = {'success': True, 'extracted_data': {'id_number': '10000000146'}, 'face_image': 'data:image/jpeg;base64,AA=='}
+    disk = ResultCache(disk_dir=str(tmp_path))
+    entry = id_card_cache_entry(ocr_result, None, False)
+    disk.put(hashlib.sha256(data).hexdigest(), entry, disk_value=persisted_cache_entry(entry))
+    disk.flush()
+    monkeypatch.setattr(app, 'id_result_cache', ResultCache(disk_dir=str(tmp_path)))
+    monkeypatch.setattr(app, 'prepare_id_upload', lambda upload: ('img', None, {'ok': True}))
+    runs = []
+
+    def run(fn, *args):
+        runs.append(fn.__name__)
+        return id_card_cache_entry(dict(args[2]['ocr_result'], face_image='restored'), None, False)
+    monkeypatch.setattr(app.pool, 'run', run)
+
+    client = app.app.test_client()
+    for _ in range(2):
+        response = client.post('/verify/id', data={'file': (io.BytesIO(data), 'card.jpg')})
+        assert response.status_code == 200
+        assert response.get_json()['face_image'] == 'restored'
+        assert response.get_json()['extracted_data'] == {'id_number': '10000000146'}
+    # The second hit is served from memory
+    assert runs == ['restore_id_card_faces']
@@ -0,0 +1,110 @@
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from metrics import STAGE_SECONDS, span
+from worker_pool import PoolBusyError, WorkerPool, wait_for
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def square(value):
+    with span('test_square'):
+        return value * value
+
+
+def crash():
+    os._exit(1)  # Like a segfault in dlib: the worker dies mid-task
+
+
+def failing_initializer():
+    raise RuntimeError("models missing")
+
+
+def slow_initializer():
+    time.sleep(3)  # Like loading the dlib models on a busy machine
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(max_workers=2, max_pending=4, initializer=None)
+    yield pool
+    pool.shutdown()
+
+
+def test_run_returns_result_and_records_worker_spans(pool):
+    count_before = STAGE_SECONDS.labels('test_square').snapshot()[1]
+    assert pool.run(square, 7) == 49
+    assert STAGE_SECONDS.labels('test_square').snapshot()[1] == count_before + 1
+    assert pool.pending == 0
+
+
+def test_submit_refuses_work_beyond_max_pending():
+    pool = WorkerPool(max_workers=1, max_pending=0, initializer=None)
+    with pytest.raises(PoolBusyError):
+        pool.submit(square, 2)
+    assert pool.pending == 0
+
+
+def test_imap_unordered_runs_every_task(pool):
+    completed = pool.imap_unordered(square, ((i,) for i in range(10)), max_in_flight=2)
+    results = sorted((args, future.result()) for args, future in completed)
+    assert results == [((i,), i * i) for i in range(10)]
+
+
+def test_pool_recovers_after_a_worker_crash(pool):
+    assert pool.run(square, 3) == 9
+    with pytest.raises(BrokenProcessPool):
+        pool.run(crash)
+    assert pool.broken_error is not None
+
+    assert pool.run(square, 4) == 16
+    assert pool.broken_error is None
+
+
+def test_failing_initializer_is_reported():
+    pool = WorkerPool(max_workers=1, max_pending=2, initializer=failing_initializer)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            pool.run(square, 2)
+        assert pool.broken_error is not None
+    finally:
+        pool.shutdown()
+
+
+def test_start_warms_every_worker(pool):
+    assert pool.start(timeout=60) == 2
+    assert pool.warm_workers == 2
+
+
+def test_wait_for_gives_up_after_timeout():
+    future = Future()
+    with pytest.raises(FutureTimeoutError):
+        wait_for(future, timeout=0.05)
+    future.set_result(5)
+    assert wait_for(future, timeout=0.05) == 5
+
+
+def test_start_returns_at_its_timeout():
+    pool = WorkerPool(max_workers=2, max_pending=4, initializer=slow_initializer)
+    try:
+        started = time.time()
+        assert pool.start(timeout=0.5) == 0
+        assert time.time() - started < 2.5
+        assert pool.warm_workers == 0
+    finally:
+        pool.shutdown()
+
+
+def test_spawned_workers_do_not_import_the_app():
+    # What spawn does with the main script in each new worker
+    code = ("import runpy, sys; runpy.run_path('server.py', run_name='__mp_main__'); "
+            "print('app' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip() == 'False'
@@ -0,0 +1,328 @@
+# worker_pool.py
+"""
+Process pool for the CPU-bound dlib and Tesseract work.
+
+face_recognition and pytesseract run native code that never yields to the
+gevent hub, so calling them from a Socket.IO handler stalls every other
+connection. Work submitted here runs in warmed-up worker processes while the
+calling greenlet waits cooperatively on the result.
+"""
+import collections
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import gevent
+    from gevent.hub import Waiter
+except ImportError:
+    gevent = None
+
+from metrics import record_span, record_spans, run_collecting_spans
+
+logger = logging.getLogger(__name__)
+
+POOL_WORKERS = int(os.environ.get('VERIFID_POOL_WORKERS', os.cpu_count() or 1))
+# Tasks allowed in flight (running + queued) before new work is refused
+POOL_MAX_PENDING = int(os.environ.get('VERIFID_POOL_MAX_PENDING', POOL_WORKERS * 2))
+# Seconds WorkerPool.start() waits for every worker to come up warm
+POOL_START_TIMEOUT = float(os.environ.get('VERIFID_POOL_START_TIMEOUT', 120))
+
+
+class PoolBusyError(Exception):
+    """Raised when the pool already has POOL_MAX_PENDING tasks in flight."""
+
+
+def warmup_worker():
+    """Per-worker initializer: load the dlib models and the Tesseract engines before the first task."""
+    import numpy as np
+    import face_recognition
+    from log_config import configure_logging
+    from ocr_backend import get_ocr_backend
+
+    # Spawned workers start with no handlers; log through their own queue like the server
+    configure_logging()
+
+    dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(dummy)
+    face_recognition.face_encodings(dummy, known_face_locations=[(8, 56, 56, 8)])
+    try:
+        backend = get_ocr_backend()
+        backend.warmup()
+        backend.image_to_string(np.full((32, 96), 255, dtype=np.uint8))
+    except Exception as e:
+        logger.warning("Tesseract not available in worker %s: %s", os.getpid(), e)
+
+
+def report_ready():
+    """Startup probe task; a worker only runs tasks once warmup_worker has finished."""
+    time.sleep(0.05)  # Keep one warm worker from answering every probe of a round
+    return os.getpid()
+
+
+class WorkerPool:
+    """Bounded process pool whose results can be awaited from gevent greenlets."""
+
+    def __init__(self, max_workers=POOL_WORKERS, max_pending=POOL_MAX_PENDING, initializer=warmup_worker):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.warm_workers = 0
+        # Why the last executor broke, until a new one has run a task; see _discard_executor
+        self.broken_error = None
+
+    @property
+    def pending(self):
+        """Number of tasks currently running or queued."""
+        return self._pending
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs a gevent hub is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                )
+            return self._executor
+
+    def _discard_executor(self, executor, error):
+        """
+        Forget an executor whose worker died (a native crash, the OOM killer)
+        or whose initializer failed. A broken ProcessPoolExecutor fails every
+        later task, so the next submit starts a fresh one.
+        """
+        with self._executor_lock:
+            if self._executor is not executor:
+                return  # Already replaced by another caller
+            self._executor = None
+            self.warm_workers = 0
+            self.broken_error = f"{type(error).__name__}: {error}"
+        logger.error("Worker pool broke (%s), new workers start on next use", error)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self, timeout=POOL_START_TIMEOUT):
+        """
+        Start every worker process and wait until each has been warmed up, so
+        the first requests pay neither process start nor model loading.
+        Waits cooperatively under gevent.
+
+        Returns:
+            int: number of workers that reported ready within timeout
+        """
+        executor = self._get_executor()
+        ready = set()
+        deadline = time.time() + timeout
+        # Submitting max_workers probes at once makes the executor spawn every worker;
+        # repeat until each has answered, since the first warm one may take all of a round
+        while len(ready) < self.max_workers and time.time() < deadline:
+            probes = [executor.submit(report_ready) for _ in range(self.max_workers)]
+            try:
+                for probe in probes:
+                    ready.add(wait_for(probe, timeout=max(0.0, deadline - time.time())))
+            except FutureTimeoutError:
+                for probe in probes:
+                    probe.cancel()
+                break
+            except BrokenProcessPool as e:
+                self._discard_executor(executor, e)
+                raise
+        self.warm_workers = len(ready)
+        if ready and self._executor is executor:
+            self.broken_error = None
+        if len(ready) < self.max_workers:
+            logger.warning("Only %d of %d pool workers were ready after %ss", len(ready), self.max_workers, timeout)
+        return len(ready)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit fn to a worker and return a Future of its result, or raise
+        PoolBusyError. Timing spans recorded by fn in the worker are recorded
+        in this process when the task finishes.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolBusyError(f"Worker pool is at capacity ({self.max_pending} tasks in flight)")
+            self._pending += 1
+        submitted_at = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            try:
+                task = executor.submit(run_collecting_spans, fn, args, kwargs)
+            except BrokenProcessPool as e:
+                self._discard_executor(executor, e)
+                executor = self._get_executor()
+                task = executor.submit(run_collecting_spans, fn, args, kwargs)
+        except Exception:
+            self._release()
+            raise
+        task.add_done_callback(lambda _task: self._release())
+
+        future = Future()
+
+        def deliver(task):
+            record_span('pool_roundtrip', time.perf_counter() - submitted_at)
+            if task.cancelled():
+                future.cancel()
+                future.set_running_or_notify_cancel()
+            elif task.exception() is not None:
+                if isinstance(task.exception(), BrokenProcessPool):
+                    self._discard_executor(executor, task.exception())
+                future.set_exception(task.exception())
+            else:
+                if self.broken_error is not None and self._executor is executor:
+                    self.broken_error = None
+                    logger.info("Worker pool recovered")
+                result, spans = task.result()
+                record_spans(spans)
+                future.set_result(result)
+
+        task.add_done_callback(deliver)
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn in a worker and return its result without blocking the event loop."""
+        return wait_for(self.submit(fn, *args, **kwargs))
+
+    def imap_unordered(self, fn, arg_tuples, max_in_flight=None):
+        """
+        Run fn(*args) for each tuple in arg_tuples and yield (args, Future)
+        pairs as they complete. At most max_in_flight of them are in the pool
+        at once, so a large batch cannot crowd out interactive requests.
+        """
+        max_in_flight = max_in_flight or self.max_workers
+        arg_iter = iter(arg_tuples)
+        next_args = None
+        notifier = _CompletionNotifier()
+        args_of = {}
+        in_flight = 0
+        try:
+            while True:
+                while in_flight < max_in_flight:
+                    if next_args is None:
+                        next_args = next(arg_iter, None)
+                        if next_args is None:
+                            break
+                    try:
+                        future = self.submit(fn, *next_args)
+                    except PoolBusyError:
+                        break
+                    args_of[future] = next_args
+                    next_args = None
+                    in_flight += 1
+                    future.add_done_callback(notifier.notify)
+
+                if not in_flight:
+                    if next_args is None:
+                        return
+                    notifier.sleep(0.05)  # The pool is full of other requests' work
+                    continue
+
+                notifier.wait()
+                while notifier.completed:
+                    in_flight -= 1
+                    future = notifier.completed.popleft()
+                    yield args_of.pop(future), future
+        finally:
+            notifier.close()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self, wait=True):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class _CompletionNotifier:
+    """Collects Futures finished on the executor's thread and wakes the waiting greenlet or thread."""
+
+    def __init__(self):
+        self.completed = collections.deque()
+        self._waiter = None
+        if gevent is not None:
+            self._watcher = gevent.get_hub().loop.async_()
+            self._watcher.start(self._wake)
+        else:
+            self._event = threading.Event()
+
+    def notify(self, future):
+        self.completed.append(future)
+        if gevent is not None:
+            self._watcher.send()
+        else:
+            self._event.set()
+
+    def _wake(self):
+        if self._waiter is not None:
+            self._waiter.switch(None)
+
+    def wait(self):
+        """Return once at least one Future has completed."""
+        while not self.completed:
+            if gevent is not None:
+                self._waiter = Waiter()
+                try:
+                    self._waiter.get()
+                finally:
+                    self._waiter = None
+            else:
+                self._event.wait()
+                self._event.clear()
+
+    def sleep(self, seconds):
+        if gevent is not None:
+            gevent.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def close(self):
+        if gevent is not None:
+            self._watcher.stop()
+            self._watcher.close()
+
+
+def wait_for(future, timeout=None):
+    """
+    Wait for a concurrent.futures.Future, raising
+    concurrent.futures.TimeoutError after timeout seconds if given.
+
+    Under gevent only the calling greenlet is suspended: the pool's result
+    thread wakes the hub through a thread-safe async watcher.
+    """
+    if gevent is None or future.done():
+        return future.result(timeout)
+
+    hub = gevent.get_hub()
+    watcher = hub.loop.async_()
+    waiter = Waiter()
+    watcher.start(waiter.switch, None)
+    timer = None
+    if timeout is not None:
+        timer = hub.loop.timer(timeout)
+        timer.start(waiter.switch, None)
+    try:
+        future.add_done_callback(lambda _future: watcher.send())
+        waiter.get()
+    finally:
+        watcher.stop()
+        watcher.close()
+        if timer is not None:
+            timer.stop()
+            timer.close()
+    return future.result(0)
+
+
+pool = WorkerPool()
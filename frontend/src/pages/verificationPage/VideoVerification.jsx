@@ -12,6 +12,8 @@ const VideoVerification = () => {
   const videoRef = useRef(null);
   const socketRef = useRef(null);
   const streamRef = useRef(null);
+  // Frame rate, resolution and JPEG quality requested by the server via 'liveness_rate'
+  const frameRateRef = useRef({ fps: 1, width: 640, height: 480, quality: 0.6 });
   
   const [status, setStatus] = useState('initializing'); // initializing, ready, centering, in_progress, completed, error
   const [instruction, setInstruction] = useState('Initializing...');
@@ -115,6 +117,8 @@ const VideoVerification = () => {
       }
       
       socketRef.current = io('http://localhost:5001', {
+        // Lets a load balancer keep every request of this session on the same server
+        query: { verification_id: verificationId },
         transports: ['websocket', 'polling'],
         reconnection: true,
         reconnectionAttempts: 10,
@@ -135,7 +139,7 @@ const VideoVerification = () => {
         console.log("Socket connected successfully. SID:", socketRef.current.id, "for VerID:", verificationId);
         setInstruction('Connected. Starting verification...');
         console.log("Emitting start_liveness_check with verification_id:", verificationId);
-        socketRef.current.emit('start_liveness_check', { verification_id: verificationId });
+        socketRef.current.emit('start_liveness_check', { verification_id: verificationId, adaptive_rate: true });
       });
       
       socketRef.current.on('connection_response', (data) => {
@@ -153,6 +157,11 @@ const VideoVerification = () => {
         }
       });
 
+      socketRef.current.on('liveness_rate', (data) => {
+        console.log("Received liveness_rate:", data, "for VerID:", verificationId);
+        frameRateRef.current = { ...frameRateRef.current, ...data };
+      });
+
       socketRef.current.on('liveness_feedback', (data) => {
         console.log("Received liveness_feedback:", data.message, "for VerID:", verificationId);
         setFeedbackMessage(data.message);
@@ -272,8 +281,21 @@ const VideoVerification = () => {
     
     console.log(`Status is ${status}. Starting to send frames for verification ID:`, verificationId);
     
-    const frameInterval = 500;
     let frameCount = 0;
+    let timeoutId = null;
+    // Reused for every frame instead of allocating a new canvas each tick
+    const canvas = document.createElement('canvas');
+    
+    const emitFrame = (frame) => {
+      if (!socketRef.current || !socketRef.current.connected) {
+        return;
+      }
+      console.log(`Sending frame ${++frameCount} for verification ID: ${verificationId}`);
+      socketRef.current.emit('liveness_frame', {
+        verification_id: verificationId,
+        frame
+      });
+    };
     
     const sendFrame = () => {
       if (!videoRef.current || !socketRef.current || !socketRef.current.connected) {
@@ -287,29 +309,42 @@ const VideoVerification = () => {
       }
       
       try {
-        const canvas = document.createElement('canvas');
-        canvas.width = videoRef.current.videoWidth;
-        canvas.height = videoRef.current.videoHeight;
+        const rate = frameRateRef.current;
+        const video = videoRef.current;
+        const scale = Math.min(1, rate.width / video.videoWidth, rate.height / video.videoHeight);
+        canvas.width = Math.round(video.videoWidth * scale);
+        canvas.height = Math.round(video.videoHeight * scale);
         const ctx = canvas.getContext('2d');
         ctx.drawImage(videoRef.current, 0, 0, canvas.width, canvas.height);
-        const frameDataUrl = canvas.toDataURL('image/jpeg', 0.6);
         
-        console.log(`Sending frame ${++frameCount} for verification ID: ${verificationId}`);
-        socketRef.current.emit('liveness_frame', {
-          verification_id: verificationId,
-          frame: frameDataUrl
-        });
+        if (canvas.toBlob) {
+          // Send the JPEG as a binary Socket.IO attachment (no base64 overhead)
+          canvas.toBlob((blob) => {
+            if (!blob) {
+              return;
+            }
+            blob.arrayBuffer()
+              .then(emitFrame)
+              .catch(err => console.error("Error reading frame blob for VerID:", verificationId, err));
+          }, 'image/jpeg', rate.quality);
+        } else {
+          emitFrame(canvas.toDataURL('image/jpeg', rate.quality));
+        }
       } catch (err) {
         console.error("Error sending frame for VerID:", verificationId, err);
       }
     };
     
-    const intervalId = setInterval(sendFrame, frameInterval);
-    sendFrame(); // Send first frame immediately
+    // Re-read the server-requested rate before scheduling each frame
+    const scheduleFrame = () => {
+      sendFrame();
+      timeoutId = setTimeout(scheduleFrame, 1000 / frameRateRef.current.fps);
+    };
+    scheduleFrame(); // Send first frame immediately
     
     return () => {
-        console.log("Cleaning up frame sending interval for VerID:", verificationId);
-        clearInterval(intervalId);
+        console.log("Cleaning up frame sending timer for VerID:", verificationId);
+        clearTimeout(timeoutId);
     };
   }, [status, verificationId]); // Depends on status to start/stop sending, and verificationId for the data
   